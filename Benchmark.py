@@ -0,0 +1,114 @@
+"""
+Script to benchmark the three servers: generates a synthetic data file, starts the servers
+locally, sends them queries and reports throughput, latency, memory and startup time. With
+--hotpath it measures instead the CPU time and memory allocated by each request of the
+Instagram and WhatsApp servers, run in this process.
+Usage: python Benchmark.py --help
+"""
+import argparse
+import datetime
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmark import report
+from benchmark.cluster import Cluster, ROOT
+from benchmark.dataset import generate_dataset
+from benchmark.hotpath import SERVERS, run_hotpath
+from benchmark.load import QueryMix, run_closed_loop, run_open_loop
+from model.config import Config
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test the HTTP, Instagram and WhatsApp servers.")
+    parser.add_argument("--people", type=int, default=10000, help="people in the synthetic data file")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the data file and the queries")
+    parser.add_argument("--data", help="use this data file instead of generating one (made with the same --people and --seed)")
+    parser.add_argument("--mix", default="instagram=0.4,whatsapp=0.3,all=0.2,unknown=0.1",
+                        help="relative weight of each kind of query")
+    parser.add_argument("--hit-ratio", type=float, default=0.9, help="fraction of queries for people in the data file")
+    parser.add_argument("--concurrency", type=int, default=16, help="clients (closed loop) or maximum requests in flight (open loop)")
+    parser.add_argument("--rate", type=float, help="requests per second; runs an open loop load instead of a closed loop one")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of measured load")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds of load before measuring")
+    parser.add_argument("--base-port", type=int, default=18080, help="port of the http server, the others use the next ones")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="setting of the servers, e.g. --env SERVER_MODE=selectors (repeatable)")
+    parser.add_argument("--server-log", help="file where the output of the servers is written")
+    parser.add_argument("--output", help="JSON file of the results (default: benchmark/results/<version>-<time>.json)")
+    parser.add_argument("--compare", help="JSON file of a previous run to compare with")
+    parser.add_argument("--hotpath", action="store_true",
+                        help="measure the CPU time and memory allocated per request instead of load testing the servers")
+    parser.add_argument("--requests", type=int, default=100000, help="requests measured by --hotpath")
+    return parser.parse_args()
+
+
+def git_version():
+    """
+    Function to get the commit of the project, to tell apart the results of each version.
+    :return: The short commit hash, or unknown.
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_load(args, mix, port, duration):
+    if args.rate:
+        return run_open_loop("127.0.0.1", port, mix, args.rate, duration, args.concurrency, args.seed)
+    return run_closed_loop("127.0.0.1", port, mix, args.concurrency, duration, args.seed)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    env = dict(setting.split("=", 1) for setting in args.env)
+    mix = QueryMix(QueryMix.parse(args.mix), args.hit_ratio, args.people, args.seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        data_path = args.data
+        if data_path is None:
+            data_path = pathlib.Path(directory) / "data.csv"
+            start = time.perf_counter()
+            rows = generate_dataset(data_path, args.people, args.seed)
+            print(f"Generated {rows} rows in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+        if args.hotpath:
+            settings = {name.lower(): Config.cast(value, Config.defaults.get(name.lower())) for name, value in env.items()}
+            hotpath = {social_network: run_hotpath(data_path, args.people, args.requests, hit_ratio=args.hit_ratio,
+                                                   social_network=social_network, seed=args.seed, settings=settings)
+                       for social_network in SERVERS}
+        else:
+            log = open(args.server_log, "w") if args.server_log else None
+            with Cluster(data_path, base_port=args.base_port, env=env, log=log) as cluster:
+                memory_before = cluster.memory()
+                if args.warmup:
+                    run_load(args, mix, cluster.ports["http"], args.warmup)
+                result = run_load(args, mix, cluster.ports["http"], args.duration)
+                memory_after = cluster.memory()
+                startup = cluster.startup
+            if log is not None:
+                log.close()
+
+    timestamp = datetime.datetime.now().isoformat(timespec="seconds")
+    version = git_version()
+    results = {
+        "version": version,
+        "timestamp": timestamp,
+        "settings": {**vars(args), "env": env},
+    }
+    if args.hotpath:
+        results["hotpath"] = hotpath
+    else:
+        results["startup_s"] = startup
+        results["memory_bytes"] = {"before": memory_before, "after": memory_after}
+        results["load"] = report.summarize(result)
+    output = args.output or ROOT / "benchmark" / "results" / f"{version}-{timestamp.replace(':', '')}.json"
+    report.save(results, output)
+    print("\n".join(report.format_summary(results)))
+    if args.compare:
+        print("\n".join(report.compare(report.load(args.compare), results)))
+    print(f"Results written to {output}")
@@ -0,0 +1,26 @@
+"""
+Script to compile the CSV data file into an index file that the servers can map in memory.
+Usage: python CompileIndex.py [csv path] [index path]
+By default it compiles DATA_PATH into a file with the same name and the .idx extension.
+"""
+import dotenv
+import os
+import pathlib
+import sys
+import time
+import model.logger
+from model.parser import CSVParser
+from model.store import CompactStore
+
+if __name__ == "__main__":
+    dotenv.load_dotenv()
+    logger = model.logger.logger
+
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else os.getenv("DATA_PATH")
+    index_path = sys.argv[2] if len(sys.argv) > 2 else str(pathlib.Path(csv_path).with_suffix(".idx"))
+
+    start = time.perf_counter()
+    store = CompactStore.from_rows(CSVParser(csv_path, stream=True).iter_rows())
+    store.write(index_path)
+    rows = sum(len(table) for table in store.values())
+    logger.logger.info("Compiled %s into %s (%s entries) in %.2fs", csv_path, index_path, rows, time.perf_counter() - start)
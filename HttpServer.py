@@ -1,7 +1,9 @@
 import dotenv
 import os
+import model.config
 import model.logger
 import model.server
+from model.sharding import HashRing
 
 if __name__ == "__main__":
     dotenv.load_dotenv()
@@ -10,9 +12,15 @@ if __name__ == "__main__":
     http_port = int(os.getenv("HTTP_PORT"))
     http_host = os.getenv("HTTP_HOST")
     data_path = os.getenv("DATA_PATH")
+    config = model.config.Config.from_env()
+    logger.configure(config)
 
-    http_server = model.server.HttpServer(http_host, http_port, "HttpServer", data_path)
-    http_server.link_server("InstagramServer", os.getenv("INSTAGRAM_HOST"), int(os.getenv("INSTAGRAM_PORT")))
-    http_server.link_server("WhatsAppServer", os.getenv("WHATSAPP_HOST"), int(os.getenv("WHATSAPP_PORT")))
-    logger.logger.info(f"Starting HTTP server on {http_host}:{http_port}")
+    http_server = model.server.HttpServer(http_host, http_port, "HttpServer", data_path, config)
+    # Link every replica of every shard of each social network, or its single server if it is not sharded
+    for name, prefix in (("InstagramServer", "INSTAGRAM"), ("WhatsAppServer", "WHATSAPP")):
+        shards = HashRing.parse(os.getenv(f"{prefix}_SHARDS", ""))
+        for replicas in shards or [[(os.getenv(f"{prefix}_HOST"), int(os.getenv(f"{prefix}_PORT")))]]:
+            for host, port in replicas:
+                http_server.link_server(name, host, port, HashRing.node_name(*replicas[0]))
+    logger.logger.info("Starting HTTP server on %s:%s", http_host, http_port)
     http_server.start()
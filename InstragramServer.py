@@ -1,7 +1,9 @@
 import dotenv
 import os
+import model.config
 import model.server
 import model.logger
+from model.sharding import HashRing
 
 if __name__ == "__main__":
     dotenv.load_dotenv()
@@ -10,7 +12,10 @@ if __name__ == "__main__":
     instagram_port = int(os.getenv("INSTAGRAM_PORT"))
     instagram_host = os.getenv("INSTAGRAM_HOST")
     data_path = os.getenv("DATA_PATH")
+    config = model.config.Config.from_env()
+    logger.configure(config)
 
-    instagram_server = model.server.InstagramServer(instagram_host, instagram_port, data_path)
-    logger.logger.info(f"Starting Instagram server on {instagram_host}:{instagram_port}")
+    shards = HashRing.parse(os.getenv("INSTAGRAM_SHARDS", ""))
+    instagram_server = model.server.InstagramServer(instagram_host, instagram_port, data_path, config, shards)
+    logger.logger.info("Starting Instagram server on %s:%s", instagram_host, instagram_port)
     instagram_server.start()
\ No newline at end of file
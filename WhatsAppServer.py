@@ -1,7 +1,9 @@
 import dotenv
 import os
+import model.config
 import model.logger
 import model.server
+from model.sharding import HashRing
 
 if __name__ == "__main__":
     dotenv.load_dotenv()
@@ -10,7 +12,10 @@ if __name__ == "__main__":
     whatsapp_port = int(os.getenv("WHATSAPP_PORT"))
     whatsapp_host = os.getenv("WHATSAPP_HOST")
     data_path = os.getenv("DATA_PATH")
+    config = model.config.Config.from_env()
+    logger.configure(config)
 
-    whatsapp_server = model.server.WhatsAppServer(whatsapp_host, whatsapp_port, data_path)
-    logger.logger.info(f"Starting WhatsApp server on {whatsapp_host}:{whatsapp_port}")
+    shards = HashRing.parse(os.getenv("WHATSAPP_SHARDS", ""))
+    whatsapp_server = model.server.WhatsAppServer(whatsapp_host, whatsapp_port, data_path, config, shards)
+    logger.logger.info("Starting WhatsApp server on %s:%s", whatsapp_host, whatsapp_port)
     whatsapp_server.start()
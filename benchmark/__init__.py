@@ -0,0 +1,4 @@
+"""
+Benchmark package with the tools to load test the three servers: synthetic data files,
+a local cluster of the servers, load generators and the reports of the results.
+"""
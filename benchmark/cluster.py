@@ -0,0 +1,126 @@
+"""
+Cluster module that starts the three servers locally, as separate processes, with the
+entry scripts of the project.
+"""
+import os
+import pathlib
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+SCRIPTS = {
+    "instagram": "InstragramServer.py",
+    "whatsapp": "WhatsAppServer.py",
+    "http": "HttpServer.py",
+}
+
+
+def wait_for_server(host, port, timeout):
+    """
+    Function to wait until a server answers GET /.
+    :param host: the host of the server.
+    :param port: the port of the server.
+    :param timeout: maximum seconds to wait.
+    :return: True if the server answered before the timeout.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1) as s:
+                s.sendall(f"GET / HTTP/1.1\r\nHost: {host}:{port}\r\nConnection: close\r\n\r\n".encode())
+                if s.recv(1024):
+                    return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+def rss(pid):
+    """
+    Function to get the resident memory of a process and its children, read from /proc.
+    :param pid: the id of the process.
+    :return: The resident memory in bytes, None if it is not available.
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            memory = next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmRSS:"))
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except (OSError, StopIteration):
+        return None
+    return memory + sum(rss(child) or 0 for child in children)
+
+
+class Cluster:
+    """
+    Cluster class that runs the instagram, whatsapp and http servers on consecutive ports.
+
+    Attributes:
+        data_path (str): The path of the data file of the servers.
+        host (str): The host of the servers.
+        ports (dict): The port of each server.
+        env (dict): Extra environment variables of the servers, e.g. SERVER_MODE.
+        log (file): Where the output of the servers is written.
+        processes (dict): The process of each running server.
+        startup (dict): Seconds each server took to answer its first request.
+    """
+
+    def __init__(self, data_path, host="127.0.0.1", base_port=18080, env=None, log=None):
+        self.data_path = data_path
+        self.host = host
+        self.ports = {"http": base_port, "instagram": base_port + 1, "whatsapp": base_port + 2}
+        self.env = env or {}
+        self.log = log
+        self.processes = {}
+        self.startup = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self, timeout=60.0):
+        """
+        Method to start the servers and wait until each one answers.
+        :param timeout: maximum seconds to wait for each server.
+        """
+        env = dict(os.environ, **self.env, DATA_PATH=str(self.data_path), HTTP_HOST=self.host,
+                   HTTP_PORT=str(self.ports["http"]), INSTAGRAM_HOST=self.host,
+                   INSTAGRAM_PORT=str(self.ports["instagram"]), WHATSAPP_HOST=self.host,
+                   WHATSAPP_PORT=str(self.ports["whatsapp"]))
+        output = self.log if self.log is not None else subprocess.DEVNULL
+        for name, script in SCRIPTS.items():
+            start = time.monotonic()
+            self.processes[name] = subprocess.Popen([sys.executable, script], cwd=ROOT, env=env,
+                                                    stdout=output, stderr=output)
+            if not wait_for_server(self.host, self.ports[name], timeout):
+                self.stop()
+                raise RuntimeError(f"The {name} server did not start in {timeout}s.")
+            self.startup[name] = time.monotonic() - start
+
+    def memory(self):
+        """
+        Method to get the resident memory of each server.
+        :return: dict with the resident memory in bytes of each server.
+        """
+        return {name: rss(process.pid) for name, process in self.processes.items()}
+
+    def stop(self, timeout=15.0):
+        """
+        Method to stop the servers, killing the ones that do not exit in time.
+        :param timeout: seconds to wait for each server to exit.
+        """
+        for process in self.processes.values():
+            process.send_signal(signal.SIGTERM)
+        for process in self.processes.values():
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        self.processes.clear()
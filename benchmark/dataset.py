@@ -0,0 +1,55 @@
+"""
+Dataset module that generates synthetic data files with the format of data/data.csv.
+"""
+import random
+import string
+
+FIRST_NAMES = ["Pedro", "Pablo", "Maria", "Jose", "Ana", "Juan", "Camila", "Diego", "Sofia", "Matias",
+               "Valentina", "Tomas", "Isidora", "Benjamin", "Catalina", "Vicente", "Antonia", "Martin"]
+LAST_NAMES = ["Perez", "Pereira", "Gonzalez", "Munoz", "Rojas", "Diaz", "Soto", "Contreras", "Silva",
+              "Martinez", "Sepulveda", "Morales", "Rodriguez", "Lopez", "Fuentes", "Hernandez", "Torres"]
+
+
+def letters(number):
+    """
+    Function to encode a number with lowercase letters, used to make the names unique.
+    :param number: the number to encode.
+    :return: The letters.
+    """
+    encoded = ""
+    while True:
+        number, digit = divmod(number, 26)
+        encoded = string.ascii_lowercase[digit] + encoded
+        if number == 0:
+            return encoded
+
+
+def person(index, seed=0):
+    """
+    Function to get the synthetic person of an index. The same index and seed always give
+    the same person, so the queries can be built without keeping the dataset in memory.
+    :param index: the index of the person.
+    :param seed: the seed of the dataset.
+    :return: tuple with the list of names and the list of the two last names.
+    """
+    rng = random.Random(f"{seed}-{index}")
+    names = rng.sample(FIRST_NAMES, rng.randint(1, 2))
+    last_names = [rng.choice(LAST_NAMES), rng.choice(LAST_NAMES) + letters(index)]
+    return names, last_names
+
+
+def generate_dataset(path, people, seed=0):
+    """
+    Function to write a data file with an instagram and a whatsapp row for each person.
+    :param path: the path of the data file.
+    :param people: the number of people.
+    :param seed: the seed of the dataset.
+    :return: The number of rows written.
+    """
+    with open(path, "w") as f:
+        for index in range(people):
+            names, last_names = person(index, seed)
+            full_names, full_last_names = " ".join(names), " ".join(last_names)
+            f.write(f"{full_names},{full_last_names},instagram,@{names[0].lower()}{letters(index)}\n")
+            f.write(f"{full_names},{full_last_names},whatsapp,+569{index:08d}\n")
+    return people * 2
@@ -0,0 +1,122 @@
+"""
+Hot path module of the benchmark, which measures the CPU time and the memory allocated by
+each request in the request path of a social network server. The server runs in this
+process and reads the requests from memory instead of a socket, so the measurements only
+have the cost of the code of the server, without the network or the load generator.
+"""
+import random
+import time
+import tracemalloc
+
+from benchmark.dataset import person
+from model.config import Config
+from model.http import HttpConnection
+from model.logger import logger
+from model.server import InstagramServer, WhatsAppServer
+
+SERVERS = {"instagram": InstagramServer, "whatsapp": WhatsAppServer}
+
+
+class MemorySocket:
+    """
+    MemorySocket class with the methods of a socket used by a connection: it reads the
+    requests from a buffer and discards the responses.
+
+    Attributes:
+        data (memoryview): The bytes of the requests not read yet.
+        bytes_sent (int): The bytes of the responses.
+    """
+
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.bytes_sent = 0
+
+    def recv(self, size):
+        chunk = bytes(self.data[:size])
+        self.data = self.data[len(chunk):]
+        return chunk
+
+    def sendall(self, data):
+        self.bytes_sent += len(data)
+
+    def settimeout(self, timeout):
+        pass
+
+    def close(self):
+        pass
+
+
+def build_requests(social_network, people, distinct, hit_ratio, seed=0):
+    """
+    Function to build the requests of the hot path: queries for distinct people, repeated,
+    so after the first pass most of them are answered from the cache as in a real load.
+    :param social_network: the social network of the queries.
+    :param people: the number of people in the data file.
+    :param distinct: the number of distinct people queried.
+    :param hit_ratio: the fraction of the people queried that are in the data file.
+    :param seed: the seed of the data file.
+    :return: list of requests, as bytes.
+    """
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(distinct):
+        index = rng.randrange(people) if rng.random() < hit_ratio else people + rng.randrange(people)
+        names, last_names = person(index, seed)
+        requests.append(f"GET /{social_network}/{'/'.join(names)}/{'/'.join(last_names)} HTTP/1.1\r\n"
+                        f"Host: localhost\r\n\r\n".encode())
+    return requests
+
+
+def run_hotpath(data_path, people, requests=100000, distinct=1000, hit_ratio=0.9, social_network="instagram",
+                seed=0, settings=None):
+    """
+    Function to measure the hot path of a social network server. The requests are sent
+    once to fill the cache, then again to measure the CPU time, and then again with
+    tracemalloc to measure the peak of the memory allocated while each request is handled.
+    :param data_path: the path to the data file.
+    :param people: the number of people in the data file.
+    :param requests: the number of requests measured.
+    :param distinct: the number of distinct people queried.
+    :param hit_ratio: the fraction of the people queried that are in the data file.
+    :param social_network: the server measured: instagram or whatsapp.
+    :param seed: the seed of the data file.
+    :param settings: extra settings of the server (see model.config).
+    :return: dict with the requests, the statuses and the CPU time and memory per request.
+    """
+    config = Config(**{"log_level": "WARNING", "log_async": False, **(settings or {})})
+    logger.configure(config)
+    server = SERVERS[social_network]("127.0.0.1", 0, data_path, config)
+    server.index.get_data()
+    paths = build_requests(social_network, people, distinct, hit_ratio, seed)
+    payload = b"".join(paths[i % len(paths)] for i in range(requests))
+    statuses = {}
+
+    def serve():
+        conn = HttpConnection(MemorySocket(payload))
+        for _ in range(requests):
+            server.handle_connection(conn, ("127.0.0.1", 0))
+            statuses[conn.status] = statuses.get(conn.status, 0) + 1
+
+    serve()
+    statuses.clear()
+    start = time.thread_time()
+    serve()
+    cpu = time.thread_time() - start
+
+    conn = HttpConnection(MemorySocket(payload))
+    allocated = 0
+    tracemalloc.start()
+    for _ in range(requests):
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        server.handle_connection(conn, ("127.0.0.1", 0))
+        allocated += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    return {
+        "server": social_network,
+        "requests": requests,
+        "distinct": distinct,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "cpu_us": cpu / requests * 1e6,
+        "allocated_bytes": allocated / requests,
+    }
@@ -0,0 +1,220 @@
+"""
+Load module with the load generators of the benchmark. The closed loop generator keeps a
+fixed number of clients sending requests one after the other; the open loop generator
+sends requests at a fixed rate, and measures each latency from the time the request was
+due, so a slow server is not hidden by clients waiting for it.
+"""
+import random
+import socket
+import threading
+import time
+from collections import Counter
+
+from benchmark.dataset import person
+from model.http import HttpConnection
+
+
+class QueryMix:
+    """
+    QueryMix class that builds the paths of the queries sent by the benchmark.
+
+    Attributes:
+        weights (dict): The relative weight of each kind of query: instagram, whatsapp, all and unknown
+            (a social network the servers do not know).
+        hit_ratio (float): The fraction of queries for people that are in the data file.
+        people (int): The number of people in the data file.
+        seed (int): The seed of the data file.
+    """
+
+    def __init__(self, weights, hit_ratio, people, seed=0):
+        self.weights = weights
+        self.hit_ratio = hit_ratio
+        self.people = people
+        self.seed = seed
+        self.kinds = list(weights)
+        self.cumulative_weights = []
+        total = 0
+        for kind in self.kinds:
+            total += weights[kind]
+            self.cumulative_weights.append(total)
+
+    @staticmethod
+    def parse(mix):
+        """
+        Method to parse the weights of a mix written as "instagram=0.4,whatsapp=0.3,...".
+        :param mix: the mix as a string.
+        :return: dict with the weight of each kind of query.
+        """
+        weights = {}
+        for part in mix.split(","):
+            kind, _, weight = part.partition("=")
+            weights[kind.strip()] = float(weight)
+        return weights
+
+    def next_path(self, rng):
+        """
+        Method to build the path of a random query.
+        :param rng: the random generator of the client.
+        :return: The path.
+        """
+        kind = rng.choices(self.kinds, cum_weights=self.cumulative_weights)[0]
+        network = "myspace" if kind == "unknown" else kind
+        if rng.random() < self.hit_ratio:
+            index = rng.randrange(self.people)
+        else:
+            index = self.people + rng.randrange(self.people)
+        names, last_names = person(index, self.seed)
+        return f"/{network}/{'/'.join(names)}/{'/'.join(last_names)}"
+
+
+class LoadResult:
+    """
+    LoadResult class with the measurements of a load run.
+
+    Attributes:
+        latencies (list): The latency in seconds of each answered request.
+        statuses (Counter): The number of responses of each status code.
+        errors (int): The number of requests that failed without a response.
+        elapsed (float): The duration of the run in seconds.
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = 0
+        self.elapsed = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, latencies, statuses, errors):
+        with self.lock:
+            self.latencies += latencies
+            self.statuses += statuses
+            self.errors += errors
+
+
+class Client:
+    """
+    Client class with a keep-alive connection to a server, reopened when it fails.
+
+    Attributes:
+        host (str): The host of the server.
+        port (int): The port of the server.
+        conn (HttpConnection): The open connection, None if it has to be opened.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.conn = None
+
+    def get(self, path):
+        """
+        Method to send a GET request and read its response.
+        :param path: the path of the request.
+        :return: The status code of the response.
+        """
+        if self.conn is None:
+            self.conn = HttpConnection(socket.create_connection((self.host, self.port), timeout=30))
+        try:
+            self.conn.sendall(f"GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n\r\n".encode())
+            response = self.conn.read_response()
+        except Exception:
+            self.close()
+            raise
+        if not response.keep_alive:
+            self.close()
+        return response.status
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def run_clients(host, port, mix, concurrency, duration, next_due, seed):
+    """
+    Function to run the clients of a load run in threads and collect their measurements.
+    :param host: the host of the server.
+    :param port: the port of the server.
+    :param mix: the query mix.
+    :param concurrency: the number of clients.
+    :param duration: the duration of the run in seconds.
+    :param next_due: function that returns the time the next request is due, None to send
+        it right away.
+    :param seed: the seed of the random generators of the clients.
+    :return: The LoadResult.
+    """
+    result = LoadResult()
+    start = time.perf_counter()
+    end = start + duration
+
+    def client_loop(number):
+        rng = random.Random(f"{seed}-{number}")
+        client = Client(host, port)
+        latencies, statuses, errors = [], Counter(), 0
+        while True:
+            due = next_due()
+            if due is not None:
+                if due >= end:
+                    break
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            sent = time.perf_counter() if due is None else due
+            if sent >= end:
+                break
+            try:
+                statuses[client.get(mix.next_path(rng))] += 1
+                latencies.append(time.perf_counter() - sent)
+            except Exception:
+                errors += 1
+        client.close()
+        result.add(latencies, statuses, errors)
+
+    threads = [threading.Thread(target=client_loop, args=(number,)) for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def run_closed_loop(host, port, mix, concurrency, duration, seed=0):
+    """
+    Function to run a load with a fixed number of clients, each one sending its next request
+    as soon as it gets the response of the previous one.
+    :param host: the host of the server.
+    :param port: the port of the server.
+    :param mix: the query mix.
+    :param concurrency: the number of clients.
+    :param duration: the duration of the run in seconds.
+    :param seed: the seed of the random generators of the clients.
+    :return: The LoadResult.
+    """
+    return run_clients(host, port, mix, concurrency, duration, lambda: None, seed)
+
+
+def run_open_loop(host, port, mix, rate, duration, concurrency, seed=0):
+    """
+    Function to run a load with requests due at a fixed rate, whatever the server latency.
+    The requests are sent by up to concurrency clients; if they are all busy, the latency
+    of the late requests includes the time they waited.
+    :param host: the host of the server.
+    :param port: the port of the server.
+    :param mix: the query mix.
+    :param rate: the requests per second.
+    :param duration: the duration of the run in seconds.
+    :param concurrency: the maximum number of requests in flight.
+    :param seed: the seed of the random generators of the clients.
+    :return: The LoadResult.
+    """
+    start = time.perf_counter()
+    counter = iter(range(2 ** 62))
+    lock = threading.Lock()
+
+    def next_due():
+        with lock:
+            return start + next(counter) / rate
+
+    return run_clients(host, port, mix, concurrency, duration, next_due, seed)
@@ -0,0 +1,112 @@
+"""
+Report module that summarizes the measurements of the benchmark, stores them as JSON and
+compares them with the results of a previous run.
+"""
+import json
+import math
+import pathlib
+
+COMPARED_METRICS = ["throughput", "p50_ms", "p99_ms", "p999_ms", "errors"]
+HOTPATH_METRICS = ["cpu_us", "allocated_bytes"]
+
+
+def percentile(values, fraction):
+    """
+    Function to get a percentile of a list of values, with the nearest rank method.
+    :param values: the values, sorted.
+    :param fraction: the percentile as a fraction, e.g. 0.99.
+    :return: The percentile, 0 if there are no values.
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))]
+
+
+def summarize(result):
+    """
+    Function to summarize the measurements of a load run.
+    :param result: the LoadResult.
+    :return: dict with the requests, errors, statuses, throughput and latency percentiles.
+    """
+    latencies = sorted(result.latencies)
+    return {
+        "requests": len(latencies),
+        "errors": result.errors,
+        "statuses": {str(status): count for status, count in sorted(result.statuses.items())},
+        "elapsed_s": result.elapsed,
+        "throughput": len(latencies) / result.elapsed if result.elapsed else 0.0,
+        "mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "p999_ms": percentile(latencies, 0.999) * 1000,
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+    }
+
+
+def save(results, path):
+    """
+    Function to write the results of a benchmark as JSON.
+    :param results: the results.
+    :param path: the path of the JSON file.
+    """
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2))
+
+
+def load(path):
+    """
+    Function to read the results of a previous benchmark.
+    :param path: the path of the JSON file.
+    :return: The results.
+    """
+    return json.loads(pathlib.Path(path).read_text())
+
+
+def compare(previous, current):
+    """
+    Function to compare the load or hot path results of two benchmarks.
+    :param previous: the results of the previous benchmark.
+    :param current: the results of the current benchmark.
+    :return: list of lines with the value of each metric in both runs and the change.
+    """
+    lines = [f"Compared with {previous.get('version', 'unknown')} ({previous.get('timestamp', '')}):"]
+    if "hotpath" in current:
+        summaries = [(f"{server} ", HOTPATH_METRICS, previous.get("hotpath", {}).get(server, {}), summary)
+                     for server, summary in current["hotpath"].items()]
+    else:
+        summaries = [("", COMPARED_METRICS, previous.get("load", {}), current["load"])]
+    for prefix, metrics, before_summary, after_summary in summaries:
+        for metric in metrics:
+            before, after = before_summary.get(metric), after_summary.get(metric)
+            if before is None or after is None:
+                continue
+            change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+            lines.append(f"  {prefix + metric:>25}: {before:12.2f} -> {after:12.2f} ({change})")
+    return lines
+
+
+def format_summary(results):
+    """
+    Function to format the results of a benchmark for the terminal.
+    :param results: the results.
+    :return: list of lines.
+    """
+    if "hotpath" in results:
+        return [f"Hot path of {server}: {summary['requests']} requests, {summary['cpu_us']:.2f}us of CPU and "
+                f"{summary['allocated_bytes']:.0f} bytes allocated per request "
+                f"({', '.join(f'{status}: {count}' for status, count in summary['statuses'].items())})"
+                for server, summary in results["hotpath"].items()]
+    summary = results["load"]
+    lines = [
+        f"Requests: {summary['requests']} ({summary['errors']} errors) in {summary['elapsed_s']:.1f}s, "
+        f"{summary['throughput']:.0f} req/s",
+        f"Latency: p50 {summary['p50_ms']:.2f}ms, p99 {summary['p99_ms']:.2f}ms, "
+        f"p999 {summary['p999_ms']:.2f}ms, max {summary['max_ms']:.2f}ms",
+        f"Statuses: {', '.join(f'{status}: {count}' for status, count in summary['statuses'].items())}",
+        f"Startup: {', '.join(f'{name} {seconds:.2f}s' for name, seconds in results['startup_s'].items())}",
+    ]
+    memory = results["memory_bytes"]["after"]
+    if all(value is not None for value in memory.values()):
+        lines.append(f"Memory: {', '.join(f'{name} {value / 2 ** 20:.1f}MB' for name, value in memory.items())}")
+    return lines
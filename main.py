@@ -1,47 +1,96 @@
 """
-This is the main file of the project. It will check for the creation of the servers.
+This is the main file of the project. It starts every server from the settings of the .env
+file, in parallel, and supervises them: the servers that exit are started again, SIGHUP
+restarts them one at a time and SIGTERM or Ctrl+C stops them.
+Usage: python main.py
 """
 import dotenv
-import socket
 import os
+import pathlib
+import socket
+import sys
+import model.config
+import model.logger
+from model.sharding import HashRing
+from model.supervisor import Service, Supervisor
+
+SCRIPTS = {
+    "INSTAGRAM": ("Instagram", "InstragramServer.py"),
+    "WHATSAPP": ("WhatsApp", "WhatsAppServer.py"),
+}
+
 
-def wait_for_server(host, port, name):
+def services():
     """
-    Function to wait for the server to be created.
-    :param name: the name of the server.
-    :param host: the host of the server.
-    :param port: the port of the server.
+    Function to build the servers to run: one per replica of each shard of each social
+    network (or one per social network if it is not sharded) and the http server.
+    :return: list of services.
+    """
+    result = []
+    for prefix, (name, script) in SCRIPTS.items():
+        shards = HashRing.parse(os.getenv(f"{prefix}_SHARDS", ""))
+        if not shards:
+            result.append(Service(name, script))
+            continue
+        for replicas in shards:
+            for host, port in replicas:
+                result.append(Service(f"{name} {host}:{port}", script,
+                                      {f"{prefix}_HOST": host, f"{prefix}_PORT": str(port)}))
+    result.append(Service("Http", "HttpServer.py"))
+    return result
+
+
+def addresses():
     """
-    while True:
+    Function to get the addresses the servers listen on: the one of each replica of each shard
+    of each social network (or of each social network if it is not sharded) and the one of
+    the http server.
+    :return: list of (host, port) tuples.
+    """
+    result = []
+    for prefix in SCRIPTS:
+        shards = HashRing.parse(os.getenv(f"{prefix}_SHARDS", ""))
+        for replicas in shards or [[(os.getenv(f"{prefix}_HOST"), int(os.getenv(f"{prefix}_PORT")))]]:
+            result.extend(replicas)
+    result.append((os.getenv("HTTP_HOST"), int(os.getenv("HTTP_PORT"))))
+    return result
+
+
+def in_use(host, port):
+    """
+    Function to check if a port is already open, e.g. by the servers of another main.py. The
+    port is bound without SO_REUSEPORT, so it fails even if the other servers use it.
+    :param host: the host of the port.
+    :param port: the port.
+    :return: True if the port is in use.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((host, port))
-                request = f"GET / HTTP/1.1\r\nHost: {host}:{port}\r\n\r\n"
-                s.sendall(request.encode())
-
-                response = s.recv(1024)
-                if response:
-                    print(f"\r{name} server is up and running on {host}:{port}")
-                    break
-        except:
-            print(f"\rWaiting for {name} Server", end="")
+            s.bind((host, port))
+        except OSError:
+            return True
+    return False
+
 
 if "__main__" == __name__:
 
     # Load environment variables
     dotenv.load_dotenv()
+    config = model.config.Config.from_env()
+    model.logger.logger.configure(config)
 
-    # get the host and port of the servers
-    instagram_host = os.getenv("INSTAGRAM_HOST")
-    instagram_port = int(os.getenv("INSTAGRAM_PORT"))
-    whatsapp_host = os.getenv("WHATSAPP_HOST")
-    whatsapp_port = int(os.getenv("WHATSAPP_PORT"))
-    http_host = os.getenv("HTTP_HOST")
-    http_port = int(os.getenv("HTTP_PORT"))
+    # With SO_REUSEPORT the servers of a second main.py would silently share the ports
+    busy = [f"{host}:{port}" for host, port in addresses() if in_use(host, port)]
+    if busy:
+        print(f"Ports already in use, is another main.py running? {', '.join(busy)}", file=sys.stderr)
+        sys.exit(1)
 
-    # wait for the servers to be created
-    wait_for_server(instagram_host, instagram_port, "Instagram")
-    wait_for_server(whatsapp_host, whatsapp_port, "WhatsApp")
-    wait_for_server(http_host, http_port, "Http")
+    # Let the new process of a server bind its port while the old one drains, for rolling restarts
+    if hasattr(socket, "SO_REUSEPORT"):
+        os.environ.setdefault("SERVER_REUSE_PORT", "true")
 
-    print("All servers are up and running. Ready to accept requests.")
\ No newline at end of file
+    supervisor = Supervisor(services(), pathlib.Path(__file__).resolve().parent, config.server_start_timeout,
+                            config.server_drain_timeout)
+    print(f"Supervisor running (pid {os.getpid()}): kill -HUP {os.getpid()} restarts the servers one at a time.")
+    sys.exit(0 if supervisor.run() else 1)
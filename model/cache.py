@@ -0,0 +1,331 @@
+"""
+Cache module that provides the response cache shared by the servers.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+SHARED_MAGIC = b"CCSHC001"
+SHARED_HEADER = struct.Struct("=8sII")
+SHARED_HEADER_SIZE = 64
+SLOT = struct.Struct("=IxxxxQqqdHHB")
+SLOT_DATA = 48
+SEQUENCE = struct.Struct("=I")
+WAYS = 4
+
+
+class ResponseCache:
+    """
+    ResponseCache class that stores the responses of the queries with O(1) get and put.
+    When the cache is full the least recently used entry is evicted, and each entry
+    expires after its time to live. Negative entries (queries that were not found) use
+    their own, usually shorter, time to live. All the operations are thread-safe.
+
+    Attributes:
+        capacity (int): The maximum number of entries.
+        ttl (float): Seconds an entry is valid, 0 for no expiration.
+        negative_ttl (float): Seconds a negative entry is valid, 0 for no expiration.
+        hits (int): Number of lookups that found a valid entry.
+        misses (int): Number of lookups that did not find a valid entry.
+        evictions (int): Number of entries evicted because the cache was full.
+        expirations (int): Number of entries dropped because they expired.
+        shared (SharedCache): The cache shared with other processes, looked up when an entry is
+            not in this one, None if there is none.
+    """
+
+    def __init__(self, capacity=1024, ttl=0, negative_ttl=0, shared=None):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        Method to get the value cached for a key, marking it as recently used.
+        :param key: the key to look up.
+        :param default: the value to return when the key is not cached.
+        :return: The cached value or the default.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if not expires_at or expires_at >= time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+        if self.shared is not None:
+            found = self.shared.get(key)
+            if found is not None:
+                value, _, ttl = found
+                self.put_local(key, value, ttl)
+                return value
+        return default
+
+    def put(self, key, value, negative=False):
+        """
+        Method to cache the value of a key, evicting the least recently used entry if full.
+        :param key: the key to cache.
+        :param value: the value to cache.
+        :param negative: True if the value is a negative result (not found).
+        """
+        ttl = self.negative_ttl if negative else self.ttl
+        if self.shared is not None:
+            self.shared.put(key, value, negative, ttl)
+        self.put_local(key, value, ttl)
+
+    def put_local(self, key, value, ttl):
+        """
+        Method to cache the value of a key only in this cache.
+        :param key: the key to cache.
+        :param value: the value to cache.
+        :param ttl: seconds the value is valid, 0 for no expiration.
+        """
+        if self.capacity <= 0:
+            return
+        expires_at = time.monotonic() + ttl if ttl else 0
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            elif len(self._entries) >= self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._entries[key] = (expires_at, value)
+
+    def invalidate(self, key):
+        """
+        Method to drop the entry of a key.
+        :param key: the key to drop.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.shared is not None:
+            self.shared.invalidate(key)
+
+    def clear(self):
+        """
+        Method to drop every entry, e.g. when the data they were built from changes. The
+        entries of the shared cache are not dropped: they are tied to the version of the data.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Method to get the counters of the cache.
+        :return: dict with the size, hits, misses, evictions, expirations and hit rate.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class SharedCache:
+    """
+    SharedCache class that stores string values in a memory-mapped file, so every process
+    that opens the same file (the three servers and their worker processes) shares the
+    cached responses, and they survive restarts.
+
+    The file has a fixed number of fixed-size slots, grouped in sets of WAYS slots: a key
+    can only be stored in the set given by its hash, and when the set is full the entry
+    that expires first is replaced. Each slot is written under a per-slot sequence lock:
+    the writer makes the sequence odd, writes the slot and makes it even again, so a
+    reader that sees an odd or changed sequence retries instead of using a half-written
+    slot. Writers exclude each other with a thread lock and a lock on the byte range of the set.
+
+    Every entry is tagged with the version of the data it was built from; entries of
+    another version are misses and are replaced first, so reloading the data invalidates
+    the whole cache at once.
+
+    Attributes:
+        path (str): The path of the cache file.
+        slots (int): The number of slots, a multiple of WAYS.
+        slot_size (int): The size in bytes of each slot, the key and the value must fit in it.
+        version (tuple): The version of the data, None until it is set.
+        hits (int): Number of lookups of this process that found a valid entry.
+        misses (int): Number of lookups of this process that did not find a valid entry.
+    """
+
+    def __init__(self, path, slots=65536, slot_size=256):
+        self.path = path
+        self.slots = max(WAYS, slots - slots % WAYS)
+        self.slot_size = slot_size
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = SHARED_HEADER_SIZE + self.slots * slot_size
+        fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(self.fd, SHARED_HEADER.size, 0)
+            if header != SHARED_HEADER.pack(SHARED_MAGIC, self.slots, slot_size) or os.fstat(self.fd).st_size != size:
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, size)
+                os.pwrite(self.fd, SHARED_HEADER.pack(SHARED_MAGIC, self.slots, slot_size), 0)
+            self.map = mmap.mmap(self.fd, size)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+    def set_version(self, version):
+        """
+        Method to set the version of the data the cached values are built from.
+        :param version: the version, e.g. the modification time and size of the data file.
+        """
+        self.version = version
+
+    @staticmethod
+    def encode_key(key):
+        """
+        Method to encode a key, a tuple of strings, and get its hash.
+        :param key: the key.
+        :return: tuple with the encoded key and its 64 bits hash.
+        """
+        encoded = repr(key).encode()
+        return encoded, int.from_bytes(hashlib.blake2b(encoded, digest_size=8).digest(), "little")
+
+    def offsets(self, key_hash):
+        """
+        Method to get the offsets of the slots of the set of a key.
+        :param key_hash: the hash of the key.
+        :return: range of the offsets.
+        """
+        start = SHARED_HEADER_SIZE + (key_hash % (self.slots // WAYS)) * WAYS * self.slot_size
+        return range(start, start + WAYS * self.slot_size, self.slot_size)
+
+    def read_slot(self, offset):
+        """
+        Method to read a slot with the sequence lock, retrying while it is being written.
+        :param offset: the offset of the slot.
+        :return: tuple with the fields and the data of the slot, None if it kept changing.
+        """
+        for _ in range(8):
+            fields = SLOT.unpack_from(self.map, offset)
+            if fields[0] & 1:
+                continue
+            data = self.map[offset + SLOT_DATA:offset + SLOT_DATA + fields[5] + fields[6]]
+            if SEQUENCE.unpack_from(self.map, offset)[0] == fields[0]:
+                return fields, data
+        return None
+
+    def get(self, key):
+        """
+        Method to get the value cached for a key.
+        :param key: the key to look up.
+        :return: tuple with the value, True if it is negative and the seconds it is still
+            valid (0 if it does not expire), None if it is not cached.
+        """
+        if self.version is None:
+            return None
+        encoded, key_hash = self.encode_key(key)
+        for offset in self.offsets(key_hash):
+            slot = self.read_slot(offset)
+            if slot is None:
+                continue
+            (_, slot_hash, mtime, size, expires_at, key_size, _, negative), data = slot
+            if slot_hash != key_hash or (mtime, size) != self.version or data[:key_size] != encoded:
+                continue
+            ttl = expires_at - time.time() if expires_at else 0
+            if expires_at and ttl <= 0:
+                break
+            self.hits += 1
+            return data[key_size:].decode(), bool(negative), ttl
+        self.misses += 1
+        return None
+
+    def put(self, key, value, negative=False, ttl=0):
+        """
+        Method to cache the value of a key. Values that are not strings or do not fit in a
+        slot are not cached.
+        :param key: the key to cache.
+        :param value: the value to cache, a string.
+        :param negative: True if the value is a negative result (not found).
+        :param ttl: seconds the value is valid, 0 for no expiration.
+        """
+        if self.version is None or not isinstance(value, str):
+            return
+        encoded, key_hash = self.encode_key(key)
+        data = encoded + value.encode()
+        if SLOT_DATA + len(data) > self.slot_size or len(encoded) > 0xFFFF:
+            return
+        expires_at = time.time() + ttl if ttl else 0
+        offsets = self.offsets(key_hash)
+        with self.lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, WAYS * self.slot_size, offsets.start)
+            try:
+                offset = self.choose_slot(offsets, key_hash, encoded)
+                sequence = SEQUENCE.unpack_from(self.map, offset)[0]
+                SEQUENCE.pack_into(self.map, offset, sequence + 1)
+                self.map[offset + SLOT_DATA:offset + SLOT_DATA + len(data)] = data
+                SLOT.pack_into(self.map, offset, sequence + 1, key_hash, *self.version, expires_at, len(encoded),
+                               len(value.encode()), negative)
+                SEQUENCE.pack_into(self.map, offset, sequence + 2)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, WAYS * self.slot_size, offsets.start)
+
+    def choose_slot(self, offsets, key_hash, encoded):
+        """
+        Method to choose the slot of the set where a key is written: the slot of the key if
+        it is cached, else a free, stale or expired slot, else the one that expires first.
+        :param offsets: the offsets of the slots of the set.
+        :param key_hash: the hash of the key.
+        :param encoded: the encoded key.
+        :return: The offset of the slot.
+        """
+        now = time.time()
+        candidate, candidate_expires_at = None, None
+        for offset in offsets:
+            _, slot_hash, mtime, size, expires_at, key_size, _, _ = SLOT.unpack_from(self.map, offset)
+            if slot_hash == key_hash and self.map[offset + SLOT_DATA:offset + SLOT_DATA + key_size] == encoded:
+                return offset
+            if key_size == 0 or (mtime, size) != self.version or (expires_at and expires_at <= now):
+                candidate, candidate_expires_at = offset, -1
+            elif candidate_expires_at != -1:
+                effective = expires_at or float("inf")
+                if candidate is None or effective < candidate_expires_at:
+                    candidate, candidate_expires_at = offset, effective
+        return candidate
+
+    def invalidate(self, key):
+        """
+        Method to drop the entry of a key.
+        :param key: the key to drop.
+        """
+        encoded, key_hash = self.encode_key(key)
+        offsets = self.offsets(key_hash)
+        with self.lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, WAYS * self.slot_size, offsets.start)
+            try:
+                for offset in offsets:
+                    fields = SLOT.unpack_from(self.map, offset)
+                    if fields[1] == key_hash and self.map[offset + SLOT_DATA:offset + SLOT_DATA + fields[5]] == encoded:
+                        SEQUENCE.pack_into(self.map, offset, fields[0] + 1)
+                        SLOT.pack_into(self.map, offset, fields[0] + 1, *fields[1:4], 0, 0, 0, False)
+                        SEQUENCE.pack_into(self.map, offset, fields[0] + 2)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, WAYS * self.slot_size, offsets.start)
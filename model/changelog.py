@@ -0,0 +1,148 @@
+"""
+Change log module with the append-only log of the changes made to the data through the
+mutation endpoints, shared by every server process.
+"""
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+
+from model.logger import logger
+from model.query import normalize_key
+
+
+class ChangeLog:
+    """
+    ChangeLog class with the append-only log of the changes to the data, one JSON object per
+    line: {"network": ..., "names": [...], "last_names": [...], "handle": ...}, where the
+    handle is null for a deletion. Every process appends its changes to the log and reads
+    the changes of the others from the position it read up to, so a change costs one write
+    instead of rewriting and reloading the data file.
+
+    When the log is compacted, its changes are merged into the data file and it is replaced
+    by an empty one. A reader notices it because the file is not the same (another inode)
+    and must reload the data. Appends and compactions are serialized with a lock file.
+
+    Attributes:
+        path (str): The path of the log.
+        inode (int): The inode of the log file read, None if it was not read yet.
+        offset (int): The position of the log read up to.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.inode = None
+        self.offset = 0
+
+    @contextmanager
+    def locked(self):
+        """
+        Context manager that holds the lock of the log, shared by every process.
+        """
+        with open(f"{self.path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def make_change(social_network, names, last_name, handle):
+        """
+        Method to build a change.
+        :param social_network: the social network.
+        :param names: the names of the person, a list of strings.
+        :param last_name: the last names of the person, a list of strings.
+        :param handle: the new handle, None to delete the person.
+        :return: The change, a dict.
+        """
+        return {"network": social_network, "names": list(names), "last_names": list(last_name), "handle": handle}
+
+    @staticmethod
+    def change_key(change):
+        """
+        Method to get the social network and normalized full name changed by a change.
+        :param change: the change.
+        :return: tuple with the social network and the normalized full name.
+        """
+        return change["network"], normalize_key(change["names"], change["last_names"])
+
+    def append(self, change):
+        """
+        Method to append a change to the log.
+        :param change: the change.
+        """
+        line = json.dumps(change, ensure_ascii=False).encode() + b"\n"
+        with self.locked():
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+
+    def rewind(self):
+        """
+        Method to read the log again from the start, e.g. after reloading the data file.
+        """
+        self.inode = None
+        self.offset = 0
+
+    def read_new(self):
+        """
+        Method to read the changes appended since the last read. Lines that were not
+        completely written yet are left for the next read.
+        :return: tuple with the list of changes and True if the log was replaced since the
+            last read, in which case the changes are from the start of the new log.
+        """
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            replaced = self.inode is not None
+            self.rewind()
+            return [], replaced
+        with f:
+            stat = os.fstat(f.fileno())
+            replaced = self.inode is not None and (stat.st_ino != self.inode or stat.st_size < self.offset)
+            if replaced or self.inode is None:
+                self.inode, self.offset = stat.st_ino, 0
+            f.seek(self.offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        self.offset += end
+        changes = []
+        for line in data[:end].splitlines():
+            try:
+                changes.append(json.loads(line))
+            except ValueError as e:
+                logger.logger.error("Skipping invalid line of change log %s: %s", self.path, e)
+        return changes, replaced
+
+    def size(self):
+        """
+        Method to get the size of the log.
+        :return: The size in bytes, 0 if there is no log.
+        """
+        try:
+            return os.stat(self.path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def compact(self, data_path, compactor):
+        """
+        Method to merge the changes of the log into the data file and start an empty log.
+        Must be called holding the lock of the log.
+        :param data_path: the path to the data file.
+        :param compactor: function that receives the path to the data file and the changes,
+            by social network and normalized full name, and rewrites the file.
+        :return: The number of distinct people changed.
+        """
+        changes = {}
+        reader = ChangeLog(self.path)
+        for change in reader.read_new()[0]:
+            changes[self.change_key(change)] = change
+        if changes:
+            compactor(data_path, changes)
+        temporary_path = f"{self.path}.tmp"
+        open(temporary_path, "wb").close()
+        os.replace(temporary_path, self.path)
+        return len(changes)
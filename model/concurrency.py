@@ -0,0 +1,606 @@
+"""
+This module contains the dispatchers that decide how the connections accepted by a
+server are handled: one at a time, by a pool of worker threads or by an event loop.
+"""
+import queue
+import select
+import selectors
+import socket
+import threading
+import time
+
+from model.http import HttpConnection
+from model.logger import logger
+
+SERVICE_UNAVAILABLE = b"""HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"""
+KEEPALIVE_LINGER = 0.005
+
+
+class WorkerPool:
+    """
+    WorkerPool class with a fixed number of worker threads consuming a bounded queue of tasks.
+    When the queue is full, new tasks are rejected so the caller can apply backpressure.
+
+    Attributes:
+        workers (int): The number of worker threads.
+        tasks (Queue): The bounded queue of pending tasks.
+    """
+
+    def __init__(self, workers, queue_size, name="worker"):
+        self.workers = workers
+        self.tasks = queue.Queue(maxsize=queue_size)
+        self.threads = [threading.Thread(target=self.run, name=f"{name}-{i}", daemon=True) for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, task, *args, timeout=None):
+        """
+        Method to add a task to the queue.
+        :param task: the function to run.
+        :param args: the arguments of the function.
+        :param timeout: seconds to wait for room in the queue, None to wait forever.
+        :return: True if the task was queued, False if the queue stayed full.
+        """
+        try:
+            self.tasks.put((task, args), timeout=timeout)
+            return True
+        except queue.Full:
+            return False
+
+    def run(self):
+        """
+        Method run by each worker thread, takes tasks from the queue and runs them.
+        """
+        while True:
+            task, args = self.tasks.get()
+            try:
+                task(*args)
+            except Exception as e:
+                logger.logger.exception("Worker task failed: %s", e)
+            finally:
+                self.tasks.task_done()
+
+    def join(self, timeout):
+        """
+        Method to wait for the queued and running tasks to finish.
+        :param timeout: maximum seconds to wait.
+        :return: True if every task finished, False if the timeout expired first.
+        """
+        deadline = time.monotonic() + timeout
+        with self.tasks.all_tasks_done:
+            while self.tasks.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.tasks.all_tasks_done.wait(remaining)
+        return True
+
+
+class Dispatcher:
+    """
+    Base class of the dispatchers. A dispatcher accepts the connections of a listening socket
+    and runs the connection handler of the server for them.
+
+    The connection handler receives the connection and the address of the client and returns
+    True if the connection must be kept open to receive another request.
+
+    Attributes:
+        handle_connection (callable): The connection handler of the server.
+        config (Config): The configuration of the server.
+        name (str): The name of the server, used in the logs.
+        listener (socket): The listening socket, once serve is called.
+        stopping (Event): Set when the dispatcher must stop accepting connections.
+        open_connections (int): Number of connections currently being handled.
+    """
+
+    def __init__(self, handle_connection, config, name):
+        self.handle_connection = handle_connection
+        self.config = config
+        self.name = name
+        self.listener = None
+        self.stopping = threading.Event()
+        self.open_connections = 0
+        self.lock = threading.Lock()
+
+    def serve(self, listener):
+        """
+        Method to accept and handle connections from the listening socket forever.
+        :param listener: the listening socket.
+        """
+        raise NotImplementedError("serve method is not implemented.")
+
+    def stop(self):
+        """
+        Method to stop accepting connections, so serve returns. The requests being handled
+        are answered, but their connections are not kept open for more requests. It must be
+        called from the thread running serve, e.g. in a signal handler.
+        """
+        self.stopping.set()
+        if self.listener is not None:
+            self.listener.close()
+
+    def join(self, timeout):
+        """
+        Method to wait, after stop, for the connections being handled to finish.
+        :param timeout: maximum seconds to wait.
+        :return: True if every connection finished, False if the timeout expired first.
+        """
+        return True
+
+    def wrap(self, sock):
+        """
+        Method to wrap an accepted socket in a connection that reads HTTP messages.
+        :param sock: the accepted socket.
+        :return: The connection.
+        """
+        return HttpConnection(sock, self.config.http_max_header_size, self.config.http_max_headers,
+                              self.config.http_max_body_size)
+
+    def handle(self, conn, addr):
+        """
+        Method to run the connection handler until the connection has to be closed.
+        :param conn: the connection object.
+        :param addr: the address of the client.
+        """
+        logger.logger.info("%s: Connection from %s has been established.", self.name, addr)
+        conn.settimeout(self.config.server_keepalive_timeout)
+        with self.lock:
+            self.open_connections += 1
+        try:
+            while self.handle_connection(conn, addr) and not self.stopping.is_set():
+                pass
+        except Exception as e:
+            logger.logger.error("%s: Error handling connection from %s: %r", self.name, addr, e)
+        finally:
+            conn.close()
+            with self.lock:
+                self.open_connections -= 1
+
+    def reject(self, conn, addr):
+        """
+        Method to answer 503 to a connection that cannot be handled now and close it.
+        :param conn: the connection object.
+        :param addr: the address of the client.
+        """
+        logger.logger.warning("%s: Server busy, rejecting connection from %s.", self.name, addr)
+        try:
+            conn.sendall(SERVICE_UNAVAILABLE)
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+
+class BlockingDispatcher(Dispatcher):
+    """
+    BlockingDispatcher class that handles one connection at a time in the accept loop.
+    """
+
+    def serve(self, listener):
+        self.listener = listener
+        while not self.stopping.is_set():
+            try:
+                conn, addr = listener.accept()
+            except OSError:
+                if self.stopping.is_set():
+                    break
+                raise
+            self.handle(self.wrap(conn), addr)
+
+
+class IdleConnections:
+    """
+    IdleConnections class with the kept alive connections waiting for their next request. They
+    are watched by a selector in their own thread, so they do not hold a worker thread: when a
+    request arrives on one of them it is handed to the resume callback, and when one stays idle
+    for timeout seconds it is closed.
+
+    Attributes:
+        resume (callable): Called with the connection and the address of the client when a request arrives.
+        close (callable): Called with the connection when it is closed without a request.
+        timeout (float): Seconds a connection can stay idle.
+        name (str): The name of the server, used in the logs.
+        selector (BaseSelector): The selector watching the idle connections.
+        parked (dict): The address of the client and the deadline (time.monotonic) of each idle
+            connection, oldest first.
+        returned (Queue): Connections parked by the workers, waiting to be watched by the selector.
+        stopping (Event): Set when the idle connections must be closed.
+    """
+
+    def __init__(self, resume, close, timeout, name="server"):
+        self.resume = resume
+        self.close = close
+        self.timeout = timeout
+        self.name = name
+        self.selector = selectors.DefaultSelector()
+        self.parked = {}
+        self.returned = queue.Queue()
+        self.stopping = threading.Event()
+        self.waker, self.wakeup = socket.socketpair()
+        self.waker.setblocking(False)
+        self.wakeup.setblocking(False)
+        self.selector.register(self.waker, selectors.EVENT_READ)
+        self.thread = threading.Thread(target=self.run, name=f"{name}-idle", daemon=True)
+        self.thread.start()
+
+    def park(self, conn, addr):
+        """
+        Method to wait for the next request of a connection, from a worker thread.
+        :param conn: the connection object.
+        :param addr: the address of the client.
+        """
+        self.returned.put((conn, addr))
+        self.wake()
+
+    def stop(self):
+        """
+        Method to close the idle connections and the ones parked from now on.
+        """
+        self.stopping.set()
+        self.wake()
+
+    def run(self):
+        """
+        Method run by the thread of the selector, hands the connections with a request to the
+        resume callback and closes the ones idle for too long.
+        """
+        while not self.stopping.is_set():
+            timeout = None
+            if self.parked:
+                timeout = max(0.0, next(iter(self.parked.values()))[1] - time.monotonic())
+            for key, _ in self.selector.select(timeout):
+                if key.fileobj is self.waker:
+                    self.drain()
+                elif key.fileobj in self.parked:
+                    self.selector.unregister(key.fileobj)
+                    addr, _ = self.parked.pop(key.fileobj)
+                    self.resume(key.fileobj, addr)
+            now = time.monotonic()
+            while self.parked:
+                conn, (addr, deadline) = next(iter(self.parked.items()))
+                if deadline > now:
+                    break
+                logger.logger.info("%s: Closing connection from %s idle for %ss.", self.name, addr, self.timeout)
+                self.selector.unregister(conn)
+                del self.parked[conn]
+                self.close(conn)
+        self.drain()
+        for conn in self.parked:
+            self.selector.unregister(conn)
+            self.close(conn)
+        self.parked.clear()
+
+    def drain(self):
+        """
+        Method to watch the connections parked by the workers, or close them if it is stopping.
+        """
+        try:
+            while self.waker.recv(1024):
+                pass
+        except BlockingIOError:
+            pass
+        while not self.returned.empty():
+            conn, addr = self.returned.get_nowait()
+            if self.stopping.is_set():
+                self.close(conn)
+                continue
+            self.parked[conn] = (addr, time.monotonic() + self.timeout)
+            self.selector.register(conn, selectors.EVENT_READ)
+
+    def wake(self):
+        """
+        Method to wake the thread of the selector.
+        """
+        try:
+            self.wakeup.send(b"\0")
+        except BlockingIOError:
+            pass
+
+
+class ThreadPoolDispatcher(Dispatcher):
+    """
+    ThreadPoolDispatcher class that hands each accepted connection to a pool of worker
+    threads. When every worker is busy and the queue is full, the connection is answered
+    with 503 after waiting server_queue_timeout seconds. Between the requests of a kept alive
+    connection, the connection waits in IdleConnections instead of holding its worker, and is
+    queued again when its next request arrives. As the next request of a busy client usually
+    arrives right away, the worker first waits KEEPALIVE_LINGER seconds for it if no other
+    connection is waiting for a worker.
+
+    Attributes:
+        pool (WorkerPool): The worker threads that run the connection handler.
+        idle (IdleConnections): The kept alive connections waiting for their next request.
+    """
+
+    def __init__(self, handle_connection, config, name):
+        super().__init__(handle_connection, config, name)
+        self.pool = WorkerPool(config.server_workers, config.server_queue_size, name)
+        self.idle = IdleConnections(self.resume, self.closed, config.server_keepalive_timeout, name)
+
+    def serve(self, listener):
+        self.listener = listener
+        while not self.stopping.is_set():
+            try:
+                conn, addr = listener.accept()
+            except OSError:
+                if self.stopping.is_set():
+                    break
+                raise
+            conn = self.wrap(conn)
+            if not self.pool.submit(self.handle, conn, addr, timeout=self.config.server_queue_timeout):
+                self.reject(conn, addr)
+
+    def stop(self):
+        super().stop()
+        self.idle.stop()
+
+    def join(self, timeout):
+        return self.pool.join(timeout)
+
+    def handle(self, conn, addr):
+        logger.logger.info("%s: Connection from %s has been established.", self.name, addr)
+        conn.settimeout(self.config.server_keepalive_timeout)
+        with self.lock:
+            self.open_connections += 1
+        self.work(conn, addr)
+
+    def work(self, conn, addr):
+        """
+        Method run by a worker thread to handle the requests available on a connection,
+        parking the connection in the idle connections if it has to be kept open.
+        :param conn: the connection object.
+        :param addr: the address of the client.
+        """
+        try:
+            while self.handle_connection(conn, addr) and not self.stopping.is_set():
+                if not conn.pending() and not self.linger(conn):
+                    self.idle.park(conn, addr)
+                    return
+        except Exception as e:
+            logger.logger.error("%s: Error handling connection from %s: %r", self.name, addr, e)
+        self.closed(conn)
+
+    def linger(self, conn):
+        """
+        Method to wait KEEPALIVE_LINGER seconds for the next request of a connection, only if
+        no other connection is waiting for a worker.
+        :param conn: the connection object.
+        :return: True if the next request arrived.
+        """
+        if not self.pool.tasks.empty():
+            return False
+        poll = select.poll()
+        poll.register(conn, select.POLLIN)
+        return bool(poll.poll(KEEPALIVE_LINGER * 1000))
+
+    def resume(self, conn, addr):
+        """
+        Method to queue a kept alive connection whose next request arrived, answered with 503
+        if the queue is full.
+        :param conn: the connection object.
+        :param addr: the address of the client.
+        """
+        if not self.pool.submit(self.work, conn, addr, timeout=0):
+            self.reject(conn, addr)
+            with self.lock:
+                self.open_connections -= 1
+
+    def closed(self, conn):
+        """
+        Method to close a connection and count it.
+        :param conn: the connection object.
+        """
+        conn.close()
+        with self.lock:
+            self.open_connections -= 1
+
+
+class SelectorDispatcher(Dispatcher):
+    """
+    SelectorDispatcher class that runs an event loop over the listening socket and the open
+    connections. Connections are only handed to the worker threads once they have data to
+    read, so idle clients do not hold a worker. When server_max_connections connections are
+    open, the loop stops accepting until one of them is closed. A connection waiting for a
+    request for server_keepalive_timeout seconds is closed, so idle clients cannot keep the
+    loop from accepting.
+
+    Attributes:
+        pool (WorkerPool): The worker threads that run the connection handler.
+        selector (BaseSelector): The selector of the event loop.
+        returned (Queue): Connections handed back by the workers to wait for a new request.
+        open_connections (int): Number of connections currently open, idle or not.
+        deadlines (dict): The address of the client and the deadline (time.monotonic) of each
+            connection waiting for a request, oldest first.
+    """
+
+    def __init__(self, handle_connection, config, name):
+        super().__init__(handle_connection, config, name)
+        self.pool = WorkerPool(config.server_workers, config.server_queue_size, name)
+        self.selector = selectors.DefaultSelector()
+        self.returned = queue.Queue()
+        self.deadlines = {}
+        self.waker, self.wakeup = socket.socketpair()
+        self.waker.setblocking(False)
+        self.wakeup.setblocking(False)
+
+    def serve(self, listener):
+        self.listener = listener
+        listener.setblocking(False)
+        self.selector.register(listener, selectors.EVENT_READ, "accept")
+        self.selector.register(self.waker, selectors.EVENT_READ, "wake")
+        accepting = True
+        while True:
+            timeout = None
+            if self.deadlines:
+                timeout = max(0.0, next(iter(self.deadlines.values()))[1] - time.monotonic())
+            events = self.selector.select(timeout)
+            if self.stopping.is_set():
+                break
+            for key, _ in events:
+                match key.data:
+                    case "accept":
+                        self.accept(listener)
+                    case "wake":
+                        self.drain()
+                    case addr:
+                        self.selector.unregister(key.fileobj)
+                        del self.deadlines[key.fileobj]
+                        self.dispatch(key.fileobj, addr)
+            self.expire()
+
+            with self.lock:
+                full = self.open_connections >= self.config.server_max_connections
+            if full and accepting:
+                self.selector.unregister(listener)
+                accepting = False
+            elif not full and not accepting:
+                self.selector.register(listener, selectors.EVENT_READ, "accept")
+                accepting = True
+
+        if accepting:
+            self.selector.unregister(listener)
+        listener.close()
+        self.drain()
+        for conn in self.deadlines:
+            self.selector.unregister(conn)
+            conn.close()
+            self.closed()
+        self.deadlines.clear()
+
+    def stop(self):
+        """
+        Method to stop the event loop, from any thread: the loop closes the listening socket
+        and the connections waiting for a request before serve returns.
+        """
+        self.stopping.set()
+        self.wake()
+
+    def join(self, timeout):
+        return self.pool.join(timeout)
+
+    def accept(self, listener):
+        """
+        Method to accept a new connection and wait for its request.
+        :param listener: the listening socket.
+        """
+        try:
+            conn, addr = listener.accept()
+        except BlockingIOError:
+            return
+        logger.logger.info("%s: Connection from %s has been established.", self.name, addr)
+        conn = self.wrap(conn)
+        with self.lock:
+            self.open_connections += 1
+        self.watch(conn, addr)
+
+    def watch(self, conn, addr):
+        """
+        Method to wait for the next request of a connection, for server_keepalive_timeout seconds.
+        :param conn: the connection object.
+        :param addr: the address of the client.
+        """
+        conn.setblocking(False)
+        self.selector.register(conn, selectors.EVENT_READ, addr)
+        self.deadlines[conn] = (addr, time.monotonic() + self.config.server_keepalive_timeout)
+
+    def expire(self):
+        """
+        Method to close the connections that waited for a request for too long.
+        """
+        now = time.monotonic()
+        while self.deadlines:
+            conn, (addr, deadline) = next(iter(self.deadlines.items()))
+            if deadline > now:
+                break
+            logger.logger.info("%s: Closing connection from %s idle for %ss.", self.name, addr,
+                               self.config.server_keepalive_timeout)
+            self.selector.unregister(conn)
+            del self.deadlines[conn]
+            conn.close()
+            self.closed()
+
+    def drain(self):
+        """
+        Method to register again the connections handed back by the workers, or close them if
+        the loop is stopping.
+        """
+        try:
+            while self.waker.recv(1024):
+                pass
+        except BlockingIOError:
+            pass
+        while not self.returned.empty():
+            conn, addr = self.returned.get_nowait()
+            if self.stopping.is_set():
+                conn.close()
+                self.closed()
+                continue
+            self.watch(conn, addr)
+
+    def dispatch(self, conn, addr):
+        """
+        Method to hand a connection with data to read to the worker threads.
+        :param conn: the connection object.
+        :param addr: the address of the client.
+        """
+        conn.settimeout(self.config.server_keepalive_timeout)
+        if not self.pool.submit(self.work, conn, addr, timeout=0):
+            self.reject(conn, addr)
+            self.closed()
+
+    def work(self, conn, addr):
+        """
+        Method run by a worker thread to handle the requests available on a connection,
+        handing the connection back to the event loop if it has to be kept open.
+        :param conn: the connection object.
+        :param addr: the address of the client.
+        """
+        try:
+            while self.handle_connection(conn, addr) and not self.stopping.is_set():
+                if not conn.pending():
+                    self.returned.put((conn, addr))
+                    self.wake()
+                    return
+        except Exception as e:
+            logger.logger.error("%s: Error handling connection from %s: %r", self.name, addr, e)
+        conn.close()
+        self.closed()
+
+    def closed(self):
+        """
+        Method to count a closed connection and wake the event loop so it can accept again.
+        """
+        with self.lock:
+            self.open_connections -= 1
+        self.wake()
+
+    def wake(self):
+        """
+        Method to wake the event loop from a worker thread.
+        """
+        try:
+            self.wakeup.send(b"\0")
+        except BlockingIOError:
+            pass
+
+
+DISPATCHERS = {
+    "blocking": BlockingDispatcher,
+    "threads": ThreadPoolDispatcher,
+    "selectors": SelectorDispatcher,
+}
+
+
+def get_dispatcher(handle_connection, config, name):
+    """
+    Function to build the dispatcher selected by the server_mode setting.
+    :param handle_connection: the connection handler of the server.
+    :param config: the configuration of the server.
+    :param name: the name of the server.
+    :return: The dispatcher.
+    """
+    try:
+        dispatcher_class = DISPATCHERS[config.server_mode]
+    except KeyError:
+        raise ValueError(f"Invalid server mode {config.server_mode}. Use one of: {', '.join(DISPATCHERS)}.")
+    return dispatcher_class(handle_connection, config, name)
@@ -0,0 +1,168 @@
+"""
+Configuration module that reads the tunable settings of the servers from the environment.
+"""
+import os
+
+
+class Config:
+    """
+    Config class that holds the tunable settings of the servers. Every setting has a default
+    value and can be overridden with an environment variable of the same name in upper case
+    (e.g. server_mode -> SERVER_MODE), so it can be set in the .env file.
+
+    Attributes:
+        server_mode (str): How connections are handled: "blocking", "threads" or "selectors".
+        server_workers (int): Number of worker threads handling connections.
+        server_queue_size (int): Maximum number of connections waiting for a worker.
+        server_queue_timeout (float): Seconds to wait for room in the queue before answering 503.
+        server_max_connections (int): Maximum number of open connections in "selectors" mode.
+        server_backlog (int): Size of the listen backlog of the server socket.
+        server_keepalive_timeout (float): Seconds a client connection can stay idle waiting for a request.
+        server_processes (int): Number of worker processes of each server, 1 to serve from a single process.
+        server_reuse_port (bool): True for each worker process to bind its own socket with SO_REUSEPORT
+            instead of sharing the socket of the parent process. It also lets a new process of the
+            server bind the port while the old one is still running, for rolling restarts.
+        server_drain_timeout (float): Seconds a worker process has to finish its requests when stopped.
+        server_start_timeout (float): Seconds the supervisor (main.py) waits for a server to be ready.
+        http_max_header_size (int): Maximum size in bytes of the request line and headers of a request.
+        http_max_headers (int): Maximum number of headers of a request.
+        http_max_body_size (int): Maximum size in bytes of a request body read all at once.
+        http_cache_max_age (int): Seconds the clients and CDNs can reuse a response to a query
+            without asking again (Cache-Control max-age), 0 to make them revalidate it with its ETag.
+        data_reload_interval (float): Seconds between each check of the data file for changes.
+        data_store (str): How the data is kept in memory: "dict" or "compact" (see model.store).
+        data_mutations (bool): True to accept changes to the data with PUT and DELETE requests.
+        data_log_path (str): Path of the log of the changes to the data, the data file with the
+            .log extension added if empty.
+        data_compact_size (int): Size in bytes of the change log over which it is merged into the
+            data file, 0 to never merge it.
+        cache_capacity (int): Maximum number of responses in the cache of each server, 0 to disable it.
+        cache_ttl (float): Seconds a cached response is valid, 0 for no expiration.
+        cache_negative_ttl (float): Seconds a cached "not found" response is valid, 0 for no expiration.
+        cache_shared_path (str): Path of the file of the cache shared by every server process, empty to
+            disable it (see model.cache.SharedCache).
+        cache_shared_slots (int): Number of entries of the shared cache.
+        cache_shared_slot_size (int): Size in bytes of each entry of the shared cache, larger responses
+            are not shared.
+        pool_size (int): Maximum number of open connections to each linked server.
+        pool_timeout (float): Seconds to wait for a connection to a linked server and for its response.
+        pool_idle_timeout (float): Seconds an idle connection to a linked server is kept open.
+        batch_size (int): Number of queries of a batch request resolved together.
+        search_enabled (bool): True to build the search index of the names and answer GET /search.
+        search_limit (int): Number of results of a search that does not set its limit.
+        search_max_candidates (int): Maximum people scored by a search, so the searches that match
+            too many people answer in bounded time.
+        fanout_workers (int): Number of threads sending requests to the linked servers in parallel.
+        fanout_timeout (float): Seconds each branch of an "all" query has to answer.
+        upstream_deadline (float): Seconds a request to a linked server has to be answered, retries included.
+        upstream_retries (int): Number of times a failed request to a linked server is retried.
+        upstream_backoff (float): Base of the exponential backoff between retries, in seconds; the
+            wait is random between 0 and upstream_backoff * 2 ** (retry - 1).
+        upstream_breaker_failures (int): Consecutive failures of a linked server that open its circuit,
+            0 to never open it.
+        upstream_breaker_reset (float): Seconds the circuit of a linked server stays open before a
+            request is let through to probe it.
+        upstream_hedge (bool): True to send a slow request to a linked server again to another replica.
+        upstream_hedge_percentile (float): Percentile of the latency of the linked server after which
+            a request is hedged, between 0 and 1.
+        metrics_enabled (bool): True to record the metrics of the server and expose them on /metrics.
+        log_level (str): The minimum level of the logged records, e.g. INFO or WARNING.
+        log_async (bool): True to write the logs from a background thread instead of the request threads.
+        log_queue_size (int): Maximum records waiting to be written, newer records are dropped when full.
+        log_sample_rate (float): Fraction of the info records of each event type that are written.
+        log_rate_limit (int): Maximum info records of each event type written per second, 0 for no limit.
+        log_access (bool): True to write one access log line per request.
+        trace_sample_rate (float): Fraction of the requests traced from the start, 0 to trace
+            none until tracing is turned on with SIGUSR1 or /admin/trace (see model.tracing).
+        debug_dir (str): Directory where the traces and profiles are written, the temporary
+            directory if empty.
+        admin_enabled (bool): True to serve the /admin/trace and /admin/profile paths.
+    """
+
+    defaults = {
+        "server_mode": "threads",
+        "server_workers": 16,
+        "server_queue_size": 128,
+        "server_queue_timeout": 1.0,
+        "server_max_connections": 1024,
+        "server_backlog": 128,
+        "server_keepalive_timeout": 15.0,
+        "server_processes": 1,
+        "server_reuse_port": False,
+        "server_drain_timeout": 10.0,
+        "server_start_timeout": 120.0,
+        "http_max_header_size": 8192,
+        "http_max_headers": 100,
+        "http_max_body_size": 1048576,
+        "http_cache_max_age": 60,
+        "data_reload_interval": 1.0,
+        "data_store": "dict",
+        "data_mutations": False,
+        "data_log_path": "",
+        "data_compact_size": 1048576,
+        "cache_capacity": 1024,
+        "cache_ttl": 300.0,
+        "cache_negative_ttl": 30.0,
+        "cache_shared_path": "",
+        "cache_shared_slots": 65536,
+        "cache_shared_slot_size": 256,
+        "pool_size": 16,
+        "pool_timeout": 5.0,
+        "pool_idle_timeout": 30.0,
+        "batch_size": 1000,
+        "search_enabled": True,
+        "search_limit": 10,
+        "search_max_candidates": 2000,
+        "fanout_workers": 32,
+        "fanout_timeout": 2.0,
+        "upstream_deadline": 3.0,
+        "upstream_retries": 2,
+        "upstream_backoff": 0.05,
+        "upstream_breaker_failures": 5,
+        "upstream_breaker_reset": 5.0,
+        "upstream_hedge": False,
+        "upstream_hedge_percentile": 0.95,
+        "metrics_enabled": True,
+        "log_level": "INFO",
+        "log_async": True,
+        "log_queue_size": 10000,
+        "log_sample_rate": 1.0,
+        "log_rate_limit": 0,
+        "log_access": False,
+        "trace_sample_rate": 0.0,
+        "debug_dir": "",
+        "admin_enabled": False,
+    }
+
+    def __init__(self, **settings):
+        for name, default in self.defaults.items():
+            setattr(self, name, settings.pop(name, default))
+        if settings:
+            raise TypeError(f"Unknown settings: {', '.join(settings)}")
+
+    @classmethod
+    def from_env(cls):
+        """
+        Method to build the configuration from the environment variables.
+        :return: The configuration.
+        """
+        settings = {}
+        for name, default in cls.defaults.items():
+            value = os.getenv(name.upper())
+            if value is not None:
+                settings[name] = cls.cast(value, default)
+        return cls(**settings)
+
+    @staticmethod
+    def cast(value, default):
+        """
+        Method to convert the value of an environment variable to the type of the default.
+        :param value: the value of the environment variable.
+        :param default: the default value of the setting.
+        :return: The converted value.
+        """
+        if isinstance(default, bool):
+            return value.strip().lower() in ("1", "true", "yes", "on")
+        if default is None:
+            return value
+        return type(default)(value)
@@ -0,0 +1,508 @@
+"""
+HTTP module with the classes to read and build the HTTP messages exchanged by the
+servers and their clients.
+"""
+import hashlib
+import socket
+import time
+
+REASONS = {
+    200: "OK",
+    201: "Created",
+    202: "Accepted",
+    302: "Found",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Content Too Large",
+    431: "Request Header Fields Too Large",
+    502: "Bad Gateway",
+    503: "Service Unavailable",
+}
+NO_BODY_STATUSES = (204, 304)
+
+
+class HttpError(Exception):
+    """
+    HttpError exception raised when a message cannot be read, with the status code that
+    should be answered to the client.
+
+    Attributes:
+        status (int): The status code of the error.
+    """
+
+    def __init__(self, status, message=None):
+        super().__init__(message or REASONS.get(status, ""))
+        self.status = status
+
+
+class HttpMessage:
+    """
+    Base class of the HTTP messages. The body of a message read from a connection is
+    read lazily: either all at once with the body attribute or in chunks with iter_body.
+
+    Attributes:
+        version (str): The protocol version, e.g. HTTP/1.1.
+        headers (dict): The headers of the message, with lowercased names.
+        max_body_size (int): Maximum size of the body when read all at once, 0 for no limit.
+        received_at (float): The time.perf_counter when the first byte of the message was
+            received, None if it was not read from a connection.
+    """
+
+    def __init__(self, version, headers, body=b""):
+        self.version = version
+        self.headers = headers
+        self.max_body_size = 0
+        self.received_at = None
+        self._body = body
+        self._stream = None
+
+    @property
+    def body(self):
+        """
+        The body of the message, read all at once.
+        """
+        if self._stream is not None:
+            body = bytearray()
+            for chunk in self.iter_body():
+                body += chunk
+                if self.max_body_size and len(body) > self.max_body_size:
+                    raise HttpError(413)
+            self._body = bytes(body)
+        return self._body
+
+    def iter_body(self):
+        """
+        Method to read the body of the message in chunks, without keeping it in memory.
+        :return: Generator of the chunks of the body.
+        """
+        stream, self._stream = self._stream, None
+        if stream is None:
+            if self._body:
+                yield self._body
+            return
+        self._body = b""
+        yield from stream
+
+    def drain_into_body(self):
+        """
+        Method to read the whole body now, so the connection can be used for another message.
+        """
+        self._body = self.body
+        self._stream = None
+
+    def drain(self):
+        """
+        Method to read the rest of the body so the next message of the connection can be read.
+        """
+        for _ in self.iter_body():
+            pass
+
+    @property
+    def keep_alive(self):
+        """
+        True if the connection can be used for another message after this one.
+        """
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    @property
+    def chunked(self):
+        """
+        True if the body of the message uses the chunked transfer encoding.
+        """
+        return "chunked" in self.headers.get("transfer-encoding", "").lower()
+
+    @staticmethod
+    def parse_headers(lines):
+        """
+        Method to parse the header lines of a message.
+        :param lines: the header lines, without the start line.
+        :return: dict with the lowercased header names and their values.
+        """
+        headers = {}
+        for line in lines:
+            if not line:
+                continue
+            name, separator, value = line.partition(":")
+            if not separator:
+                raise HttpError(400, f"Invalid header line: {line!r}")
+            headers[name.strip().lower()] = value.strip()
+        return headers
+
+
+class HttpRequest(HttpMessage):
+    """
+    HttpRequest class that represents a request received by a server.
+
+    Attributes:
+        method (str): The method of the request, e.g. GET.
+        path (str): The requested path.
+    """
+
+    def __init__(self, method, path, version, headers, body=b""):
+        super().__init__(version, headers, body)
+        self.method = method
+        self.path = path
+
+    @classmethod
+    def parse(cls, head, body=b""):
+        """
+        Method to build a request from its head.
+        :param head: the request line and the headers of the request, as a string.
+        :param body: the body of the request.
+        :return: The request.
+        """
+        lines = head.split("\r\n")
+        parts = lines[0].split(" ")
+        if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+            raise HttpError(400, f"Invalid request line: {lines[0]!r}")
+        method, path, version = parts
+        return cls(method, path, version, cls.parse_headers(lines[1:]), body)
+
+
+class HttpResponse(HttpMessage):
+    """
+    HttpResponse class that represents a response sent by a server.
+
+    Attributes:
+        status (int): The status code of the response.
+        reason (str): The reason phrase of the response.
+    """
+
+    def __init__(self, status, body=b"", headers=None, version="HTTP/1.1", reason=None):
+        super().__init__(version, headers if headers is not None else {}, body)
+        self.status = status
+        self.reason = reason if reason is not None else REASONS.get(status, "")
+
+    @property
+    def keep_alive(self):
+        framed = self.status in NO_BODY_STATUSES or "content-length" in self.headers or self.chunked
+        return framed and super().keep_alive
+
+    @classmethod
+    def parse(cls, head, body=b""):
+        """
+        Method to build a response from its head.
+        :param head: the status line and the headers of the response, as a string.
+        :param body: the body of the response.
+        :return: The response.
+        """
+        lines = head.split("\r\n")
+        parts = (lines[0].split(" ", 2) + [""])[:3]
+        if not parts[0].startswith("HTTP/") or not parts[1].isdigit():
+            raise HttpError(502, f"Invalid status line: {lines[0]!r}")
+        version, status, reason = parts
+        return cls(int(status), body, cls.parse_headers(lines[1:]), version, reason)
+
+    def to_bytes(self):
+        """
+        Method to serialize the response, always with its Content-Length, except for the
+        statuses that have no body (e.g. 304).
+        :return: The response as bytes.
+        """
+        head = f"{self.version} {self.status} {self.reason}\r\n"
+        for name, value in self.headers.items():
+            if name.lower() not in ("content-length", "transfer-encoding"):
+                head += f"{name}: {value}\r\n"
+        if self.status in NO_BODY_STATUSES:
+            return (head + "\r\n").encode()
+        head += f"Content-Length: {len(self.body)}\r\n\r\n"
+        return head.encode() + self.body
+
+
+class HttpConnection:
+    """
+    HttpConnection class that wraps a socket and reads the HTTP messages sent through it.
+    Reads are buffered, so a message can arrive in any number of segments and several
+    pipelined messages can arrive in one segment: the bytes after a message stay in the
+    buffer for the next one. Bodies are framed with Content-Length or the chunked
+    transfer encoding.
+
+    Attributes:
+        sock (socket): The wrapped socket.
+        max_header_size (int): Maximum size of the head (start line and headers) of a message.
+        max_headers (int): Maximum number of headers of a message.
+        max_body_size (int): Maximum size of a body read all at once, 0 for no limit.
+        status (int): The status code of the last response sent, used by the access logs.
+        bytes_sent (int): The bytes sent since it was last reset, used by the access logs.
+    """
+
+    def __init__(self, sock, max_header_size=8192, max_headers=100, max_body_size=1048576):
+        self.sock = sock
+        self.max_header_size = max_header_size
+        self.max_headers = max_headers
+        self.max_body_size = max_body_size
+        self.buffer = bytearray()
+        self.message_started = None
+        self.status = None
+        self.bytes_sent = 0
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def settimeout(self, timeout):
+        self.sock.settimeout(timeout)
+
+    def setblocking(self, blocking):
+        self.sock.setblocking(blocking)
+
+    def sendall(self, data):
+        if data[:5] == b"HTTP/":
+            self.status = int(data[9:12])
+        self.bytes_sent += len(data)
+        self.sock.sendall(data)
+
+    def close(self):
+        self.sock.close()
+
+    def pending(self):
+        """
+        Method to check if there are buffered bytes of a message not handled yet.
+        :return: True if the buffer is not empty.
+        """
+        return len(self.buffer) > 0
+
+    def fill(self):
+        """
+        Method to read the next segment of the socket into the buffer.
+        :return: False if the connection was closed.
+        """
+        data = self.sock.recv(65536)
+        if not data:
+            return False
+        self.buffer += data
+        return True
+
+    def read_head(self):
+        """
+        Method to read the head of the next message. The time its first byte was received
+        is kept in message_started.
+        :return: The head as a string, None if the connection was closed or timed out
+            before the message started.
+        """
+        self.message_started = time.perf_counter() if self.buffer else None
+        while True:
+            end = self.buffer.find(b"\r\n\r\n")
+            if end >= 0:
+                break
+            if len(self.buffer) > self.max_header_size:
+                raise HttpError(431)
+            try:
+                if not self.fill():
+                    if self.buffer.strip():
+                        raise HttpError(400, "Connection closed in the middle of a message.")
+                    return None
+                if self.message_started is None:
+                    self.message_started = time.perf_counter()
+            except socket.timeout:
+                if self.buffer.strip():
+                    raise
+                return None
+        if end > self.max_header_size:
+            raise HttpError(431)
+        head = self.buffer[:end].decode("iso-8859-1").lstrip("\r\n")
+        del self.buffer[:end + 4]
+        if head.count("\r\n") > self.max_headers:
+            raise HttpError(431)
+        return head
+
+    def read_exact(self, size):
+        """
+        Method to read a number of bytes.
+        :param size: the number of bytes to read.
+        :return: The bytes read.
+        """
+        while len(self.buffer) < size:
+            if not self.fill():
+                raise HttpError(400, "Connection closed in the middle of a message.")
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def read_line(self):
+        """
+        Method to read a line, used by the chunked transfer encoding.
+        :return: The line without the line break.
+        """
+        while (end := self.buffer.find(b"\r\n")) < 0:
+            if len(self.buffer) > self.max_header_size:
+                raise HttpError(400, "Line too long.")
+            if not self.fill():
+                raise HttpError(400, "Connection closed in the middle of a message.")
+        line = bytes(self.buffer[:end])
+        del self.buffer[:end + 2]
+        return line
+
+    def stream_body(self, message, until_close=False):
+        """
+        Method to read the body of a message in chunks.
+        :param message: the message whose body is read.
+        :param until_close: True to read until the connection is closed when the body has no framing.
+        :return: Generator of the chunks of the body.
+        """
+        if message.chunked:
+            while True:
+                size_line = self.read_line().split(b";", 1)[0].strip()
+                try:
+                    size = int(size_line, 16)
+                except ValueError:
+                    raise HttpError(400, f"Invalid chunk size: {size_line!r}")
+                if size == 0:
+                    while self.read_line():
+                        pass
+                    return
+                yield self.read_exact(size)
+                if self.read_line():
+                    raise HttpError(400, "Invalid chunk terminator.")
+        elif "content-length" in message.headers:
+            try:
+                remaining = int(message.headers["content-length"])
+            except ValueError:
+                raise HttpError(400, "Invalid Content-Length.")
+            while remaining > 0:
+                if not self.buffer and not self.fill():
+                    raise HttpError(400, "Connection closed in the middle of a message.")
+                chunk = bytes(self.buffer[:remaining])
+                del self.buffer[:len(chunk)]
+                remaining -= len(chunk)
+                yield chunk
+        elif until_close:
+            while self.buffer or self.fill():
+                chunk = bytes(self.buffer)
+                self.buffer.clear()
+                yield chunk
+
+    def read_request(self):
+        """
+        Method to read the next request of the connection. Its body is read lazily.
+        :return: The request, None if the connection was closed before a new request.
+        """
+        head = self.read_head()
+        if head is None:
+            return None
+        request = HttpRequest.parse(head)
+        request.received_at = self.message_started
+        request.max_body_size = self.max_body_size
+        # Most requests have no body, and do not need a stream to read it
+        if "content-length" in request.headers or request.chunked:
+            request._stream = self.stream_body(request)
+        return request
+
+    def read_response(self):
+        """
+        Method to read the next response of the connection, with its whole body.
+        :return: The response.
+        """
+        head = self.read_head()
+        if head is None:
+            raise ConnectionError("Connection closed or timed out before receiving a response.")
+        response = HttpResponse.parse(head)
+        if response.status not in NO_BODY_STATUSES:
+            response._stream = self.stream_body(response, until_close=True)
+            response.drain_into_body()
+        return response
+
+    def send_chunk(self, data):
+        """
+        Method to send a chunk of a response that uses the chunked transfer encoding.
+        An empty chunk ends the body.
+        :param data: the chunk as bytes.
+        """
+        chunk = f"{len(data):x}\r\n".encode() + data + b"\r\n"
+        self.bytes_sent += len(chunk)
+        self.sock.sendall(chunk)
+
+
+def build_response(status, body=b"", headers=None):
+    """
+    Function to build the bytes of a response.
+    :param status: the status code of the response.
+    :param body: the body of the response, as bytes or string.
+    :param headers: extra headers of the response.
+    :return: The response as bytes.
+    """
+    if isinstance(body, str):
+        body = body.encode()
+    return HttpResponse(status, body, headers).to_bytes()
+
+
+def make_etag(*parts):
+    """
+    Function to build a strong ETag from the values that identify the version of a response.
+    The values are hashed through their repr, so every process builds the same ETag.
+    :param parts: the values, e.g. the social network, the person and the version of its entry.
+    :return: The ETag, quoted.
+    """
+    return f'"{hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()}"'
+
+
+def etag_matches(condition, etag):
+    """
+    Function to evaluate an If-None-Match header against the ETag of the current response,
+    with the weak comparison (W/"x" matches "x"). The caller must only evaluate * for a
+    response that exists.
+    :param condition: the value of the header: * or a list of ETags separated by commas.
+    :param etag: the ETag of the current response.
+    :return: True if the client already has the current response.
+    """
+    if condition.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in condition.split(","))
+
+
+class EncodedResponses:
+    """
+    EncodedResponses class with the bytes of the responses to the lookups, by body and ETag,
+    so the response to a repeated lookup is built once instead of on every request. The body
+    of a lookup is the handle of the person (or the handles of every social network), empty if
+    it was not found, which is answered with 404, without ETag and with its own headers, so a
+    person added later is not hidden by a cached 404. When it is full, every response is dropped.
+
+    Attributes:
+        capacity (int): Maximum number of responses kept, 0 to build every response.
+        headers (dict): The headers of the responses with a body, e.g. Cache-Control.
+        not_found_headers (dict): The headers of the 404 responses.
+        responses (dict): The bytes of each response, by body and ETag.
+    """
+
+    def __init__(self, capacity=1024, headers=None, not_found_headers=None):
+        self.capacity = capacity
+        self.headers = headers if headers is not None else {}
+        self.not_found_headers = not_found_headers if not_found_headers is not None else {}
+        self.responses = {}
+
+    def get(self, body, etag=None):
+        """
+        Method to get the bytes of the response to a lookup.
+        :param body: the body of the response, as a string, empty if the person was not found.
+        :param etag: the ETag of the response, None for no ETag.
+        :return: The response as bytes.
+        """
+        key = (body, etag if body else None)
+        response = self.responses.get(key)
+        if response is None:
+            headers = dict(self.headers if body else self.not_found_headers)
+            if key[1] is not None:
+                headers["ETag"] = etag
+            response = build_response(200 if body else 404, body, headers)
+            if self.capacity > 0:
+                if len(self.responses) >= self.capacity:
+                    self.responses.clear()
+                self.responses[key] = response
+        return response
+
+    def not_modified(self, etag):
+        """
+        Method to build the response to a conditional request whose ETag did not change.
+        :param etag: the ETag.
+        :return: The 304 response as bytes.
+        """
+        return build_response(304, headers={**self.headers, "ETag": etag})
+
+    def __len__(self):
+        return len(self.responses)
@@ -0,0 +1,258 @@
+"""
+Index module that keeps the data of the social networks in memory, reloads it when the
+data file changes and applies the changes of the change log.
+"""
+import os
+import threading
+
+from model.logger import logger
+
+
+class DataIndex:
+    """
+    DataIndex class that loads the data file once and keeps it in memory, indexed by
+    social network and normalized full name. A background thread watches the file and
+    rebuilds the index when its modification time or size changes, swapping the new
+    index in only once it is complete.
+
+    With a change log, the changes to single people are applied in place to the index,
+    which is a dict per social network (or a compact table with an overlay): readers do not
+    take any lock. The watcher thread also applies the changes appended by other processes,
+    and compacts the log into the data file when it grows over compact_size bytes.
+
+    Attributes:
+        path (str): The path to the data file.
+        loader (callable): Function that receives the path and returns the parsed data.
+        interval (float): Seconds between each check of the data file.
+        listeners (list): Functions called after a new index has been swapped in.
+        change_listeners (list): Functions called with the social network and normalized
+            full name of each change applied to the index.
+        changes (ChangeLog): The log of the changes to the data, None if the data is read-only.
+        compactor (callable): Function that receives the path and the changes by social network
+            and normalized full name, and rewrites the data file with them.
+        compact_size (int): Size in bytes of the log over which it is compacted, 0 to never compact it.
+        key_filter (callable): Function of a normalized full name that returns True for the
+            people kept in the index, None to keep everyone (see model.sharding).
+        network_filter (callable): Function of a social network that returns True for the social
+            networks kept in the index, None to keep every one. The changes of the other social
+            networks are not applied, but the change listeners are still called with them, so
+            the results cached from the servers that keep them are dropped.
+        generations (dict): The number of changes applied to each person (normalized full
+            name, in any social network) since the data file was loaded, counting the changes
+            of the log applied when it was loaded, so every process that read the same log
+            has the same count (see entry_version).
+    """
+
+    def __init__(self, path, loader, interval=1.0, changes=None, compactor=None, compact_size=0, key_filter=None,
+                 network_filter=None):
+        self.path = path
+        self.loader = loader
+        self.interval = interval
+        self.listeners = []
+        self.change_listeners = []
+        self.changes = changes
+        self.compactor = compactor
+        self.compact_size = compact_size
+        self.key_filter = key_filter
+        self.network_filter = network_filter
+        self.generations = {}
+        self._snapshot = (None, None)
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    @property
+    def data(self):
+        """
+        The indexed data: social network -> normalized full name -> handle.
+        """
+        return self._snapshot[1]
+
+    @property
+    def version(self):
+        """
+        The modification time and size of the data file the index was built from.
+        """
+        return self._snapshot[0]
+
+    def entry_version(self, key):
+        """
+        Method to get the version of the entry of a person, which changes every time its handle
+        may have changed in any social network, without looking it up: the version of the data
+        file and the number of changes to the person applied since then.
+        :param key: the normalized full name of the person.
+        :return: tuple with the modification time, size and changes, None if the index is not loaded.
+        """
+        version = self.version
+        if version is None:
+            return None
+        return version + (self.generations.get(key, 0),)
+
+    def stat(self):
+        """
+        Method to get the current version of the data file.
+        :return: tuple with the modification time (ns) and size of the file.
+        """
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self):
+        """
+        Method to build the index from the data file, apply the changes of the log and swap it in.
+        :return: The indexed data.
+        """
+        with self._lock:
+            version = self.stat()
+            data = self.loader(self.path)
+            generations = {}
+            if self.changes is not None:
+                self.changes.rewind()
+                for change in self.changes.read_new()[0]:
+                    changed = self.apply(data, change)
+                    if changed is not None:
+                        generations[changed[1]] = generations.get(changed[1], 0) + 1
+            self.generations = generations
+            self._snapshot = (version, data)
+        logger.logger.info("Index for %s loaded (%s entries).", self.path, sum(len(entries) for entries in data.values()))
+        for listener in self.listeners:
+            listener()
+        return data
+
+    def subscribe(self, listener):
+        """
+        Method to register a function to call every time the index is (re)built.
+        :param listener: the function to call, without arguments.
+        """
+        self.listeners.append(listener)
+
+    def subscribe_changes(self, listener):
+        """
+        Method to register a function to call every time a change is applied to the index.
+        :param listener: the function to call with the social network and the normalized full name.
+        """
+        self.change_listeners.append(listener)
+
+    def apply(self, data, change):
+        """
+        Method to apply a change to the data, in place, unless its social network is not kept.
+        :param data: the indexed data.
+        :param change: the change (see model.changelog).
+        :return: tuple with the social network and normalized full name changed, None if the
+            person is not kept in this index.
+        """
+        social_network, key = self.changes.change_key(change)
+        if self.key_filter is not None and not self.key_filter(key):
+            return None
+        if self.network_filter is not None and not self.network_filter(social_network):
+            return social_network, key
+        table = data.get(social_network)
+        if table is None:
+            table = data[social_network] = {}
+        if change["handle"] is None:
+            table.pop(key, None)
+        else:
+            table[key] = change["handle"]
+        return social_network, key
+
+    def update(self, social_network, names, last_name, handle):
+        """
+        Method to change the handle of a person: the change is appended to the log and applied
+        to the index, after the changes of other processes appended before it.
+        :param social_network: the social network.
+        :param names: the names of the person, a list of strings.
+        :param last_name: the last names of the person, a list of strings.
+        :param handle: the new handle, None to delete the person.
+        """
+        self.get_data()
+        self.changes.append(self.changes.make_change(social_network, names, last_name, handle))
+        self.poll()
+
+    def poll(self):
+        """
+        Method to apply the changes appended to the log since the last poll. If the log was
+        compacted, the data file is reloaded instead.
+        """
+        with self._lock:
+            changes, replaced = self.changes.read_new()
+            if replaced:
+                logger.logger.info("Change log of %s was compacted, reloading index.", self.path)
+                self.load()
+                return
+            data = self.data
+            for change in changes:
+                changed = self.apply(data, change)
+                if changed is not None:
+                    for listener in self.change_listeners:
+                        listener(*changed)
+                    # Counted once the listeners dropped the cached results of the person, so a
+                    # response with the new version never has the old handle
+                    key = changed[1]
+                    self.generations[key] = self.generations.get(key, 0) + 1
+
+    def compact(self):
+        """
+        Method to merge the change log into the data file if it grew over compact_size bytes.
+        Only one process compacts it; the others reload the data file once it is replaced.
+        """
+        if not self.compact_size or self.changes.size() < self.compact_size:
+            return
+        with self.changes.locked():
+            if self.changes.size() < self.compact_size:
+                return
+            changed = self.changes.compact(self.path, self.compactor)
+        logger.logger.info("Compacted %s changes into %s.", changed, self.path)
+
+    def get_data(self):
+        """
+        Method to get the indexed data, loading it if it was not loaded yet.
+        :return: The indexed data.
+        """
+        data = self.data
+        if data is None:
+            with self._lock:
+                data = self.data if self.data is not None else self.load()
+        return data
+
+    def lookup(self, social_network, key):
+        """
+        Method to look up the handle of a person in a social network.
+        :param social_network: the social network to search in.
+        :param key: the normalized full name of the person.
+        :return: The handle of the person or None if it is not in the index.
+        """
+        return self.get_data().get(social_network, {}).get(key)
+
+    def start(self):
+        """
+        Method to load the index and start watching the data file for changes.
+        """
+        self.get_data()
+        if self._watcher is None:
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self.watch, name=f"DataIndex({self.path})", daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        """
+        Method to stop watching the data file.
+        """
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def watch(self):
+        """
+        Method run by the watcher thread, reloads the index when the data file changes and
+        applies and compacts the change log.
+        """
+        while not self._stop.wait(self.interval):
+            try:
+                if self.stat() != self.version:
+                    logger.logger.info("Data file %s changed, reloading index.", self.path)
+                    self.load()
+                if self.changes is not None:
+                    self.poll()
+                    self.compact()
+            except (OSError, ValueError) as e:
+                logger.logger.error("Could not reload index for %s: %s", self.path, e)
@@ -1,15 +1,156 @@
 """
 Logger module that provides a shared logger instance for the project.
 """
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
 
 logging.basicConfig(level=logging.INFO)
 
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler class that puts the records in a bounded queue without blocking, so the
+    thread that logs never waits for the output. The records are formatted by the writer
+    thread; when the queue is full they are dropped and counted.
+
+    Attributes:
+        dropped (int): Number of records dropped because the queue was full.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SamplingFilter(logging.Filter):
+    """
+    SamplingFilter class that keeps one of every n records of each event type, and at most
+    rate_limit records of each event type per second. The event type of a record is its
+    message template, so the messages must be formatted lazily (logger.info("... %s", value)).
+    Warnings and errors are always kept.
+
+    Attributes:
+        every (int): Keep one of every every records of each event type.
+        rate_limit (int): Maximum records of each event type per second, 0 for no limit.
+        suppressed (int): Number of records dropped by the filter.
+    """
+
+    def __init__(self, sample_rate=1.0, rate_limit=0):
+        super().__init__()
+        self.every = max(1, round(1 / sample_rate)) if sample_rate > 0 else 0
+        self.rate_limit = rate_limit
+        self.suppressed = 0
+        self.events = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        with self.lock:
+            state = self.events.get(record.msg)
+            if state is None:
+                state = self.events[record.msg] = [0, 0.0, 0]
+            state[0] += 1
+            keep = self.every > 0 and (state[0] - 1) % self.every == 0
+            if keep and self.rate_limit:
+                now = time.monotonic()
+                if now - state[1] >= 1:
+                    state[1], state[2] = now, 0
+                keep = state[2] < self.rate_limit
+                state[2] += keep
+            self.suppressed += not keep
+            return keep
+
+
 class Logger:
     """
     Logger class that provides a shared logger instance for the project.
+
+    By default the records are written synchronously to stderr. configure can move the
+    writing to a background thread, sample the records and enable the access logs.
+
+    Attributes:
+        logger (Logger): The logger of the project.
+        access (Logger): The logger of the access logs, one line per request.
+        access_enabled (bool): True if the access logs are written.
+        handler (QueueHandler): The handler that queues the records, None if they are written synchronously.
+        listener (QueueListener): The background thread that writes the queued records.
+        sampling (SamplingFilter): The filter that samples the records, None if every record is kept.
     """
     def __init__(self):
         self.logger = logging.getLogger(__name__)
+        self.access = logging.getLogger(f"{__name__}.access")
+        self.access_enabled = False
+        self.handler = None
+        self.listener = None
+        self.sampling = None
+
+    def configure(self, config):
+        """
+        Method to set up the logging from the settings of a server.
+        :param config: the configuration, with the log_* settings.
+        """
+        logging.getLogger().setLevel(config.log_level.upper())
+        self.access_enabled = config.log_access
+        if self.sampling is not None:
+            self.logger.removeFilter(self.sampling)
+            self.sampling = None
+        if config.log_sample_rate < 1 or config.log_rate_limit:
+            self.sampling = SamplingFilter(config.log_sample_rate, config.log_rate_limit)
+            self.logger.addFilter(self.sampling)
+        if config.log_async and self.handler is None:
+            root = logging.getLogger()
+            output = root.handlers or [logging.StreamHandler(sys.stderr)]
+            self.handler = QueueHandler(queue.Queue(config.log_queue_size))
+            root.handlers = [self.handler]
+            self.listener = logging.handlers.QueueListener(self.handler.queue, *output, respect_handler_level=True)
+            self.listener.start()
+            atexit.register(self.stop)
+            os.register_at_fork(after_in_child=self.restart)
+
+    def restart(self):
+        """
+        Method to start again the writer thread in a child process, since threads do not survive fork.
+        """
+        if self.listener is not None:
+            self.handler.queue = queue.Queue(self.handler.queue.maxsize)
+            self.listener = logging.handlers.QueueListener(self.handler.queue, *self.listener.handlers,
+                                                           respect_handler_level=True)
+            self.listener.start()
+
+    def stop(self):
+        """
+        Method to write the queued records and stop the writer thread.
+        """
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+
+    def log_access(self, server, addr, request, status, size, duration):
+        """
+        Method to write the access log line of a request, if the access logs are enabled.
+        :param server: the name of the server.
+        :param addr: the address of the client.
+        :param request: the request.
+        :param status: the status code of the response.
+        :param size: the bytes sent in the response.
+        :param duration: the seconds the request took.
+        """
+        if self.access_enabled:
+            self.access.info('server=%s client=%s:%s method=%s path="%s" status=%s bytes=%s duration_ms=%.3f',
+                             server, addr[0], addr[1], request.method, request.path, status, size, duration * 1000)
 
-logger = Logger()
\ No newline at end of file
+logger = Logger()
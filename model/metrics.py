@@ -0,0 +1,201 @@
+"""
+Metrics module with the counters, latency histograms and gauges of a server, exposed in
+the Prometheus text format.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def format_labels(labels):
+    """
+    Function to format the labels of a sample.
+    :param labels: tuple of (name, value) pairs.
+    :return: The labels between braces, empty if there are none.
+    """
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Histogram:
+    """
+    Histogram class that counts the observed values in cumulative buckets.
+
+    Attributes:
+        buckets (tuple): The upper bounds of the buckets.
+        counts (list): The number of values of each bucket, plus the values over the last bound.
+        sum (float): The sum of the observed values.
+        count (int): The number of observed values.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        """
+        Method to count a value.
+        :param value: the value.
+        """
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self, name, labels):
+        """
+        Method to get the samples of the histogram in the Prometheus text format.
+        :param name: the name of the metric.
+        :param labels: the labels of the histogram.
+        :return: list of lines.
+        """
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+        lines.append(f"{name}_sum{format_labels(labels)} {total}")
+        lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return lines
+
+
+class Metrics:
+    """
+    Metrics class with the metrics of a server. Counters and histograms are created the
+    first time they are used; gauges are functions called when the metrics are read. When
+    it is disabled, counting and observing return right away, so the cost of the
+    instrumentation can be measured by comparing both modes.
+
+    Attributes:
+        enabled (bool): True to record the metrics.
+        counters (dict): The value of each counter, by name and labels.
+        histograms (dict): Each histogram, by name and labels.
+        gauges (list): The (name, function) of each gauge. The function returns a number,
+            or a dict of numbers by labels.
+        descriptions (dict): The type and help text of each metric.
+        stages (dict): The histogram of each stage of the requests, by stage name, so
+            recording a stage does not build and hash its labels.
+        tracer (Tracer): The tracer of the server, where the stages of the traced requests
+            are added as spans, None if the requests are not traced.
+    """
+
+    def __init__(self, enabled=True, tracer=None):
+        self.enabled = enabled
+        self.tracer = tracer
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = []
+        self.descriptions = {}
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.describe("stage_seconds", "histogram", "Seconds spent in each stage of the requests.")
+        self.describe("requests_total", "counter", "Requests handled, by route.")
+
+    def describe(self, name, metric_type, help_text):
+        """
+        Method to set the type and help text of a metric.
+        :param name: the name of the metric.
+        :param metric_type: counter, gauge or histogram.
+        :param help_text: the description of the metric.
+        """
+        self.descriptions[name] = (metric_type, help_text)
+
+    def inc(self, name, labels=(), amount=1):
+        """
+        Method to increase a counter.
+        :param name: the name of the counter.
+        :param labels: tuple of (name, value) pairs.
+        :param amount: the amount to add.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name, labels] = self.counters.get((name, labels), 0) + amount
+
+    def observe(self, name, value, labels=()):
+        """
+        Method to add a value to a histogram.
+        :param name: the name of the histogram.
+        :param value: the value.
+        :param labels: tuple of (name, value) pairs.
+        """
+        if not self.enabled:
+            return
+        self.histogram(name, labels).observe(value)
+
+    def histogram(self, name, labels=()):
+        """
+        Method to get a histogram, created the first time it is used.
+        :param name: the name of the histogram.
+        :param labels: tuple of (name, value) pairs.
+        :return: The histogram.
+        """
+        histogram = self.histograms.get((name, labels))
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault((name, labels), Histogram())
+        return histogram
+
+    def stage(self, stage, start):
+        """
+        Method to record the latency of a stage of a request, measured with time.perf_counter.
+        :param stage: the name of the stage.
+        :param start: the time the stage started, None if it is unknown.
+        :return: The current time, the start of the next stage.
+        """
+        now = time.perf_counter()
+        if start is None:
+            return now
+        if self.enabled:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = self.histogram("stage_seconds", (("stage", stage),))
+            histogram.observe(now - start)
+        if self.tracer is not None and self.tracer.active:
+            self.tracer.span(stage, start, now)
+        return now
+
+    def gauge(self, name, help_text, function, metric_type="gauge"):
+        """
+        Method to register a gauge, or a counter kept by another object.
+        :param name: the name of the gauge.
+        :param help_text: the description of the gauge.
+        :param function: function that returns the value, or a dict of values by labels.
+        :param metric_type: the type of the metric, gauge or counter.
+        """
+        self.describe(name, metric_type, help_text)
+        self.gauges.append((name, function))
+
+    def render(self):
+        """
+        Method to get every metric in the Prometheus text format.
+        :return: The metrics as a string.
+        """
+        samples = {}
+        with self.lock:
+            counters = list(self.counters.items())
+            histograms = list(self.histograms.items())
+        for (name, labels), value in counters:
+            samples.setdefault(name, []).append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            samples.setdefault(name, []).extend(histogram.samples(name, labels))
+        for name, function in self.gauges:
+            value = function()
+            values = value if isinstance(value, dict) else {(): value}
+            samples.setdefault(name, []).extend(f"{name}{format_labels(labels)} {value}" for labels, value in values.items())
+        lines = []
+        for name, metric_samples in samples.items():
+            metric_type, help_text = self.descriptions.get(name, ("untyped", ""))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(metric_samples)
+        return "\n".join(lines) + "\n"
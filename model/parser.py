@@ -1,6 +1,16 @@
 """
 Parser that will read the input file and return the data in a structured format.
 """
+import csv
+import io
+import os
+import time
+
+from model.logger import logger
+from model.query import normalize_key
+
+CHUNK_SIZE = 1 << 20
+PROGRESS_ROWS = 1000000
 
 class Parser:
     """
@@ -8,12 +18,21 @@ class Parser:
 
     Attributes:
         filename (str): The name of the file to read.
-        data (str): The data read from the file.
+        data (str): The data read from the file, None when streaming.
+        stream (bool): True to read the file in buffered chunks while parsing it, instead
+            of reading it all at once.
+        key_filter (function): Function of a normalized key that returns True for the rows
+            to keep, e.g. the people of a shard. None to keep every row.
+        network_filter (function): Function of a social network that returns True for the rows
+            to keep, e.g. the social networks served by the server. None to keep every row.
     """
 
-    def __init__(self, filename):
+    def __init__(self, filename, stream=False, key_filter=None, network_filter=None):
         self.filename = filename
-        self.data = self.read_file()
+        self.stream = stream
+        self.key_filter = key_filter
+        self.network_filter = network_filter
+        self.data = None if stream else self.read_file()
 
     def read_file(self):
         """
@@ -42,16 +61,83 @@ class CSVParser(Parser):
         Method to parse the data read from the CSV file and return it in a structured format.
         :return: The parsed data.
         """
-        data = self.data.split("\n")
         parsed_data = {}
-        for line in data:
-            line = line.split(",")
-            social_network_handler = line[-1]
-            social_network = line[-2]
-            last_names = [line[-4], line[-3]]
-            names = line[:-4]
-            full_name = tuple(names + last_names)
+        for social_network, full_name, social_network_handler in self.iter_rows():
             if social_network not in parsed_data:
                 parsed_data[social_network] = {}
-            parsed_data[social_network][tuple(map(lambda x: x.lower(), full_name))] = social_network_handler
-        return parsed_data
\ No newline at end of file
+            parsed_data[social_network][full_name] = social_network_handler
+        return parsed_data
+
+    def iter_rows(self):
+        """
+        Method to iterate over the rows of the CSV file without building the whole structure.
+        When streaming, the file is read in buffered chunks as the rows are consumed, so
+        memory does not grow with the size of the file. Otherwise the raw data is released
+        once it has been read.
+        :return: Generator of (social network, normalized full name, handle) tuples.
+        """
+        if self.data is None:
+            with open(self.filename, "r", newline="", buffering=CHUNK_SIZE) as f:
+                yield from self.parse_rows(f)
+        else:
+            data, self.data = self.data, None
+            yield from self.parse_rows(io.StringIO(data, newline=""))
+
+    def parse_rows(self, lines):
+        """
+        Method to parse CSV lines, with support for quoted fields (e.g. names with commas).
+        Every row has the names (one or more fields), the last names, the social network
+        and the handle. Blank and incomplete rows, and the rows rejected by key_filter or
+        network_filter, are skipped.
+        :param lines: iterable of the lines of the file.
+        :return: Generator of (social network, normalized full name, handle) tuples.
+        """
+        start = time.perf_counter()
+        rows = 0
+        for line_number, row in enumerate(csv.reader(lines), 1):
+            if len(row) < 4:
+                if any(field.strip() for field in row):
+                    logger.logger.info("Skipping incomplete row %s of %s.", line_number, self.filename)
+                continue
+            social_network_handler = row[-1].strip()
+            social_network = row[-2]
+            last_names = row[-3]
+            names = row[:-3]
+            rows += 1
+            if self.network_filter is None or self.network_filter(social_network):
+                key = normalize_key(names, last_names)
+                if self.key_filter is None or self.key_filter(key):
+                    yield social_network, key, social_network_handler
+            if rows % PROGRESS_ROWS == 0:
+                elapsed = time.perf_counter() - start
+                logger.logger.info("Parsed %s rows of %s (%.0f rows/s).", rows, self.filename, rows / elapsed)
+        elapsed = time.perf_counter() - start
+        logger.logger.info("Parsed %s rows of %s in %.2fs (%.0f rows/s).", rows, self.filename, elapsed, rows / elapsed if elapsed else 0)
+
+    def rewrite(self, changes):
+        """
+        Method to rewrite the CSV file with some people changed, keeping the other rows as
+        they are. The changed people are written in place of their first row (and their
+        other rows dropped), and the people not in the file are added at the end. The file
+        is written next to the original and then renamed.
+        :param changes: the changes (see model.changelog), by social network and normalized full name.
+        """
+        pending = dict(changes)
+        temporary_path = f"{self.filename}.tmp"
+        with open(self.filename, "r", newline="", buffering=CHUNK_SIZE) as source, \
+                open(temporary_path, "w", newline="", buffering=CHUNK_SIZE) as target:
+            writer = csv.writer(target, lineterminator="\n")
+            for row in csv.reader(source):
+                if len(row) >= 4:
+                    change_key = row[-2], normalize_key(row[:-3], row[-3])
+                    if change_key in changes:
+                        change = pending.pop(change_key, None)
+                        if change is not None and change["handle"] is not None:
+                            writer.writerow(row[:-1] + [change["handle"]])
+                        continue
+                writer.writerow(row)
+            for change in pending.values():
+                if change["handle"] is not None:
+                    writer.writerow([" ".join(change["names"]), " ".join(change["last_names"]), change["network"],
+                                     change["handle"]])
+        os.replace(temporary_path, self.filename)
@@ -0,0 +1,171 @@
+"""
+Pool module that keeps persistent connections to the linked servers so they can be
+reused by several requests instead of opening a new connection for each one.
+"""
+import select
+import socket
+import threading
+import time
+
+from model.http import HttpConnection, HttpError
+from model.logger import logger
+
+
+class RequestNotSentError(ConnectionError):
+    """
+    Exception raised when a request was not sent because no connection to the server could be
+    opened or taken from the pool, so sending it again cannot apply it twice.
+    """
+
+
+class ConnectionPool:
+    """
+    ConnectionPool class that keeps up to size open keep-alive connections to a server.
+    Idle connections are reused most recently used first, and are checked before being
+    reused: connections idle for more than idle_timeout or closed by the server are dropped.
+    It is safe to use from several threads.
+
+    Attributes:
+        host (str): The host of the server.
+        port (int): The port of the server.
+        size (int): The maximum number of open connections.
+        timeout (float): Seconds to wait for a connection and for each read from the server.
+        idle_timeout (float): Seconds a connection can stay idle before it is dropped.
+        open_connections (int): Number of open connections, idle or in use.
+    """
+
+    def __init__(self, host, port, size=8, timeout=5.0, idle_timeout=30.0):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.open_connections = 0
+        self._idle = []
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout=None):
+        """
+        Method to get a connection, reusing an idle one or opening a new one if the pool is
+        not full. Otherwise waits up to timeout seconds for a connection to be released.
+        :param timeout: seconds to wait, at most the timeout of the pool. None for the timeout of the pool.
+        :return: tuple with the connection and True if it was reused.
+        """
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                while self._idle:
+                    conn, last_used = self._idle.pop()
+                    if self.is_healthy(conn, last_used):
+                        return conn, True
+                    conn.close()
+                    self.open_connections -= 1
+                if self.open_connections < self.size:
+                    self.open_connections += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RequestNotSentError(f"No connection to {self.host}:{self.port} available.")
+                self._condition.wait(remaining)
+        try:
+            return HttpConnection(socket.create_connection((self.host, self.port), timeout=timeout)), False
+        except OSError as e:
+            self.discard(None)
+            raise RequestNotSentError(f"Could not connect to {self.host}:{self.port}: {e}") from e
+
+    def release(self, conn):
+        """
+        Method to give back a connection that can be reused.
+        :param conn: the connection.
+        """
+        with self._condition:
+            self._idle.append((conn, time.monotonic()))
+            self._condition.notify()
+
+    def discard(self, conn):
+        """
+        Method to close a connection that cannot be reused.
+        :param conn: the connection, None if it could not be opened.
+        """
+        if conn is not None:
+            conn.close()
+        with self._condition:
+            self.open_connections -= 1
+            self._condition.notify()
+
+    def is_healthy(self, conn, last_used):
+        """
+        Method to check if an idle connection can be reused. A connection that is readable
+        while idle was closed (or sent unexpected data) and cannot be reused.
+        :param conn: the connection.
+        :param last_used: the time the connection was released.
+        :return: True if the connection can be reused.
+        """
+        if time.monotonic() - last_used > self.idle_timeout or conn.pending():
+            return False
+        try:
+            readable, _, _ = select.select([conn], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+    def request(self, request, timeout=None, idempotent=True):
+        """
+        Method to send a request and read its response using a connection of the pool.
+        If a reused connection fails, the request is sent again on a new connection,
+        since the server may have closed it while idle. A request that is not idempotent is
+        only sent again if the connection failed while sending it, as the server may have
+        applied it before failing.
+        :param request: the request as bytes.
+        :param timeout: seconds to wait for a connection and for each read of the response,
+            at most the timeout of the pool. None for the timeout of the pool.
+        :param idempotent: False if the request must not be applied twice, e.g. a mutation.
+        :return: The response.
+        """
+        deadline = time.monotonic() + (self.timeout if timeout is None else min(timeout, self.timeout))
+        while True:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                raise TimeoutError(f"No response from {self.host}:{self.port} in time.")
+            conn, reused = self.acquire(timeout)
+            sent = False
+            try:
+                conn.settimeout(timeout)
+                conn.sendall(request)
+                sent = True
+                response = conn.read_response()
+            except (OSError, HttpError) as e:
+                self.discard(conn)
+                if reused and (idempotent or not sent):
+                    logger.logger.info("Reused connection to %s:%s failed (%s), retrying.", self.host, self.port, e)
+                    continue
+                raise
+            if response.keep_alive:
+                self.release(conn)
+            else:
+                self.discard(conn)
+            return response
+
+    def close(self):
+        """
+        Method to close the idle connections.
+        """
+        with self._condition:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                conn.close()
+                self.open_connections -= 1
+
+    def stats(self):
+        """
+        Method to get the usage of the pool.
+        :return: dict with the size, open, idle and in use connections.
+        """
+        with self._condition:
+            return {
+                "size": self.size,
+                "open": self.open_connections,
+                "idle": len(self._idle),
+                "in_use": self.open_connections - len(self._idle),
+            }
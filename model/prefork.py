@@ -0,0 +1,204 @@
+"""
+Prefork module that runs a server in several worker processes, so it is not limited to
+one core by the GIL.
+"""
+import gc
+import os
+import select
+import signal
+import socket
+import sys
+import time
+
+from model.concurrency import get_dispatcher
+from model.logger import logger
+
+RESTART_DELAY = 1.0
+
+
+class Prefork:
+    """
+    Prefork class that loads the index of a server once and forks worker processes that
+    serve its port. The workers either share the listening socket of the parent or bind
+    their own with SO_REUSEPORT, so the kernel spreads the connections between them. The
+    index is loaded before forking, so the workers share its memory copy-on-write (or the
+    page cache, for an .idx file). The parent restarts the workers that exit and, when it
+    receives SIGTERM or SIGINT, asks them to finish their requests before stopping. The
+    debugging signals (SIGUSR1 and SIGUSR2) are forwarded to every worker. With SO_REUSEPORT,
+    the parent only tells the supervisor that the server is ready once every worker has
+    bound its socket.
+
+    Attributes:
+        server (HttpServer): The server run by the workers.
+        processes (int): The number of worker processes.
+        reuse_port (bool): True for each worker to bind its own socket with SO_REUSEPORT.
+        drain_timeout (float): Seconds a worker has to finish its requests when stopped.
+        workers (dict): The number and start time of each worker, by process id.
+        stopping (bool): True once the parent was asked to stop.
+        bound (tuple): The read and write ends of the pipe where the workers report that they
+            bound their socket, while the parent waits for them; None otherwise.
+    """
+
+    def __init__(self, server, processes, reuse_port=False, drain_timeout=10.0):
+        if not hasattr(os, "fork"):
+            raise ValueError("Worker processes need os.fork, which is not available on this platform.")
+        if reuse_port and not hasattr(socket, "SO_REUSEPORT"):
+            raise ValueError("SO_REUSEPORT is not available on this platform.")
+        self.server = server
+        self.processes = processes
+        self.reuse_port = reuse_port
+        self.drain_timeout = drain_timeout
+        self.workers = {}
+        self.stopping = False
+        self.bound = None
+
+    def run(self):
+        """
+        Method to start the workers and supervise them until the parent is stopped.
+        """
+        listener = None if self.reuse_port else self.server.listen()
+        self.server.index.get_data()
+        # Keep the garbage collector from writing to the objects of the index in the workers.
+        gc.freeze()
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGUSR1, self.forward)
+        signal.signal(signal.SIGUSR2, self.forward)
+        if listener is None:
+            self.bound = os.pipe()
+        for number in range(self.processes):
+            self.spawn(number, listener)
+        if self.bound is not None:
+            self.wait_bound(listener)
+        self.server.notify_ready()
+        while not self.stopping:
+            self.reap(listener)
+            time.sleep(0.2)
+        self.shutdown()
+        if listener is not None:
+            listener.close()
+
+    def wait_bound(self, listener):
+        """
+        Method to wait until every worker has bound its socket, restarting the ones that exit.
+        :param listener: the listening socket shared with the workers.
+        """
+        read_end, write_end = self.bound
+        bound = 0
+        while bound < self.processes and not self.stopping:
+            if select.select([read_end], [], [], 0.2)[0]:
+                bound += len(os.read(read_end, self.processes))
+            self.reap(listener)
+        self.bound = None
+        os.close(read_end)
+        os.close(write_end)
+        logger.logger.info("%s: %s workers listening.", self.server.name, bound)
+
+    def stop(self, signum=None, frame=None):
+        """
+        Method to ask the parent to stop, used as its signal handler.
+        """
+        self.stopping = True
+
+    def forward(self, signum, frame=None):
+        """
+        Method to send a debugging signal (see HttpServer.handle_signal) to every worker, used
+        as the signal handler of the parent.
+        """
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def spawn(self, number, listener):
+        """
+        Method to fork a worker process.
+        :param number: the number of the worker, used in the logs.
+        :param listener: the listening socket to share, None to bind a new one with SO_REUSEPORT.
+        """
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = (number, time.monotonic())
+            return
+        status = 0
+        try:
+            self.work(number, listener)
+        except BaseException as e:
+            logger.logger.exception("%s-%s: Worker failed: %r", self.server.name, number, e)
+            status = 1
+        finally:
+            logger.stop()
+            sys.stderr.flush()
+            os._exit(status)
+
+    def work(self, number, listener):
+        """
+        Method run by a worker process: serves the port until it receives SIGTERM, then
+        waits for the requests being handled.
+        :param number: the number of the worker.
+        :param listener: the listening socket to share, None to bind a new one with SO_REUSEPORT.
+        """
+        name = f"{self.server.name}-{number}"
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        # Only the parent tells the supervisor that the server is ready
+        ready_fd = os.environ.pop("READY_FD", None)
+        if ready_fd is not None:
+            os.close(int(ready_fd))
+        if listener is None:
+            listener = self.server.listen(reuse_port=True)
+        if self.bound is not None:
+            read_end, write_end = self.bound
+            os.write(write_end, b"\0")
+            os.close(read_end)
+            os.close(write_end)
+        dispatcher = get_dispatcher(self.server.handle_connection, self.server.config, name)
+        self.server.dispatcher = dispatcher
+        signal.signal(signal.SIGTERM, lambda signum, frame: dispatcher.stop())
+        signal.signal(signal.SIGUSR1, self.server.handle_signal)
+        signal.signal(signal.SIGUSR2, self.server.handle_signal)
+        # Threads do not survive fork, so the watcher of the index is started in each worker.
+        self.server.index.start()
+        logger.logger.info("%s: Worker started (pid %s).", name, os.getpid())
+        dispatcher.serve(listener)
+        logger.logger.info("%s: Draining connections.", name)
+        if not dispatcher.join(self.drain_timeout):
+            logger.logger.warning("%s: Connections still open after %ss, closing them.", name, self.drain_timeout)
+
+    def reap(self, listener):
+        """
+        Method to collect the workers that exited, restarting them unless the parent is stopping.
+        A worker that exits right after starting is restarted after a delay, so a worker that
+        cannot start does not fork in a loop.
+        :param listener: the listening socket shared with the workers.
+        """
+        while self.workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            number, started = self.workers.pop(pid)
+            if self.stopping:
+                continue
+            logger.logger.error("%s-%s: Worker (pid %s) exited with code %s, restarting it.", self.server.name, number,
+                                pid, os.waitstatus_to_exitcode(status))
+            if time.monotonic() - started < RESTART_DELAY:
+                time.sleep(RESTART_DELAY)
+            self.spawn(number, listener)
+
+    def shutdown(self):
+        """
+        Method to stop the workers, giving them drain_timeout seconds to finish their requests
+        before killing them.
+        """
+        logger.logger.info("%s: Stopping %s workers.", self.server.name, len(self.workers))
+        for pid in self.workers:
+            os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.drain_timeout + 1
+        while self.workers and time.monotonic() < deadline:
+            self.reap(None)
+            time.sleep(0.1)
+        for pid in self.workers:
+            logger.logger.warning("%s: Killing worker (pid %s).", self.server.name, pid)
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.workers.clear()
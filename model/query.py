@@ -2,6 +2,62 @@
 This module contains the Query class. This class is used to store the information
 about the query to be made to the social networks.
 """
+import unicodedata
+from urllib.parse import unquote, unquote_to_bytes
+
+
+def normalize_text(text):
+    """
+    Function to normalize a text for the comparison of names: case folded, without accents
+    (e.g. "José" -> "jose") and with the words separated by single spaces.
+    :param text: the text.
+    :return: The normalized text.
+    """
+    if not text.isascii():
+        text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return " ".join(text.split()).casefold()
+
+def normalize_key(names, last_name):
+    """
+    Function to build the normalized full name used as key of the data index.
+    :param names: the names of the person, a string or a list of strings.
+    :param last_name: the last names of the person, a string or a list of strings.
+    :return: tuple with the normalized names and last names (see normalize_text).
+    """
+    if isinstance(names, str):
+        names = [names]
+    if isinstance(last_name, str):
+        last_name = [last_name]
+    return normalize_text(" ".join(names)), normalize_text(" ".join(last_name))
+
+def decode_path(path):
+    """
+    Function to decode a path, percent-encoded or not. The head of a request is read as
+    ISO-8859-1, so its UTF-8 bytes are decoded again, and "Jos%C3%A9" and "José" are the
+    same name. A path that is not UTF-8 (e.g. one already decoded) is only unquoted.
+    :param path: the path, or a part of it.
+    :return: The decoded path.
+    """
+    if path.isascii() and "%" not in path:
+        return path
+    try:
+        return unquote_to_bytes(path.encode("iso-8859-1")).decode("utf-8")
+    except UnicodeError:
+        return unquote(path)
+
+def split_query_path(path):
+    """
+    Function to split the path of a query in its social network, names and last names. The
+    parts are only decoded one by one when the path is percent-encoded or not ASCII. The query
+    string, if any, is not part of the names.
+    :param path: the path without the leading slash, e.g. instagram/Pedro/Pablo/Perez/Pereira.
+    :return: tuple with the social network, the list of names and the tuple of last names.
+    """
+    path = path.partition("?")[0]
+    parts = path.split("/")
+    if not path.isascii() or "%" in path:
+        parts = [decode_path(part) for part in parts]
+    return parts[0], parts[1:-2], (parts[-2], parts[-1])
 
 class Query:
     """
@@ -12,36 +68,28 @@ class Query:
         social_network (str): The social network to search for.
         names (str): The first name of the person to search for.
         last_name (str): The last name of the person to search
+        key (tuple): The normalized full name of the person, used to search in the data,
+            computed once when the query is built.
     """
+    __slots__ = ("social_network", "names", "last_name", "key")
 
     def __init__(self, social_network, names, last_name):
         self.social_network = social_network
         self.names = names
         self.last_name = last_name
+        self.key = normalize_key(names, last_name)
 
     def __str__(self):
         return f"{self.social_network}: {self.names} {self.last_name}"
 
-class HttpQuery(Query):
-    """
-    HttpQuery class that extends Query class and provides a specific
-    query for HTTP requests. This will be later used to differentiate
-    between the different social networks.
-    """
-
-    def __init__(self, query):
-        query = query.split("/")
-        social_network = query[0]
-        last_names = (query[-2], query[-1])
-        names = query[1:-2]
-        super().__init__(social_network, names, last_names)
-
 class InstagramQuery(Query):
     """
     InstagramQuery class that extends Query class and provides a specific
     query for Instagram requests.
     """
 
+    __slots__ = ()
+
     def __init__(self, names, last_name):
         super().__init__("instagram", names, last_name)
 
@@ -51,6 +99,8 @@ class WhatsAppQuery(Query):
     query for WhatsApp requests.
     """
 
+    __slots__ = ()
+
     def __init__(self, names, last_name):
         super().__init__("whatsapp", names, last_name)
 
@@ -60,5 +110,25 @@ class AllQuery(Query):
     query for all social networks requests.
     """
 
+    __slots__ = ()
+
     def __init__(self, names, last_name):
-        super().__init__("all", names, last_name)
\ No newline at end of file
+        super().__init__("all", names, last_name)
+
+def make_query(social_network, names, last_name):
+    """
+    Function to build the query of the class that corresponds to the social network.
+    :param social_network: the social network to search for.
+    :param names: the names of the person to search for.
+    :param last_name: the last names of the person to search for.
+    :return: The query object.
+    """
+    match social_network:
+        case "instagram":
+            return InstagramQuery(names, last_name)
+        case "whatsapp":
+            return WhatsAppQuery(names, last_name)
+        case "all":
+            return AllQuery(names, last_name)
+        case _:
+            return Query(social_network, names, last_name)
@@ -1,10 +1,19 @@
 """
 
 """
+from model.cache import ResponseCache
+from model.http import EncodedResponses, HttpError, build_response, make_etag
+from model.index import DataIndex
 from model.logger import logger
+from model.metrics import Metrics
+from model.singleflight import SingleFlight
 from model.parser import CSVParser
-from model.query import HttpQuery, InstagramQuery, WhatsAppQuery, AllQuery, Query
+from model.query import InstagramQuery, WhatsAppQuery, decode_path, make_query, split_query_path
+from model.search import MAX_LIMIT, SearchIndex
+from model.store import CompactStore
 
+import json
+import time
 import pathlib
 
 class RequestHandler:
@@ -13,28 +22,95 @@ class RequestHandler:
 
     Attributes:
         path (str): The path to the data file.
+        index (DataIndex): The in-memory index of the data file, shared with the server.
     """
-    def __init__(self, path):
+    def __init__(self, path, index=None):
         self.path = path
+        self.index = index if index is not None else DataIndex(path, RequestHandler.load_data)
 
-
-    def get_data(self):
+    @staticmethod
+    def load_data(path, store="dict", key_filter=None, network_filter=None):
         """
-        Method to get the data from the file.
+        Method to read and parse the data file, used by the index to (re)build itself.
+        :param path: the path to the data file.
+        :param store: how the data of a .csv file is kept in memory: "dict" or "compact"
+            (see model.store). An .idx file is always mapped as a compact store.
+        :param key_filter: function of a normalized key that returns True for the people to
+            load, e.g. the slice of a shard. None to load everyone. An .idx file is mapped
+            whole, so only the pages of the people that are looked up are read into memory,
+            unless it has a key filter: its people are then copied into a compact store.
+        :param network_filter: function of a social network that returns True for the social
+            networks to load, e.g. the ones served by the server. None to load every one.
         :return: The parsed data.
         """
-        extension = pathlib.Path(self.path).suffix
+        extension = pathlib.Path(path).suffix
         match extension:
+            case ".csv" if store == "compact":
+                return CompactStore.from_rows(CSVParser(path, stream=True, key_filter=key_filter,
+                                                        network_filter=network_filter).iter_rows())
             case ".csv":
-                return CSVParser(self.path).parse_data()
+                return CSVParser(path, stream=True, key_filter=key_filter, network_filter=network_filter).parse_data()
+            case ".idx":
+                data = CompactStore.from_file(path)
+                if network_filter is not None:
+                    for social_network in [social_network for social_network in data if not network_filter(social_network)]:
+                        del data[social_network]
+                if key_filter is not None:
+                    data = CompactStore.from_rows((social_network, key, handle) for social_network, table in data.items()
+                                                  for key, handle in table.items() if key_filter(key))
+                return data
             case _:
-                raise ValueError("Invalid file extension. Only .csv files are supported.")
+                raise ValueError("Invalid file extension. Only .csv and .idx files are supported.")
 
-    def handle_request(self, conn, addr):
+    @staticmethod
+    def compact_data(path, changes):
+        """
+        Method to rewrite the data file with the changes of the change log, used by the index
+        to compact the log.
+        :param path: the path to the data file.
+        :param changes: the changes (see model.changelog), by social network and normalized full name.
+        """
+        extension = pathlib.Path(path).suffix
+        match extension:
+            case ".csv":
+                CSVParser(path, stream=True).rewrite(changes)
+            case ".idx":
+                store = CompactStore.from_file(path)
+                rows = [(social_network, key, handle) for social_network, table in store.items()
+                        for key, handle in table.items() if (social_network, key) not in changes]
+                rows += [(social_network, key, change["handle"]) for (social_network, key), change in changes.items()
+                         if change["handle"] is not None]
+                CompactStore.from_rows(rows).write(path)
+            case _:
+                raise ValueError("Invalid file extension. Only .csv and .idx files are supported.")
+
+    def get_data(self):
+        """
+        Method to get the data from the in-memory index.
+        :return: The parsed data.
+        """
+        return self.index.get_data()
+
+    @staticmethod
+    def parse_parameters(path):
+        """
+        Method to parse the parameters of the query string of a path.
+        :param path: the path, e.g. /search?q=pedro+perez&limit=5.
+        :return: dict with the decoded value of each parameter.
+        """
+        parameters = {}
+        for pair in path.partition("?")[2].split("&"):
+            name, _, value = pair.partition("=")
+            if name:
+                parameters[decode_path(name)] = decode_path(value.replace("+", " "))
+        return parameters
+
+    def handle_request(self, request, conn, addr):
         """
         Method to handle the request received by the server.
 
         Args:
+            request (HttpRequest): The request read from the connection.
             conn (socket): The connection object.
             addr (tuple): The address of the client.
         """
@@ -46,45 +122,58 @@ class HttpRequestHandler(RequestHandler):
     request handler for HTTP requests.
     """
 
-    def handle_request(self, conn, addr):
+    def handle_request(self, request, conn, addr):
         """
         Method to handle the request received by the server.
 
         Args:
+            request (HttpRequest): The request read from the connection.
             conn (socket): The connection object.
             addr (tuple): The address of the client.
         """
-        request = conn.recv(1024).decode()
-        request = request.split("\r\n")
-        first_line = request[0]
-        method, path, protocol = first_line.split(" ")
-        if method == "GET":
-            if path == "/":
-                conn.sendall(b"""HTTP/1.1 200 OK\r\n\r\n""")
+        if request.method == "GET":
+            if request.path == "/":
+                conn.sendall(build_response(200))
+                return None
+            if request.path.count("/") < 3:
+                conn.sendall(build_response(400))
                 return None
-            query = HttpQuery(path[1:])
-            return self.handle_query(query, conn, addr)
+            return make_query(*split_query_path(request.path[1:]))
         else:
-            conn.sendall(b"""HTTP/1.1 405 Method Not Allowed\r\n\r\n""")
+            conn.sendall(build_response(405))
             return None
 
-    def handle_query(self, query, conn, addr):
+    def parse_mutation(self, request, conn):
         """
-        Method to handle the Http query received by the server.
-        :param query: the http query
-        :param conn: the connection object
-        :param addr: the address of the client
-        :return: The query object.
+        Method to parse a mutation request: PUT /<social network>/<names>/<last names> with the
+        new handle as body, or DELETE /<social network>/<names>/<last names>.
+        :param request: the request.
+        :param conn: the connection object, where the invalid requests are answered. If the body
+            cannot be read (too large or malformed), the connection is closed after the answer.
+        :return: tuple with the query and the new handle (None to delete the person), None if
+            the request is invalid.
         """
-        match query.social_network:
-            case "instagram":
-                return InstagramQuery(query.names, query.last_name)
-            case "whatsapp":
-                return WhatsAppQuery(query.names, query.last_name)
-            case "all":
-                return AllQuery(query.names, query.last_name)
-            case _:
-                return Query(query.social_network, query.names, query.last_name)
+        if request.path.count("/") < 3:
+            conn.sendall(build_response(400))
+            return None
+        query = make_query(*split_query_path(request.path[1:]))
+        handle = None
+        if request.method == "PUT":
+            try:
+                handle = request.body.decode(errors="replace").strip()
+            except HttpError as e:
+                # The rest of the body was not read, so the connection cannot be used again
+                logger.logger.error("Invalid body of %s %s: %s", request.method, request.path, e)
+                conn.sendall(build_response(e.status, headers={"Connection": "close"}))
+                request.headers["connection"] = "close"
+                return None
+            if not handle or not handle.isprintable():
+                conn.sendall(build_response(400, "The body must be the new handle."))
+                return None
+        if query.social_network == "all":
+            conn.sendall(build_response(400, "Changes are made to one social network at a time."))
+            return None
+        return query, handle
 
 class SocialNetworkRequestHandler(RequestHandler):
     """
@@ -93,20 +182,34 @@ class SocialNetworkRequestHandler(RequestHandler):
 
     Attributes:
         query_class (Query): The query class to use for the social network requests.
-        cache (dict): The cache to store the results of the queries.
+        cache (ResponseCache): The cache to store the results of the queries.
         social_network (str): The social network to search for.
+        metrics (Metrics): The metrics of the server, where the latency of the lookups is recorded.
+        inflight (SingleFlight): The lookups in the data in flight, so identical concurrent
+            queries are looked up once.
+        responses (EncodedResponses): The bytes of the responses to the lookups, as many as
+            the cache can hold.
+        etags (dict): The version of the entry and the ETag of each query, by social network and
+            normalized full name, so the ETag is only hashed again when the entry changes.
     """
-    def __init__(self, path, social_network, query_class):
-        super().__init__(path)
+    def __init__(self, path, social_network, query_class, index=None, cache=None, metrics=None, responses=None):
+        super().__init__(path, index)
         self.query_class = query_class
-        self.cache = {}
+        self.cache = cache if cache is not None else ResponseCache()
+        self.responses = responses if responses is not None else EncodedResponses(self.cache.capacity)
+        self.etags = {}
+        self.metrics = metrics if metrics is not None else Metrics(enabled=False)
+        self.inflight = SingleFlight()
         if social_network != "all":
             self.social_network = social_network
         else:
             self.social_network = "all"
 
     def get_data(self):
-        return super().get_data()[self.social_network]
+        data = super().get_data()
+        if self.social_network == "all":
+            return data
+        return data.get(self.social_network, {})
 
     def handle_query(self, query, conn, addr):
         """
@@ -116,89 +219,394 @@ class SocialNetworkRequestHandler(RequestHandler):
         :param conn: the connection object
         :param addr: the address of the client
         """
-        logger.logger.info(f"Searching for {query.names} {query.last_name} in {query.social_network} data.")
-        response = ""
-        data = self.get_data()
-        cached_query = self.check_cache(query)
-        if cached_query:
-            logger.logger.info(f"Query for {query.names} {query.last_name} found in cache.")
-            response = self.cache[cached_query]
-        else:
-            logger.logger.info(f"Query for {query.names} {query.last_name} not found in cache.")
-            if query.social_network == "all":
-                for social_network, data in data.items():
-                    if tuple([" ".join(query.names), " ".join(query.last_name)]) in data:
-                        if response == "":
-                            response = """HTTP/1.1 200 OK\r\n\r\n"""
-                        response += f"{social_network},{data[tuple([" ".join(query.names), " ".join(query.last_name)])]}\r\n"
-            else:
-                if tuple([" ".join(query.names), " ".join(query.last_name)]) in data:
-                    response = f"""HTTP/1.1 200 OK\r\n\r\n{data[tuple([" ".join(query.names), " ".join(query.last_name)])]}"""
-            self.add_to_cache(query, response)
+        logger.logger.info("Searching for %s %s in %s data.", query.names, query.last_name, query.social_network)
+        # The ETag is taken before the lookup, so it is never newer than the handle found
+        etag = self.etag(query)
+        conn.sendall(self.responses.get(self.lookup(query), etag))
+
+    def etag(self, query):
+        """
+        Method to get the ETag of the response to a query, from the version of the data and of
+        the entry of the person, without looking it up (see DataIndex.entry_version).
 
-        if response == "":
-            response = """HTTP/1.1 404 Not Found\r\n\r\n"""
-            conn.sendall(response.encode())
+        :param query: the query object
+        :return: The ETag, None if the data is not loaded yet.
+        """
+        version = self.index.entry_version(query.key)
+        if version is None:
+            return None
+        entry = (query.social_network, query.key)
+        etag = self.etags.get(entry)
+        if etag is None or etag[0] != version:
+            if len(self.etags) >= self.cache.capacity:
+                self.etags.clear()
+            etag = self.etags[entry] = (version, make_etag(query.social_network, query.key, version))
+        return etag[1]
+
+    def lookup(self, query):
+        """
+        Method to look up the query in the cache or, if it is not cached, in the data.
+
+        :param query: the query object
+        :return: The body of the response, empty if the person was not found.
+        """
+        start = time.perf_counter()
+        response = self.check_cache(query)
+        start = self.metrics.stage("cache", start)
+        if response is not None:
+            logger.logger.info("Query for %s %s found in cache.", query.names, query.last_name)
+            return response
+
+        logger.logger.info("Query for %s %s not found in cache.", query.names, query.last_name)
+        response = self.inflight.do((query.social_network, query.key), self.lookup_data, query)
+        self.metrics.stage("index", start)
+        return response
 
+    def lookup_data(self, query):
+        """
+        Method to look up the query in the data and cache the result.
+
+        :param query: the query object
+        :return: The body of the response, empty if the person was not found.
+        """
+        response = ""
+        data = self.index.get_data()
+        if query.social_network == "all":
+            # A change can add the table of a social network while it is iterated
+            for social_network, data in tuple(data.items()):
+                handle = data.get(query.key)
+                if handle is not None:
+                    response += f"{social_network},{handle}\r\n"
         else:
-            conn.sendall(response.encode())
+            response = data.get(query.social_network, {}).get(query.key, "")
+        self.add_to_cache(query, response)
+        return response
 
-    def handle_request(self, conn, addr):
+    def handle_request(self, request, conn, addr):
         """
         Method to handle the request received by the server when it's a single social network.
 
         Args:
+            request (HttpRequest): The request read from the connection.
             conn (socket): The connection object.
             addr (tuple): The address of the client.
         """
-        request = conn.recv(1024).decode()
-        request = request.split("\r\n")
-        first_line = request[0]
-        method, path, protocol = first_line.split(" ")
-        path = path[1:].split("/")
-        last_names = (path[-2], path[-1])
-        names = path[1:-2]
+        if request.method != "GET":
+            conn.sendall(build_response(405))
+            return None
+        if request.path == "/":
+            conn.sendall(build_response(200))
+            return None
+        if request.path.count("/") < 3:
+            conn.sendall(build_response(400))
+            return None
+        _, names, last_names = split_query_path(request.path[1:])
         return self.query_class(names, last_names)
 
+    def mutate(self, query, handle):
+        """
+        Method to add, update or delete the handle of a person in the data.
+        :param query: the query of the person.
+        :param handle: the new handle, None to delete the person.
+        :return: The status of the response: 201 if the person was added, 200 if it was
+            updated or deleted, 404 if the person to delete was not found.
+        """
+        previous = self.index.lookup(query.social_network, query.key)
+        if handle is None and previous is None:
+            return 404
+        logger.logger.info("Changing %s %s in %s data.", query.names, query.last_name, query.social_network)
+        self.index.update(query.social_network, query.names, query.last_name, handle)
+        return 201 if previous is None else 200
+
+    def invalidate(self, social_network, key):
+        """
+        Method to drop the cached results of a person that changed, for its social network
+        and for all the social networks.
+        :param social_network: the social network that changed.
+        :param key: the normalized full name of the person.
+        """
+        self.cache.invalidate((social_network, key))
+        self.cache.invalidate(("all", key))
+
     def check_cache(self, query):
         """
         Method to check if the query is in the cache.
 
         :param query: the query to check.
-        :return: True if the query is in the cache, False otherwise.
+        :return: The body of the cached response, None if the query is not in the cache.
         """
-        for cached_query in self.cache.items():
-            if cached_query[0] == " ".join(query.names) + " ".join(query.last_name):
-                return cached_query[1]
-        return False
+        return self.cache.get((query.social_network, query.key))
 
     def add_to_cache(self, query, response):
         """
         Method to add the query to the cache.
         :param query: the query to add.
-        :param response: the response to the query to add.
+        :param response: the body of the response to the query to add, empty if it was not found.
         """
-        if len(self.cache) == 0:
-            self.cache[tuple([" ".join(query.names) + " ".join(query.last_name), 0])] = response
-            return
-        elif len(self.cache) < 10:
-            latest_query = 0
-            for cached_query in self.cache.items():
-                if cached_query[1] > latest_query:
-                    latest_query = cached_query[1]
-            self.cache[tuple([" ".join(query.names) + " ".join(query.last_name), latest_query + 1])] = response
+        self.cache.put((query.social_network, query.key), response, negative=response == "")
+
+
+class BatchRequestHandler(RequestHandler):
+    """
+    BatchRequestHandler class that extends RequestHandler class and handles the batch requests:
+    a POST /batch request whose body has one query per line (NDJSON), answered with one
+    result per line in the same order. The body is read and answered in batches of
+    batch_size queries, so the results start streaming before the whole body is read.
+
+    Each query is a JSON object {"network": ..., "names": [...], "last_names": [...]} or a
+    JSON string with the path of the query, e.g. "instagram/Pedro/Pablo/Perez/Pereira".
+    Each result has the query fields, the status (200, 404, 400 or 503) and the handle of the
+    person, or the handles of every social network for "all" queries.
+
+    Attributes:
+        batch_size (int): The number of queries resolved together.
+    """
+    def __init__(self, path, index=None, batch_size=1000):
+        super().__init__(path, index)
+        self.batch_size = batch_size
+
+    def read_batches(self, request):
+        """
+        Method to read the queries of a batch request.
+
+        :param request: the batch request.
+        :return: Generator of lists of at most batch_size queries, or the result of the
+            lines that are not valid queries.
+        """
+        batch = []
+        for line in self.read_lines(request):
+            try:
+                batch.append(self.parse_query(line))
+            except (ValueError, TypeError, KeyError, IndexError) as e:
+                batch.append({"status": 400, "error": f"Invalid query: {e}"})
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    @staticmethod
+    def read_lines(request):
+        """
+        Method to split the body of a request in lines while it is read.
+
+        :param request: the request.
+        :return: Generator of the non empty lines of the body.
+        """
+        pending = b""
+        for chunk in request.iter_body():
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield line
+        if pending.strip():
+            yield pending
+
+    @staticmethod
+    def parse_query(line):
+        """
+        Method to build the query of a line of a batch request.
+
+        :param line: the line, as bytes.
+        :return: The query object.
+        """
+        value = json.loads(line)
+        if isinstance(value, str):
+            path = value.strip("/")
+            if path.count("/") < 2:
+                raise ValueError(f"{value!r} is not a valid path")
+            return make_query(*split_query_path(path))
+        names = value["names"]
+        last_names = value["last_names"]
+        return make_query(value["network"], [names] if isinstance(names, str) else list(names),
+                          [last_names] if isinstance(last_names, str) else list(last_names))
+
+    @staticmethod
+    def encode_query(query):
+        """
+        Method to encode a query as a line of a batch request.
+
+        :param query: the query object.
+        :return: The line, as bytes.
+        """
+        return (json.dumps({"network": query.social_network, "names": list(query.names),
+                            "last_names": list(query.last_name)}) + "\n").encode()
+
+    @staticmethod
+    def result(query, response=None, status=None):
+        """
+        Method to build the result of a query from the body of its response.
+
+        :param query: the query object.
+        :param response: the body of the response, empty if the person was not found.
+        :param status: the status of the result, taken from the response if None.
+        :return: The result, as a dict.
+        """
+        result = {"network": query.social_network, "names": list(query.names), "last_names": list(query.last_name)}
+        if status is None:
+            status = 200 if response else 404
+        result["status"] = status
+        if status == 200:
+            if query.social_network == "all":
+                result["handles"] = dict(line.split(",", 1) for line in response.splitlines() if line)
+            else:
+                result["handle"] = response
+        return result
+
+    @staticmethod
+    def start_response(conn):
+        """
+        Method to send the head of the response of a batch request.
+
+        :param conn: the connection object.
+        """
+        conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n")
+
+    @staticmethod
+    def send_results(conn, results):
+        """
+        Method to send the results of a batch, one per line.
+
+        :param conn: the connection object.
+        :param results: the results, as dicts.
+        """
+        conn.send_chunk("".join(json.dumps(result) + "\n" for result in results).encode())
+
+    @staticmethod
+    def end_response(conn):
+        """
+        Method to end the response of a batch request.
+
+        :param conn: the connection object.
+        """
+        conn.send_chunk(b"")
+
+
+class SearchRequestHandler(RequestHandler):
+    """
+    SearchRequestHandler class that extends RequestHandler class and handles the search
+    requests: GET /search?q=<text>, optionally with &network=<social network> and &limit=<n>,
+    answered with the people whose names match the text, best first, as JSON (see model.search).
+    The search index is built every time the data is loaded, and the people added later are
+    added to it.
+
+    Attributes:
+        social_network (str): The only social network searched, None to search every one.
+        limit (int): The number of results of a search without limit.
+        max_candidates (int): Maximum people scored by a search.
+        search_index (SearchIndex): The index of the names of the people, None until the data is loaded.
+    """
+    def __init__(self, path, index=None, social_network=None, limit=10, max_candidates=2000):
+        super().__init__(path, index)
+        self.social_network = social_network
+        self.limit = limit
+        self.max_candidates = max_candidates
+        self.search_index = None
+        self.index.subscribe(self.build_index)
+        self.index.subscribe_changes(self.add_person)
+        if self.index.data is not None:
+            self.build_index()
+
+    def build_index(self):
+        """
+        Method to build the search index of the data, used as listener of the index.
+        """
+        start = time.perf_counter()
+        data = self.index.data
+        if self.social_network is not None:
+            data = {self.social_network: data.get(self.social_network, {})}
+        search_index = SearchIndex.build(data, self.max_candidates)
+        self.search_index = search_index
+        logger.logger.info("Search index of %s built in %.2fs (%s people, %s words).", self.path,
+                           time.perf_counter() - start, len(search_index), len(search_index.words))
+
+    def add_person(self, social_network, key):
+        """
+        Method to add a person changed in the data to the search index, used as listener of the index.
+        :param social_network: the social network that changed.
+        :param key: the normalized full name of the person.
+        """
+        if self.search_index is not None and self.social_network in (None, social_network) \
+                and social_network in self.index.data:
+            self.search_index.add(key)
+
+    def handle_request(self, request, conn, addr):
+        """
+        Method to handle a search request.
+
+        Args:
+            request (HttpRequest): The request read from the connection.
+            conn (socket): The connection object.
+            addr (tuple): The address of the client.
+        """
+        search = self.parse_search(request, conn)
+        if search is None:
             return
-        latest_query = 0
-        for cached_query in self.cache.items():
-            if cached_query[1] > latest_query:
-                latest_query = cached_query[1]
-        first_query = latest_query
-        for cached_query in self.cache.items():
-            if cached_query[1] < first_query:
-                first_query = cached_query[1]
-        self.cache.pop(first_query)
-        self.cache[tuple([" ".join(query.names) + " ".join(query.last_name), latest_query + 1])] = response
-        return
+        text, limit, social_network = search
+        results, truncated = self.search(text, limit, social_network)
+        self.send_results(conn, text, results, truncated)
+
+    def parse_search(self, request, conn):
+        """
+        Method to read the parameters of a search request, answering 400 if they are not valid.
+        :param request: the search request.
+        :param conn: the connection object.
+        :return: tuple with the text, the limit and the social network searched (None for every
+            one), None if the request was answered.
+        """
+        parameters = self.parse_parameters(request.path)
+        text = parameters.get("q", "").strip()
+        if not text:
+            conn.sendall(build_response(400, "The q parameter is required."))
+            return None
+        try:
+            limit = int(parameters.get("limit", self.limit))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= MAX_LIMIT:
+            conn.sendall(build_response(400, f"The limit must be between 1 and {MAX_LIMIT}."))
+            return None
+        social_network = parameters.get("network") or self.social_network
+        if self.social_network not in (None, social_network):
+            conn.sendall(build_response(400, f"Only {self.social_network} is searched here."))
+            return None
+        return text, limit, social_network
+
+    def search(self, text, limit, social_network=None):
+        """
+        Method to search the people whose names match a text in the data.
+        :param text: the text searched.
+        :param limit: the maximum number of results.
+        :param social_network: the social network searched, None for every one.
+        :return: tuple with the results, best first, and True if the search stopped after
+            max_candidates people (see SearchIndex.search).
+        """
+        # Loading the data builds the search index
+        data = self.get_data()
+        results, truncated = self.search_index.search(data, text, limit, social_network)
+        logger.logger.info("Search for %r found %s people.", text, len(results))
+        return results, truncated
+
+    @staticmethod
+    def send_results(conn, text, results, truncated, headers=None):
+        """
+        Method to answer a search request with its results, as JSON.
+        :param conn: the connection object.
+        :param text: the text searched.
+        :param results: the (score, normalized full name, handles) of each person found, best first.
+        :param truncated: True if the search stopped before scoring every candidate.
+        :param headers: extra headers of the response.
+        """
+        body = {
+            "query": text,
+            "results": [{"names": key[0], "last_names": key[1], "score": score, "handles": handles}
+                        for score, key, handles in results],
+            "truncated": truncated,
+        }
+        conn.sendall(build_response(200, json.dumps(body, ensure_ascii=False),
+                                    {"Content-Type": "application/json", **(headers or {})}))
+
 
 class InstagramRequestHandler(SocialNetworkRequestHandler):
     """
@@ -206,8 +614,8 @@ class InstagramRequestHandler(SocialNetworkRequestHandler):
     request handler for Instagram requests.
     """
 
-    def __init__(self, path):
-        super().__init__(path, "instagram", InstagramQuery)
+    def __init__(self, path, index=None, cache=None, metrics=None):
+        super().__init__(path, "instagram", InstagramQuery, index, cache, metrics)
 
 
 
@@ -217,6 +625,6 @@ class WhatsAppRequestHandler(SocialNetworkRequestHandler):
     request handler for WhatsApp requests.
     """
 
-    def __init__(self, path):
-        super().__init__(path, "whatsapp", WhatsAppQuery)
+    def __init__(self, path, index=None, cache=None, metrics=None):
+        super().__init__(path, "whatsapp", WhatsAppQuery, index, cache, metrics)
 
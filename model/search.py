@@ -0,0 +1,354 @@
+"""
+Search module with an index of the words of the names of the people, used to find them by
+the start of their names or with typos without going through every person of the data.
+"""
+import heapq
+import threading
+from array import array
+from collections import Counter
+
+from model.query import normalize_text
+from model.store import StringTable
+
+GRAM_SIZE = 3
+MAX_LIMIT = 100
+INTERSECT_RATIO = 32
+EXACT = 0
+PREFIX = 1
+
+
+def word_grams(word):
+    """
+    Function to get the n-grams of a word: its substrings of GRAM_SIZE letters, with a space
+    before and after the word so the first and last letters count as much as the others.
+    :param word: the word.
+    :return: set of n-grams.
+    """
+    padded = f" {word} "
+    return {padded[i:i + GRAM_SIZE] for i in range(len(padded) - GRAM_SIZE + 1)}
+
+
+def max_typos(word):
+    """
+    Function to get the number of typos tolerated in a word of a query: none in words of up
+    to 3 letters, 1 in words of up to 7 letters and 2 in longer words.
+    :param word: the word.
+    :return: The number of typos.
+    """
+    if len(word) <= 3:
+        return 0
+    return 1 if len(word) <= 7 else 2
+
+
+def edit_distance(a, b, limit):
+    """
+    Function to get the edit (Levenshtein) distance between two words, giving up as soon as
+    it is over limit.
+    :param a: a word.
+    :param b: the other word.
+    :param limit: the maximum distance of interest.
+    :return: The distance, or limit + 1 if it is over limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, letter in enumerate(a, 1):
+        current = [i]
+        for j, other in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (letter != other)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+
+def name_words(key):
+    """
+    Function to get the words of a normalized full name.
+    :param key: the normalized full name, a tuple with the names and the last names.
+    :return: list of words.
+    """
+    return key[0].split() + key[1].split()
+
+
+class SearchIndex:
+    """
+    SearchIndex class with the words of the names of the people of the data. Each word of
+    the vocabulary is in a prefix trie and in an index of its n-grams, and has the list of the
+    people whose names have it. The words of a query are matched against the vocabulary
+    (exactly, as the start of a word or with a few typos), and only the people of the matched
+    words are scored, so the cost of a selective query does not depend on the size of the data.
+
+    The people are scored by the sum of the cost of the match of each word of the query: 0
+    for an exact match, 1 for the start of a word and 1 plus the typos for a word with typos.
+    The people of the least common word of the query are scored first, cheapest matches
+    first, and the search stops as soon as no other person can rank in the top results, or
+    after max_candidates people.
+
+    The index only grows, and the ids of the people are given in order, so the list of each
+    word is sorted. A search only takes the lock to read how many people are indexed, and
+    leaves out the people added after that, so the searches do not wait for each other nor
+    for add.
+
+    Attributes:
+        names (StringTable): The full names of the people indexed when the index was built;
+            the id of a person is the position of its name.
+        added (list): The full names of the people added after the index was built.
+        words (list): The words of the vocabulary; the id of a word is its position.
+        word_ids (dict): The id of each word.
+        trie (dict): The prefix trie of the words: each node is a dict from letter to node,
+            and the node where a word ends has its id under the None key.
+        grams (dict): The ids of the words that have each n-gram.
+        people (list): The ids of the people whose names have each word, an array per word.
+        max_candidates (int): Maximum people scored by a query, so the queries that match too
+            many people (e.g. a single letter) answer in bounded time.
+        lock (Lock): Held while a person is added, so a search sees every person added before it.
+    """
+
+    def __init__(self, max_candidates=2000):
+        self.names = StringTable()
+        self.added = []
+        self.words = []
+        self.word_ids = {}
+        self.trie = {}
+        self.grams = {}
+        self.people = []
+        self.max_candidates = max_candidates
+        self.lock = threading.Lock()
+
+    @classmethod
+    def build(cls, data, max_candidates=2000):
+        """
+        Method to build the index of the people of the data.
+        :param data: the indexed data: social network -> normalized full name -> handle.
+        :param max_candidates: maximum people scored by a query.
+        :return: The index.
+        """
+        index = cls(max_candidates)
+        for table in data.values():
+            for key in table:
+                count = len(index.names)
+                person = index.names.add("\x1f".join(key))
+                if person == count:
+                    index.index_person(person, key)
+        index.names.freeze()
+        return index
+
+    def index_person(self, person, key):
+        """
+        Method to add a person to the lists of the words of its name.
+        :param person: the id of the person.
+        :param key: the normalized full name of the person.
+        """
+        for word in set(name_words(key)):
+            word_id = self.word_ids.get(word)
+            if word_id is None:
+                word_id = self.add_word(word)
+            self.people[word_id].append(person)
+
+    def add_word(self, word):
+        """
+        Method to add a word to the vocabulary, the trie and the n-grams index.
+        :param word: the word.
+        :return: The id of the word.
+        """
+        word_id = len(self.words)
+        self.words.append(word)
+        self.word_ids[word] = word_id
+        self.people.append(array("I"))
+        node = self.trie
+        for letter in word:
+            node = node.setdefault(letter, {})
+        node[None] = word_id
+        for gram in word_grams(word):
+            self.grams.setdefault(gram, array("I")).append(word_id)
+        return word_id
+
+    def add(self, key):
+        """
+        Method to add a person changed after the index was built, if it is not indexed yet.
+        The people deleted are left in the index, and skipped by the searches.
+        :param key: the normalized full name of the person.
+        """
+        with self.lock:
+            if not self.contains(key):
+                self.added.append("\x1f".join(key))
+                self.index_person(len(self.names) + len(self.added) - 1, key)
+
+    def contains(self, key):
+        """
+        Method to check if a person is indexed, looking for it in the list of its least common word.
+        :param key: the normalized full name of the person.
+        :return: True if the person is indexed.
+        """
+        word_ids = [self.word_ids.get(word) for word in name_words(key)]
+        if not word_ids or None in word_ids:
+            return False
+        name = "\x1f".join(key)
+        return any(self.name(person) == name for person in self.people[min(word_ids, key=lambda i: len(self.people[i]))])
+
+    def name(self, person):
+        """
+        Method to get the full name of a person.
+        :param person: the id of the person.
+        :return: The names and last names, separated by \\x1f.
+        """
+        count = len(self.names)
+        return self.names.get(person) if person < count else self.added[person - count]
+
+    def complete(self, prefix):
+        """
+        Method to get the words that start with a prefix, walking the trie.
+        :param prefix: the prefix.
+        :return: list of ids of the words.
+        """
+        node = self.trie
+        for letter in prefix:
+            node = node.get(letter)
+            if node is None:
+                return []
+        word_ids = []
+        nodes = [node]
+        while nodes:
+            # Copied at once, as add_word can add a letter to the node while it is walked
+            for letter, child in list(nodes.pop().items()):
+                if letter is None:
+                    word_ids.append(child)
+                else:
+                    nodes.append(child)
+        return word_ids
+
+    def match(self, word):
+        """
+        Method to match a word of a query against the vocabulary: the words equal to it, the
+        words that start with it and the words with up to max_typos typos. The candidates
+        for typos are the words that share enough n-grams with it (each typo changes at
+        most GRAM_SIZE n-grams), and only those are compared letter by letter.
+        :param word: the normalized word.
+        :return: dict with the cost of the match of each matched word, by id.
+        """
+        matches = {word_id: EXACT if self.words[word_id] == word else PREFIX for word_id in self.complete(word)}
+        typos = max_typos(word)
+        if typos:
+            grams = word_grams(word)
+            shared = Counter()
+            for gram in grams:
+                shared.update(self.grams.get(gram, ()))
+            threshold = len(grams) - GRAM_SIZE * typos
+            for word_id, count in shared.items():
+                if count >= threshold and word_id not in matches:
+                    distance = edit_distance(word, self.words[word_id], typos)
+                    if distance <= typos:
+                        matches[word_id] = PREFIX + distance
+        return matches
+
+    def search(self, data, text, limit=10, social_network=None):
+        """
+        Method to search the people whose names match a text.
+        :param data: the indexed data, where the handles of the people are read.
+        :param text: the text, one or more words or starts of words of the names and last names.
+        :param limit: the maximum number of results.
+        :param social_network: the social network of the results, None for every social network.
+        :return: tuple with the results, best first, and True if the search stopped after
+            max_candidates people. Each result is a tuple with the score (lower is better),
+            the normalized full name and the handle in each social network.
+        """
+        query_words = normalize_text(text).split()
+        if not query_words or limit <= 0:
+            return [], False
+        # The people added from now on have higher ids and are left out of the search
+        with self.lock:
+            indexed = len(self.names) + len(self.added)
+        matches = [self.match(word) for word in query_words]
+        if not all(matches):
+            return [], False
+        sizes = [sum(len(self.people[word_id]) for word_id in words) for words in matches]
+        first = sizes.index(min(sizes))
+        others = [{self.words[word_id]: cost for word_id, cost in words.items()}
+                  for i, words in enumerate(matches) if i != first]
+        # The people of the other words, unless they are too many to be worth it, discard
+        # the candidates that do not match every word before their names are read
+        filters = [set().union(*(self.people[word_id] for word_id in words))
+                   for i, words in enumerate(matches) if i != first and sizes[i] <= INTERSECT_RATIO * sizes[first]]
+        ranked = sorted(matches[first].items(), key=lambda item: (item[1], len(self.words[item[0]]), item[0]))
+        candidates = []
+        seen = set()
+        truncated = False
+        tier = None
+        for word_id, cost in ranked:
+            if cost != tier:
+                tier = cost
+                # The people of the following words score at least cost
+                if len(candidates) >= limit and heapq.nsmallest(limit, candidates)[-1][0] < cost:
+                    break
+            people = self.people[word_id]
+            for allowed in filters:
+                people = [person for person in people if person in allowed]
+            for person in people:
+                if person >= indexed:
+                    break
+                if person in seen:
+                    continue
+                if len(seen) >= self.max_candidates:
+                    truncated = True
+                    break
+                seen.add(person)
+                rank = self.score(person, cost, others)
+                if rank is None:
+                    continue
+                # Only the people in the data count towards the limit: the people of other
+                # social networks and the ones deleted after the index was built are skipped
+                handles = self.handles(data, rank[2], social_network)
+                if handles:
+                    candidates.append(rank + (handles,))
+            if truncated:
+                break
+        return self.top(candidates, limit), truncated
+
+    def score(self, person, cost, others):
+        """
+        Method to score a person matched by the first word of a query.
+        :param person: the id of the person.
+        :param cost: the cost of the match of the first word.
+        :param others: the cost of each matched word of the vocabulary, for each other word of the query.
+        :return: The rank of the person: tuple with the score, the number of words of its name
+            and its normalized full name. None if it does not match every word of the query.
+        """
+        key = tuple(self.name(person).split("\x1f"))
+        words = name_words(key)
+        score = cost
+        for costs in others:
+            matched = [costs[word] for word in words if word in costs]
+            if not matched:
+                return None
+            score += min(matched)
+        return score, len(words), key
+
+    @staticmethod
+    def handles(data, key, social_network=None):
+        """
+        Method to read the handles of a person in the data.
+        :param data: the indexed data.
+        :param key: the normalized full name of the person.
+        :param social_network: the social network to read, None for every social network.
+        :return: dict with the handle of the person in each social network where it is.
+        """
+        handles = {}
+        for network in (social_network,) if social_network else data:
+            handle = data.get(network, {}).get(key)
+            if handle is not None:
+                handles[network] = handle
+        return handles
+
+    @staticmethod
+    def top(candidates, limit):
+        """
+        Method to get the best candidates: lowest score first, then shortest names.
+        :param candidates: the ranks of the candidates, with their handles.
+        :param limit: the maximum number of results.
+        :return: list of (score, normalized full name, handles) tuples.
+        """
+        return [(score, key, handles) for score, _, key, handles in heapq.nsmallest(limit, candidates)]
+
+    def __len__(self):
+        return len(self.names) + len(self.added)
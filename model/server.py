@@ -2,12 +2,39 @@
 This module contains the HttpServer class and child classes
 InstagramServer and WhatsappServer.
 """
+import contextvars
+import json
+import os
+import signal
 import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from urllib.parse import quote
 
+from model.cache import ResponseCache, SharedCache
+from model.changelog import ChangeLog
+from model.concurrency import get_dispatcher
+from model.config import Config
+from model.http import build_response, etag_matches, make_etag, EncodedResponses, HttpError, HttpResponse
+from model.index import DataIndex
 from model.logger import logger
-from model.query import InstagramQuery, WhatsAppQuery, Query
+from model.metrics import Metrics
+from model.prefork import Prefork
+from model.query import InstagramQuery, WhatsAppQuery, AllQuery, Query, make_query
+from model.search import name_words
+from model.sharding import HashRing
+from model.singleflight import SingleFlight
+from model.tracing import DEFAULT_SAMPLE_RATE, PROFILE_SECONDS, Profiler, Tracer
+from model.upstream import UpstreamClient
 from model.request_handler import HttpRequestHandler, InstagramRequestHandler, WhatsAppRequestHandler, \
-    SocialNetworkRequestHandler
+    SocialNetworkRequestHandler, RequestHandler, BatchRequestHandler, SearchRequestHandler
+
+LINKED_SERVER_NAMES = {
+    "instagram": "InstagramServer",
+    "whatsapp": "WhatsAppServer",
+}
 
 
 class HttpServer:
@@ -15,123 +42,1049 @@ class HttpServer:
     A simple HttpServer class that listens on a port and returns a response.
     This class will be used as template for the other servers in the project.
 
+    The ETag of a query served with the local data is taken from the index (see
+    SocialNetworkRequestHandler.etag), so a conditional request for it is answered without a
+    lookup. The ETag of a query for a social network with a linked server is the one of the
+    linked server, which also decides if a conditional request is answered with 304: the
+    local index does not see its changes. Responses from the cache of those queries are sent
+    with the ETag of the response they were cached from.
+
     Attributes:
         host (str): The host to listen on.
         port (int): The port to listen on.
         http_request_handler (RequestHandler): The request handler to use.
         social_network_request_handler (SocialNetworkServerRequestHandler): The social network request handler to use.
         name (str): The name of the server.
-        client_socket: a socket to serve as a client to contact other servers.
+        index (DataIndex): The in-memory index of the data file, shared by the request handlers.
+            It only has the social networks without a linked server.
+        config (Config): The tunable settings of the server.
+        cache (ResponseCache): The cache of the responses, shared by the request handlers.
+        batch_request_handler (BatchRequestHandler): The request handler of the batch requests.
+        search_request_handler (SearchRequestHandler): The request handler of the searches, None
+            if they are disabled.
+        linked_servers (list): The (name, host, port) of the servers linked to this one.
+        rings (dict): The hash ring of the shards of the linked servers of each name, so the
+            people of a social network can be spread between several shards. Each shard is a
+            list of replicas.
+        executor (ThreadPoolExecutor): The threads that send requests to the linked servers in parallel.
+        upstream (UpstreamClient): The client that sends the requests to the linked servers,
+            with their connection pools, deadlines, retries, circuit breakers and hedging.
+        metrics (Metrics): The metrics of the server, exposed on /metrics.
+        tracer (Tracer): The tracer of a sample of the requests, off unless turned on.
+        profiler (Profiler): The profiler of the server, run on request.
+        dispatcher (Dispatcher): The dispatcher handling the connections, once the server is started.
+        inflight (SingleFlight): The requests to the linked servers in flight, so identical
+            concurrent queries are sent once.
+        linked_etags (dict): The body and the ETag of the last response of a linked server (or
+            of a fan out) to each query, by social network and normalized full name, so the
+            responses from the cache are sent with their ETag.
+        responses (EncodedResponses): The bytes of the responses to the queries, with their ETag and
+            Cache-Control, shared with the request handlers.
     """
 
-    def __init__(self, host, port, name, data_path):
+    def __init__(self, host, port, name, data_path, config=None, key_filter=None):
         self.host = host
         self.port = port
-        self.http_request_handler = HttpRequestHandler(data_path)
-        self.social_network_request_handler = SocialNetworkRequestHandler(data_path, "all", Query)
-        self.name = name
+        self.config = config if config is not None else Config()
         self.linked_servers = []
-        self.client_socket =  socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.rings = {}
+        changes = ChangeLog(self.config.data_log_path or f"{data_path}.log") if self.config.data_mutations else None
+        # Only the social networks served with the local data are loaded (see serves)
+        self.index = DataIndex(data_path, partial(RequestHandler.load_data, store=self.config.data_store,
+                                                  key_filter=key_filter, network_filter=self.serves),
+                               self.config.data_reload_interval, changes, RequestHandler.compact_data,
+                               self.config.data_compact_size, key_filter, self.serves)
+        shared = None
+        if self.config.cache_shared_path:
+            shared = SharedCache(self.config.cache_shared_path, self.config.cache_shared_slots,
+                                 self.config.cache_shared_slot_size)
+            self.index.subscribe(lambda: shared.set_version(self.index.version))
+        self.cache = ResponseCache(self.config.cache_capacity, self.config.cache_ttl, self.config.cache_negative_ttl,
+                                   shared)
+        max_age = self.config.http_cache_max_age
+        self.responses = EncodedResponses(self.config.cache_capacity,
+                                          {"Cache-Control": f"max-age={max_age}" if max_age > 0 else "no-cache"},
+                                          {"Cache-Control": "no-cache"})
+        self.index.subscribe(self.cache.clear)
+        self.index.subscribe_changes(lambda social_network, key: self.local_request_handler().invalidate(social_network, key))
+        self.tracer = Tracer(name, self.config.debug_dir, self.config.trace_sample_rate)
+        self.profiler = Profiler(name, self.config.debug_dir)
+        self.metrics = Metrics(self.config.metrics_enabled, self.tracer)
+        self.dispatcher = None
+        self.inflight = SingleFlight()
+        self.linked_etags = {}
+        self.http_request_handler = HttpRequestHandler(data_path, self.index)
+        self.social_network_request_handler = SocialNetworkRequestHandler(data_path, "all", Query, self.index, self.cache,
+                                                                          self.metrics, self.responses)
+        self.batch_request_handler = BatchRequestHandler(data_path, self.index, self.config.batch_size)
+        self.search_request_handler = None
+        if self.config.search_enabled:
+            self.search_request_handler = SearchRequestHandler(data_path, self.index, None, self.config.search_limit,
+                                                               self.config.search_max_candidates)
+        self.name = name
+        self.executor = ThreadPoolExecutor(self.config.fanout_workers, thread_name_prefix=f"{name}-fanout")
+        self.upstream = UpstreamClient(self.config, self.metrics,
+                                       ThreadPoolExecutor(self.config.fanout_workers, thread_name_prefix=f"{name}-hedge"))
+        self.register_metrics()
 
     def start(self):
         """
         Method to start the server, listen on the port and handle requests.
+        The connections are handled by the dispatcher selected by the server_mode setting,
+        in this process or, if server_processes is more than 1, in several worker processes.
+        Once the index is loaded and the port is open, the server tells the process that
+        started it that it is ready (see notify_ready). When it receives SIGTERM, it stops
+        accepting connections and waits for the requests being handled; SIGUSR1 and SIGUSR2
+        turn the tracing on or off and start a profile (see handle_signal).
         """
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.bind((self.host, self.port))
-            s.listen()
-            logger.logger.info(f"{self.name}: Server listening on {self.host}:{self.port}")
-
-            while True:
-                conn, addr = s.accept()
-                with conn:
-                    logger.logger.info(f"{self.name}: Connection from {addr} has been established.")
-                    logger.logger.info(f"{self.name}: Handling request for {addr}.")
-
-                    # Check if the request is valid and can be handled
-                    query = self.http_request_handler.handle_request(conn, addr)
-                    if query:
-                        logger.logger.info(f"{self.name}: Query for {addr} is {query.social_network} query.")
-
-                        # Match query type, if its Instagram or Whatsapp send to the respective server
-                        match query:
-                            case InstagramQuery():
-                                instagram_server = next((server for server in self.linked_servers if server[0] == "InstagramServer"), None)
-                                response = self.send_request(instagram_server, query)
-                                conn.sendall(response)
-                                conn.close()
-
-                            case WhatsAppQuery():
-                                whatsapp_server = next((server for server in self.linked_servers if server[0] == "WhatsAppServer"), None)
-                                conn.sendall(f"""HTTP/1.1 302 Found\r\n")
-                                Location: {whatsapp_server[1]}:{whatsapp_server[2]}/{query.names}/{query.last_name}\r\n""".encode())
-                                conn.close()
-
-                            case Query():
-                                self.social_network_request_handler.handle_query(query, conn, addr)
+        if self.config.server_processes > 1:
+            Prefork(self, self.config.server_processes, self.config.server_reuse_port,
+                    self.config.server_drain_timeout).run()
+            return
+        self.index.start()
+        self.dispatcher = get_dispatcher(self.handle_connection, self.config, self.name)
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda signum, frame: self.dispatcher.stop())
+            signal.signal(signal.SIGUSR1, self.handle_signal)
+            signal.signal(signal.SIGUSR2, self.handle_signal)
+        with self.listen(self.config.server_reuse_port) as s:
+            self.notify_ready()
+            self.dispatcher.serve(s)
+        if not self.dispatcher.join(self.config.server_drain_timeout):
+            logger.logger.warning("%s: Connections still open after %ss, closing them.", self.name,
+                                  self.config.server_drain_timeout)
 
+    def handle_signal(self, signum, frame=None):
+        """
+        Method to handle the debugging signals: SIGUSR1 turns the tracing on (with the
+        trace_sample_rate setting, or DEFAULT_SAMPLE_RATE if it is 0) or off, and SIGUSR2 starts
+        a sampling profile of PROFILE_SECONDS seconds.
+        :param signum: the signal.
+        :param frame: the frame interrupted by the signal.
+        """
+        match signum:
+            case signal.SIGUSR1:
+                self.tracer.toggle(self.config.trace_sample_rate or DEFAULT_SAMPLE_RATE)
+            case signal.SIGUSR2:
+                try:
+                    self.profiler.start(PROFILE_SECONDS)
+                except (RuntimeError, ValueError) as e:
+                    logger.logger.error("%s: Could not start profile: %s", self.name, e)
+
+    def notify_ready(self):
+        """
+        Method to tell the process that started the server (see model.supervisor) that it is
+        ready to handle requests, writing to the pipe given in the READY_FD environment variable.
+        """
+        fd = os.environ.pop("READY_FD", None)
+        if fd is None:
+            return
+        try:
+            os.write(int(fd), f"ready {os.getpid()}\n".encode())
+            os.close(int(fd))
+        except (OSError, ValueError) as e:
+            logger.logger.warning("%s: Could not notify readiness: %s", self.name, e)
+
+    def is_ready(self):
+        """
+        Method to check if the server can handle queries: its index is loaded and it is not stopping.
+        :return: True if the server is ready.
+        """
+        return self.index.data is not None and (self.dispatcher is None or not self.dispatcher.stopping.is_set())
+
+    def listen(self, reuse_port=False):
+        """
+        Method to open the listening socket of the server.
+        :param reuse_port: True to let other processes bind the same port (SO_REUSEPORT).
+        :return: The listening socket.
+        """
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        s.bind((self.host, self.port))
+        s.listen(self.config.server_backlog)
+        logger.logger.info("%s: Server listening on %s:%s (%s mode)", self.name, self.host, self.port, self.config.server_mode)
+        return s
+
+    def handle_connection(self, conn, addr):
+        """
+        Method to handle a request received on a connection.
+        :param conn: the connection object.
+        :param addr: the address of the client.
+        :return: True if the connection must be kept open, False otherwise.
+        """
+        request = self.read_request(conn, addr)
+        if request is None:
+            return False
+        self.tracer.start(request)
+        start = self.metrics.stage("read", request.received_at)
+        logger.logger.info("%s: Handling request for %s.", self.name, addr)
+        if self.handle_reserved(request, conn, addr):
+            return request.keep_alive
+
+        # Check if the request is valid and can be handled
+        query = self.http_request_handler.handle_request(request, conn, addr)
+        start = self.metrics.stage("parse", start)
+        if query:
+            logger.logger.info("%s: Query for %s is %s query.", self.name, addr, query.social_network)
+
+            # Match query type, if its Instagram or Whatsapp send to the respective server, unless
+            # there is no server linked for it and it is answered with the local data
+            match query:
+                case WhatsAppQuery() if not self.serves(query.social_network):
+                    whatsapp_server = self.get_linked_server(query.social_network, query.key)
+                    location = f"http://{whatsapp_server[1]}:{whatsapp_server[2]}/{query.social_network}/{self.query_path(query)}"
+                    conn.sendall(build_response(302, headers={"Location": location}))
+                    self.finish_request(request, "whatsapp", conn, addr)
+
+                # A conditional request whose response did not change is answered right away
+                case _ if self.not_modified(request, query, conn):
+                    self.finish_request(request, "not_modified", conn, addr)
+
+                case InstagramQuery() if not self.serves(query.social_network):
+                    # A conditional request is sent to the linked server, which has the current ETag
+                    condition = request.headers.get("if-none-match")
+                    body = self.cache.get((query.social_network, query.key)) if condition is None else None
+                    start = self.metrics.stage("cache", start)
+                    if body is not None:
+                        conn.sendall(self.responses.get(body, self.cached_etag(query, body)))
                     else:
-                        logger.logger.error(f"{self.name}: Query for {addr} is None.")
-                        logger.logger.info(f"{self.name}: Closing connection for {addr}.")
-                        conn.close()
+                        instagram_server = self.get_linked_server(query.social_network, query.key)
+                        try:
+                            if condition is None:
+                                response = self.inflight.do((query.social_network, query.key), self.fetch_linked,
+                                                            instagram_server, query)
+                            else:
+                                response = self.fetch_linked(instagram_server, query, condition)
+                        except (OSError, HttpError) as e:
+                            logger.logger.error("%s: Request to %s failed: %s", self.name, instagram_server[0], e)
+                            conn.sendall(build_response(503))
+                            request.drain()
+                            self.finish_request(request, "instagram", conn, addr)
+                            return request.keep_alive
+                        self.metrics.stage("upstream", start)
+                        conn.sendall(self.encode_response(response))
+                    self.finish_request(request, "instagram", conn, addr)
+
+                case AllQuery():
+                    self.handle_all(request, query, conn, addr)
+                    self.finish_request(request, "all", conn, addr)
+
+                case Query():
+                    self.social_network_request_handler.handle_query(query, conn, addr)
+                    route = query.social_network if query.social_network in LINKED_SERVER_NAMES else "other"
+                    self.finish_request(request, route, conn, addr)
+
+        else:
+            logger.logger.info("%s: Request for %s answered without a query.", self.name, addr)
+            self.finish_request(request, "none", conn, addr)
+        request.drain()
+        return request.keep_alive
+
+    def handle_reserved(self, request, conn, addr):
+        """
+        Method to handle the requests to the reserved paths of the servers: POST /batch,
+        GET /search, GET /metrics, GET /healthz (the process is up), GET /readyz (the server
+        can handle queries), the mutations (PUT and DELETE) and the /admin paths if they are enabled.
+        :param request: the request.
+        :param conn: the connection object.
+        :param addr: the address of the client.
+        :return: True if the request was handled.
+        """
+        if request.method == "POST" and request.path == "/batch":
+            self.handle_batch(request, conn, addr)
+            self.finish_request(request, "batch", conn, addr)
+            return True
+        if request.method == "GET" and request.path.partition("?")[0] == "/search" \
+                and self.search_request_handler is not None:
+            start = time.perf_counter()
+            self.handle_search(request, conn, addr)
+            self.metrics.stage("search", start)
+            request.drain()
+            self.finish_request(request, "search", conn, addr)
+            return True
+        if request.method == "GET" and request.path in ("/healthz", "/readyz"):
+            ready = request.path == "/healthz" or self.is_ready()
+            conn.sendall(build_response(200 if ready else 503, "ok" if ready else "not ready"))
+            request.drain()
+            return True
+        if request.method == "GET" and request.path == "/metrics" and self.metrics.enabled:
+            conn.sendall(build_response(200, self.metrics.render(), {"Content-Type": "text/plain; version=0.0.4"}))
+            request.drain()
+            return True
+        if request.path.startswith("/admin/") and self.config.admin_enabled:
+            self.handle_admin(request, conn)
+            request.drain()
+            return True
+        if request.method in ("PUT", "DELETE") and self.config.data_mutations:
+            self.handle_mutation(request, conn, addr)
+            request.drain()
+            self.finish_request(request, "mutation", conn, addr)
+            return True
+        return False
+
+    def handle_search(self, request, conn, addr):
+        """
+        Method to handle a search request. The social networks with a linked server are searched
+        by every shard of the social network, in parallel with the local data, and the results
+        are merged, joining the handles of the people found in several social networks. If some
+        shards fail or miss the deadline, the results of the others are answered and the social
+        networks of the missing ones are listed in the X-Partial-Results header.
+        :param request: the search request.
+        :param conn: the connection object.
+        :param addr: the address of the client.
+        """
+        handler = self.search_request_handler
+        if not self.rings:
+            handler.handle_request(request, conn, addr)
+            return
+        search = handler.parse_search(request, conn)
+        if search is None:
+            return
+        text, limit, social_network = search
+        branches = {}
+        for linked_network, name in LINKED_SERVER_NAMES.items():
+            ring = self.rings.get(name)
+            if ring is not None and social_network in (None, linked_network):
+                for replicas in ring.nodes.values():
+                    branches[self.executor.submit(contextvars.copy_context().run, self.search_linked,
+                                                  self.upstream.choose(replicas), text, limit,
+                                                  linked_network)] = linked_network
+        if social_network is None or self.serves(social_network):
+            branches[self.executor.submit(handler.search, text, limit, social_network)] = "local"
+
+        merged = {}
+        truncated = False
+        failed = {}
+        try:
+            for future in as_completed(branches, timeout=self.config.fanout_timeout):
+                try:
+                    results, branch_truncated = future.result()
+                except (OSError, ValueError, KeyError, HttpError) as e:
+                    logger.logger.error("%s: %s branch of search %r failed: %s", self.name, branches[future], text, e)
+                    failed[branches[future]] = "error"
+                    continue
+                truncated = truncated or branch_truncated
+                for score, key, handles in results:
+                    if key in merged:
+                        handles = {**merged[key][2], **handles}
+                    merged[key] = (score, key, handles)
+        except TimeoutError:
+            for future, branch in branches.items():
+                if not future.done():
+                    logger.logger.error("%s: %s branch of search %r missed the deadline.", self.name, branch, text)
+                    failed[branch] = "timeout"
+        results = sorted(merged.values(), key=lambda result: (result[0], len(name_words(result[1])), result[1]))
+        headers = {}
+        if failed:
+            headers["X-Partial-Results"] = ", ".join(f"{branch}={reason}" for branch, reason in failed.items())
+        handler.send_results(conn, text, results[:limit], truncated, headers)
+
+    def search_linked(self, server, text, limit, social_network):
+        """
+        Method to search the people of a social network in a linked server.
+        :param server: the linked server.
+        :param text: the text searched.
+        :param limit: the maximum number of results.
+        :param social_network: the social network of the linked server.
+        :return: tuple with the results, as the ones of SearchRequestHandler.search, and True if
+            the search stopped after the maximum number of candidates.
+        """
+        path = f"/search?q={quote(text)}&limit={limit}&network={quote(social_network)}"
+        request = f"GET {path} HTTP/1.1\r\nHost: {server[1]}:{server[2]}\r\n{self.tracer.header()}\r\n"
+        response = self.upstream.request(server, request.encode())
+        if response.status != 200:
+            raise HttpError(502, f"{server[0]} answered {response.status}")
+        body = json.loads(response.body)
+        return [(result["score"], (result["names"], result["last_names"]), result["handles"])
+                for result in body["results"]], body["truncated"]
+
+    def handle_admin(self, request, conn):
+        """
+        Method to handle the requests to the admin paths, answered with JSON:
+        GET /admin/trace returns the state of the tracing and the last traces,
+        POST /admin/trace?rate=<fraction>&seconds=<n> turns the tracing on (off with rate=0),
+        for n seconds if given, GET /admin/profile returns the state of the profiler and
+        POST /admin/profile?seconds=<n>&mode=<sample|cprofile> starts a profile, answered with
+        the path of the file where it will be written.
+        :param request: the request.
+        :param conn: the connection object.
+        """
+        parameters = RequestHandler.parse_parameters(request.path)
+        try:
+            match request.method, request.path.partition("?")[0]:
+                case "GET", "/admin/trace":
+                    status, body = 200, self.tracer.state()
+                case "POST", "/admin/trace":
+                    self.tracer.enable(float(parameters.get("rate", DEFAULT_SAMPLE_RATE)),
+                                       float(parameters.get("seconds", 0)))
+                    status, body = 200, self.tracer.state()
+                case "GET", "/admin/profile":
+                    status, body = 200, self.profiler.state()
+                case "POST", "/admin/profile":
+                    seconds = float(parameters.get("seconds", PROFILE_SECONDS))
+                    mode = parameters.get("mode", "sample")
+                    status, body = 202, {"mode": mode, "seconds": seconds, "path": self.profiler.start(seconds, mode)}
+                case _:
+                    status, body = 404, {"error": "Unknown admin path."}
+        except ValueError as e:
+            status, body = 400, {"error": str(e)}
+        except RuntimeError as e:
+            status, body = 409, {"error": str(e)}
+        conn.sendall(build_response(status, json.dumps(body), {"Content-Type": "application/json"}))
+
+    def handle_mutation(self, request, conn, addr):
+        """
+        Method to handle a mutation request. The changes to a social network with a linked
+        server are sent to the server of the person, which applies them, and the cached
+        results of the person are dropped; the others are applied to the local data, if it
+        has the social network.
+        :param request: the mutation request.
+        :param conn: the connection object.
+        :param addr: the address of the client.
+        """
+        mutation = self.http_request_handler.parse_mutation(request, conn)
+        if mutation is None:
+            return
+        query, handle = mutation
+        server = self.get_linked_server(query.social_network, query.key)
+        if server is None:
+            # Only the social networks of the data can be changed, a change does not create one
+            if query.social_network not in self.index.get_data():
+                conn.sendall(build_response(404, f"There is no {query.social_network} social network."))
+            else:
+                conn.sendall(build_response(self.social_network_request_handler.mutate(query, handle)))
+            return
+        body = b"" if handle is None else handle.encode()
+        head = f"{request.method} /{query.social_network}/{self.query_path(query)} HTTP/1.1\r\nHost: {server[1]}:{server[2]}\r\n{self.tracer.header()}Content-Length: {len(body)}\r\n\r\n"
+        try:
+            response = self.upstream.request(server, head.encode() + body, idempotent=False)
+        except (OSError, HttpError) as e:
+            logger.logger.error("%s: Change sent to %s failed: %s", self.name, server[0], e)
+            conn.sendall(build_response(503))
+            return
+        self.local_request_handler().invalidate(query.social_network, query.key)
+        conn.sendall(build_response(response.status, response.body))
+
+    def finish_request(self, request, route, conn, addr):
+        """
+        Method to record the metrics and the access log of a handled request.
+        :param request: the request.
+        :param route: the kind of request, e.g. the social network of its query.
+        :param conn: the connection object.
+        :param addr: the address of the client.
+        """
+        self.metrics.inc("requests_total", (("route", route),))
+        end = self.metrics.stage("request", request.received_at)
+        if self.tracer.active:
+            self.tracer.finish(route, conn.status)
+        if logger.access_enabled:
+            logger.log_access(self.name, addr, request, conn.status, conn.bytes_sent, end - (request.received_at or end))
+            conn.bytes_sent = 0
+
+    def register_metrics(self):
+        """
+        Method to register the gauges of the server: cache, index, connection pools and
+        open connections.
+        """
+        self.metrics.gauge("cache_entries", "Responses in the cache.", lambda: len(self.cache))
+        self.metrics.gauge("cache_lookups_total", "Cache lookups, by result.", lambda: {
+            (("result", "hit"),): self.cache.hits,
+            (("result", "miss"),): self.cache.misses,
+        }, "counter")
+        if self.cache.shared is not None:
+            self.metrics.gauge("shared_cache_lookups_total", "Lookups in the shared cache, by result.", lambda: {
+                (("result", "hit"),): self.cache.shared.hits,
+                (("result", "miss"),): self.cache.shared.misses,
+            }, "counter")
+        self.metrics.gauge("cache_hit_ratio", "Fraction of the cache lookups that were hits.",
+                           lambda: self.cache.stats()["hit_rate"])
+        self.metrics.gauge("index_entries", "Entries in the index of the data file, by social network.", lambda: {
+            (("social_network", social_network),): len(entries)
+            for social_network, entries in (self.index.data or {}).items()
+        })
+        self.metrics.gauge("pool_connections", "Connections to the linked servers, by server and state.", lambda: {
+            (("server", server[0]), ("shard", HashRing.node_name(server[1], server[2])), ("state", state)): value
+            for server, upstream in self.upstream.upstreams.items()
+            for state, value in upstream.pool.stats().items() if state != "size"
+        })
+        self.metrics.gauge("upstream_circuit_state",
+                           "State of the circuit breaker of each linked server: 0 closed, 1 half open, 2 open.",
+                           self.upstream.states)
+        self.metrics.describe("upstream_retries_total", "counter", "Requests to the linked servers retried, by server.")
+        self.metrics.describe("upstream_hedged_total", "counter", "Requests to the linked servers hedged, by server.")
+        self.metrics.describe("upstream_rejected_total", "counter",
+                              "Requests to the linked servers not sent because their circuit was open, by server.")
+        self.metrics.gauge("open_connections", "Client connections being handled.",
+                           lambda: self.dispatcher.open_connections if self.dispatcher is not None else 0)
+        self.metrics.gauge("collapsed_requests_total",
+                           "Requests that waited for an identical lookup in flight instead of running it.", lambda: {
+                               (("lookup", "linked"),): self.inflight.collapsed,
+                               (("lookup", "local"),): self.local_request_handler().inflight.collapsed,
+                           }, "counter")
+
+    def local_request_handler(self):
+        """
+        Method to get the request handler that looks up queries in the local data.
+        :return: The request handler.
+        """
+        return self.social_network_request_handler
+
+    def read_request(self, conn, addr):
+        """
+        Method to read the next request of a connection, answering the client with an
+        error if the request is malformed or too large.
+        :param conn: the connection object.
+        :param addr: the address of the client.
+        :return: The request, None if there is no request to handle and the connection must be closed.
+        """
+        try:
+            return conn.read_request()
+        except HttpError as e:
+            logger.logger.error("%s: Invalid request from %s: %s", self.name, addr, e)
+            conn.sendall(build_response(e.status, headers={"Connection": "close"}))
+            return None
+
+    def handle_all(self, request, query, conn, addr):
+        """
+        Method to handle a query for all the social networks, fanning it out in parallel to
+        every linked server and to the local data of the social networks without one.
+        If some branches fail or miss the deadline, the results of the others are answered
+        and the missing social networks are listed in the X-Partial-Results header.
+        When some social network has a linked server, a conditional request is always fanned
+        out, and answered with 304 if the ETag of the result did not change (see fan_out).
+        :param request: the request.
+        :param query: the query for all the social networks.
+        :param conn: the connection object.
+        :param addr: the address of the client.
+        """
+        start = time.perf_counter()
+        local = self.serves(query.social_network)
+        etag = self.local_request_handler().etag(query) if local else None
+        condition = None if local else request.headers.get("if-none-match")
+        body = self.cache.get((query.social_network, query.key)) if condition is None else None
+        start = self.metrics.stage("cache", start)
+        if body is None:
+            response = self.inflight.do((query.social_network, query.key), self.fetch_all, query)
+            self.metrics.stage("fanout", start)
+            current = response.headers.get("etag")
+            if condition is not None and current is not None and response.status == 200 \
+                    and etag_matches(condition, current):
+                conn.sendall(self.responses.not_modified(current))
+            else:
+                conn.sendall(self.encode_response(response, etag))
+        else:
+            conn.sendall(self.responses.get(body, etag if local else self.cached_etag(query, body)))
+
+    def encode_response(self, response, etag=None):
+        """
+        Method to get the bytes of the response of a linked server or of a fan out to send to
+        the client. If it found or did not find the person, it has its ETag and the Cache-Control
+        of the server, like the responses from the cache, and a 304 of a linked server is sent
+        with its ETag; a partial or failed response is sent as it is, without validators.
+        :param response: the response.
+        :param etag: the ETag of the query taken from the local data before the response was
+            requested, None to keep the ETag of the response.
+        :return: The response as bytes.
+        """
+        if etag is None:
+            etag = response.headers.get("etag")
+        if response.status == 304 and etag is not None:
+            return self.responses.not_modified(etag)
+        if response.status in (200, 404) and "x-partial-results" not in response.headers:
+            return self.responses.get(response.body.decode() if response.status == 200 else "", etag)
+        return response.to_bytes()
+
+    def serves(self, social_network):
+        """
+        Method to check if the server answers the queries of a social network with its own data,
+        so the social network is loaded in its index.
+        :param social_network: the social network, "all" for every social network.
+        :return: True if the social network has no linked server; for "all", if none has one.
+        """
+        if social_network == "all":
+            return not self.rings
+        return LINKED_SERVER_NAMES.get(social_network) not in self.rings
+
+    def not_modified(self, request, query, conn):
+        """
+        Method to answer 304 to a conditional request (If-None-Match) for a query served with the
+        local data, whose ETag is still the one of the response to its query. The ETag only depends
+        on the version of the data and of the entry of the person, so the cache and the index are
+        not used, except for If-None-Match: *, which only matches if the person exists. The
+        conditional requests for the other queries are decided by the linked servers.
+        :param request: the request.
+        :param query: the query of the request.
+        :param conn: the connection object.
+        :return: True if the request was answered.
+        """
+        condition = request.headers.get("if-none-match")
+        if condition is None or not self.serves(query.social_network):
+            return False
+        etag = self.local_request_handler().etag(query)
+        if etag is None or not etag_matches(condition, etag):
+            return False
+        # * matches any current response, so it is only answered with 304 if the person exists
+        if condition.strip() == "*" and not self.local_request_handler().lookup(query):
+            return False
+        conn.sendall(self.responses.not_modified(etag))
+        return True
+
+    def fetch_all(self, query):
+        """
+        Method to fan out a query for all the social networks and cache its result if it is complete.
+        The body is cached as a string, like the results of the local lookups of "all" queries.
+        :param query: the query for all the social networks.
+        :return: The response.
+        """
+        response = self.fan_out(query)
+        if "x-partial-results" not in response.headers and response.status in (200, 404):
+            body = response.body.decode()
+            self.cache.put((query.social_network, query.key), body, negative=response.status == 404)
+            self.remember_etag(query, body, response.headers.get("etag"))
+        return response
+
+    def remember_etag(self, query, body, etag):
+        """
+        Method to keep the ETag of a cached response of a linked server or of a fan out.
+        :param query: the query.
+        :param body: the body of the response, as cached.
+        :param etag: the ETag of the response, None if it has none.
+        """
+        entry = (query.social_network, query.key)
+        if etag is None:
+            self.linked_etags.pop(entry, None)
+            return
+        if len(self.linked_etags) >= self.cache.capacity:
+            self.linked_etags.clear()
+        self.linked_etags[entry] = (body, etag)
+
+    def cached_etag(self, query, body):
+        """
+        Method to get the ETag of a response from the cache, only if it was kept for the same
+        body: the cache can be filled by other processes (see SharedCache).
+        :param query: the query.
+        :param body: the cached body.
+        :return: The ETag, None if it is not known.
+        """
+        remembered = self.linked_etags.get((query.social_network, query.key))
+        return remembered[1] if remembered is not None and remembered[0] == body else None
+
+    def fetch_linked(self, server, query, condition=None):
+        """
+        Method to send a query to a linked server and cache its response.
+        :param server: the linked server.
+        :param query: the query.
+        :param condition: the If-None-Match header of a conditional request, None for none.
+        :return: The response of the linked server.
+        """
+        response = self.send_request(server, query, condition)
+        self.add_to_cache(query, response)
+        return response
+
+    def fan_out(self, query):
+        """
+        Method to look up a query in every social network in parallel. Each branch has
+        fanout_timeout seconds to answer, and its results are merged as soon as it finishes.
+        When some social network has a linked server and every branch answered, the response
+        has an ETag made from the ETags of the linked servers and the version of the local data.
+        :param query: the query for all the social networks.
+        :return: The response with one "network,handle" line per social network where the person was found.
+        """
+        branches = {}
+        for social_network in LINKED_SERVER_NAMES:
+            server = self.get_linked_server(social_network, query.key)
+            if server is not None:
+                branch_query = make_query(social_network, query.names, query.last_name)
+                # The branch runs in the context of the request, so it sends the id of its trace
+                branches[self.executor.submit(contextvars.copy_context().run, self.lookup_linked, server,
+                                              branch_query)] = social_network
+        local_networks = [social_network for social_network in self.index.get_data() if social_network not in branches.values()]
+        if local_networks:
+            branches[self.executor.submit(self.lookup_local, local_networks, query)] = "local"
+
+        found = {}
+        versions = {}
+        failed = {}
+        try:
+            for future in as_completed(branches, timeout=self.config.fanout_timeout):
+                try:
+                    handles, versions[branches[future]] = future.result()
+                    found.update(handles)
+                except (OSError, ValueError, HttpError) as e:
+                    logger.logger.error("%s: %s branch of %s failed: %s", self.name, branches[future], query, e)
+                    failed[branches[future]] = "error"
+        except TimeoutError:
+            for future, social_network in branches.items():
+                if not future.done():
+                    logger.logger.error("%s: %s branch of %s missed the deadline.", self.name, social_network, query)
+                    failed[social_network] = "timeout"
+
+        # Lowercase, like the headers of the responses read from the linked servers
+        headers = {}
+        if failed:
+            headers["x-partial-results"] = ", ".join(f"{social_network}={reason}" for social_network, reason in failed.items())
+        elif not self.serves(query.social_network):
+            headers["etag"] = make_etag(query.social_network, query.key, sorted(versions.items()),
+                                        self.index.entry_version(query.key))
+        body = "".join(f"{social_network},{handle}\r\n" for social_network, handle in found.items())
+        if body:
+            return HttpResponse(200, body.encode(), headers)
+        return HttpResponse(503 if failed else 404, headers=headers)
+
+    def lookup_linked(self, server, query):
+        """
+        Method to look up a query in a linked server.
+        :param server: the linked server.
+        :param query: the query for the social network of the linked server.
+        :return: tuple with a dict with the handle of the person in the social network, empty if
+            it was not found, and the ETag of the response.
+        """
+        response = self.send_request(server, query)
+        if response.status == 404:
+            return {}, None
+        if response.status != 200:
+            raise HttpError(502, f"{server[0]} answered {response.status}")
+        return {query.social_network: response.body.decode()}, response.headers.get("etag")
+
+    def lookup_local(self, social_networks, query):
+        """
+        Method to look up a query in the local data of some social networks.
+        :param social_networks: the social networks to search in.
+        :param query: the query.
+        :return: tuple with a dict with the handle of the person in each social network where it
+            was found, and None, as the local data has no ETag of its own.
+        """
+        data = self.index.get_data()
+        found = {}
+        for social_network in social_networks:
+            handle = data.get(social_network, {}).get(query.key)
+            if handle is not None:
+                found[social_network] = handle
+        return found, None
+
+    def handle_batch(self, request, conn, addr):
+        """
+        Method to handle a batch request, streaming the results of each batch of queries
+        in the same order as the queries.
+        :param request: the batch request.
+        :param conn: the connection object.
+        :param addr: the address of the client.
+        """
+        logger.logger.info("%s: Handling batch request for %s.", self.name, addr)
+        self.batch_request_handler.start_response(conn)
+        for batch in self.batch_request_handler.read_batches(request):
+            self.batch_request_handler.send_results(conn, self.resolve_batch(batch))
+        self.batch_request_handler.end_response(conn)
+
+    def resolve_batch(self, batch):
+        """
+        Method to resolve a batch of queries. The queries are split by social network and
+        each group is sent as one batch request to its linked server, or resolved with the
+        local data if there is no linked server for it. Like fan_out, a query for all the social
+        networks is sent to the linked server of each social network and looked up in the local
+        data of the others, and its results are merged (see merge_results). The groups are
+        resolved in parallel.
+        :param batch: the queries, or the results of the invalid lines.
+        :return: The results, in the same order as the queries.
+        """
+        results = [None] * len(batch)
+        groups = {}
+        branches = {}
+        for i, query in enumerate(batch):
+            if isinstance(query, dict):
+                results[i] = query
+                continue
+            if query.social_network == "all" and not self.serves("all"):
+                branches[i] = []
+                for social_network in LINKED_SERVER_NAMES:
+                    server = self.get_linked_server(social_network, query.key)
+                    if server is not None:
+                        groups.setdefault(server, []).append(
+                            (i, make_query(social_network, query.names, query.last_name)))
+                groups.setdefault(None, []).append((i, query))
+            else:
+                groups.setdefault(self.get_linked_server(query.social_network, query.key), []).append((i, query))
+
+        futures = []
+        for server, entries in groups.items():
+            queries = [query for _, query in entries]
+            if server is None:
+                futures.append((entries, self.executor.submit(self.resolve_local, queries)))
+            else:
+                futures.append((entries, self.executor.submit(self.send_batch, server, queries)))
+        for entries, future in futures:
+            for (i, _), result in zip(entries, future.result()):
+                if i in branches:
+                    branches[i].append(result)
+                else:
+                    results[i] = result
+        for i, parts in branches.items():
+            results[i] = self.merge_results(batch[i], parts)
+        return results
+
+    @staticmethod
+    def merge_results(query, parts):
+        """
+        Method to merge the results of a query for all the social networks resolved in parts.
+        The social networks whose part failed are listed in partial_results.
+        :param query: the query for all the social networks.
+        :param parts: the results of each linked server and of the local data.
+        :return: The result, 503 if some part failed and the person was not found in the others.
+        """
+        handles = {}
+        failed = []
+        for part in parts:
+            match part["status"]:
+                case 200:
+                    handles.update(part["handles"] if "handles" in part else {part["network"]: part["handle"]})
+                case 404:
+                    pass
+                case _:
+                    failed.append(part["network"])
+        body = "".join(f"{social_network},{handle}\r\n" for social_network, handle in handles.items())
+        result = BatchRequestHandler.result(query, body, status=503 if failed and not body else None)
+        if failed:
+            result["partial_results"] = failed
+        return result
 
-    def link_server(self, name, host, port):
+    def resolve_local(self, queries):
+        """
+        Method to resolve queries with the local data.
+        :param queries: the queries.
+        :return: The results, in the same order as the queries.
+        """
+        return [BatchRequestHandler.result(query, self.social_network_request_handler.lookup(query)) for query in queries]
+
+    def get_linked_server(self, social_network, key):
+        """
+        Method to get the linked server that serves a person of a social network. When
+        several servers are linked for the social network, the person is routed to one of
+        them by the consistent hash of its normalized full name.
+        :param social_network: the social network.
+        :param key: the normalized full name of the person.
+        :return: The (name, host, port) of the linked server, None if there is none.
         """
-        Method to link a server to another server.
+        ring = self.rings.get(LINKED_SERVER_NAMES.get(social_network))
+        return self.upstream.choose(ring.get(key)) if ring else None
+
+    def link_server(self, name, host, port, shard=None):
+        """
+        Method to link a server to another server. The connections to the linked server
+        are kept open in a pool so they can be reused by the following requests. Several
+        servers can be linked with the same name, as the shards of a social network, and
+        several servers can be linked to the same shard, as its replicas.
         :param name: the name of the server to link to.
         :param host: the host of the server to link to.
         :param port: the port of the server to link to.
+        :param shard: the name of the shard of the server in the hash ring, host:port of the
+            server if None. The replicas of a shard are linked with the same shard name.
         """
-        self.linked_servers.append((name, host, port))
+        server = (name, host, port)
+        shard = shard or HashRing.node_name(host, port)
+        reload = name not in self.rings and self.index.data is not None
+        ring = self.rings.setdefault(name, HashRing())
+        replicas = ring.nodes.get(shard)
+        if replicas is None:
+            replicas = []
+            ring.add(shard, replicas)
+        replicas.append(server)
+        self.linked_servers.append(server)
+        self.upstream.add(server, replicas)
+        # The social network is not served with the local data anymore
+        if reload:
+            self.index.load()
 
-    def send_request(self, server, query):
+    def unlink_server(self, name, host, port):
         """
-        Method to send a request to another server.
+        Method to unlink a server, e.g. a shard being removed. Its people are routed to the
+        other shards of the social network.
+        :param name: the name of the linked server.
+        :param host: the host of the linked server.
+        :param port: the port of the linked server.
+        """
+        server = (name, host, port)
+        if server not in self.upstream.upstreams:
+            return
+        ring = self.rings[name]
+        shard = next(shard for shard, replicas in ring.nodes.items() if server in replicas)
+        ring.nodes[shard].remove(server)
+        if not ring.nodes[shard]:
+            ring.remove(shard)
+        self.linked_servers.remove(server)
+        self.upstream.remove(server)
+        if not ring:
+            del self.rings[name]
+            # The social network is served with the local data again
+            if self.index.data is not None:
+                self.index.load()
+
+    def add_to_cache(self, query, response):
+        """
+        Method to cache the response of a linked server, only if it found or did not find the person.
+        The body is cached as a string, empty if the person was not found, like the results of
+        the local lookups, so the entries can be shared with the linked servers.
+        :param query: the query sent to the linked server.
+        :param response: the response of the linked server.
+        """
+        if response.status in (200, 404):
+            body = response.body.decode() if response.status == 200 else ""
+            self.cache.put((query.social_network, query.key), body, negative=response.status == 404)
+            self.remember_etag(query, body, response.headers.get("etag"))
+
+    def send_request(self, server, query, condition=None):
+        """
+        Method to send a request to another server, using a connection of its pool.
         :param server: the server to send the request to.
         :param query: the query to send.
+        :param condition: the If-None-Match header of a conditional request, None for none.
+        :return: The response of the server.
         """
-        self.client_socket.connect((server[1], server[2]))
-        request = f"GET /{query.social_network}/{"/".join(query.names) + "/" + "/".join(query.last_name)} HTTP/1.1\r\nHost: {server[1]}:{server[2]}\r\n\r\n"
-        self.client_socket.sendall(request.encode())
-        response = self.client_socket.recv(1024)
-        self.client_socket.close()
-        return response
+        headers = self.tracer.header()
+        if condition is not None:
+            headers += f"If-None-Match: {condition}\r\n"
+        request = f"GET /{query.social_network}/{self.query_path(query)} HTTP/1.1\r\nHost: {server[1]}:{server[2]}\r\n{headers}\r\n"
+        return self.upstream.request(server, request.encode())
+
+    @staticmethod
+    def query_path(query):
+        """
+        Method to build the path of the names and last names of a query, percent-encoded.
+        :param query: the query.
+        :return: The path, without the social network.
+        """
+        return "/".join(quote(part, safe="") for part in (*query.names, *query.last_name))
+
+    def send_batch(self, server, queries):
+        """
+        Method to send a batch of queries to another server, using a connection of its pool.
+        :param server: the server to send the queries to.
+        :param queries: the queries to send.
+        :return: The results, in the same order as the queries.
+        """
+        body = b"".join(BatchRequestHandler.encode_query(query) for query in queries)
+        request = f"POST /batch HTTP/1.1\r\nHost: {server[1]}:{server[2]}\r\n{self.tracer.header()}Content-Type: application/x-ndjson\r\nContent-Length: {len(body)}\r\n\r\n"
+        try:
+            response = self.upstream.request(server, request.encode() + body)
+            if response.status != 200:
+                raise HttpError(502, f"{server[0]} answered {response.status}")
+            results = [json.loads(line) for line in response.body.splitlines() if line.strip()]
+            if len(results) != len(queries):
+                raise HttpError(502, f"{server[0]} answered {len(results)} results for {len(queries)} queries")
+            return results
+        except (OSError, ValueError, HttpError) as e:
+            logger.logger.error("%s: Batch request to %s failed: %s", self.name, server[0], e)
+            return [BatchRequestHandler.result(query, status=503) for query in queries]
 
 class SocialNetworkServer(HttpServer):
     """
     SocialNetworkServer class that extends HttpServer class and provides the behavior
     for the social network servers.
+
+    The server only loads the people of its social network. It can be one of several shards
+    of its social network (or one of the replicas of a shard): it then loads only the people
+    that the hash ring of the shards maps to its shard, the same ring the front server routes
+    the queries with.
+
+    Attributes:
+        social_network (str): The social network served.
+        ring (HashRing): The hash ring of the shards of the social network, None if the
+            server is not sharded.
     """
-    def __init__(self, host, port, name, data_path, social_network):
-        super().__init__(host, port, name, data_path)
+    def __init__(self, host, port, name, data_path, social_network, config=None, shards=None):
+        self.ring = None
+        key_filter = None
+        if shards:
+            self.ring = HashRing(HashRing.node_name(*replicas[0]) for replicas in shards)
+            shard = next((replicas for replicas in shards if (host, port) in replicas), None)
+            if shard is None:
+                raise ValueError(f"{name} at {HashRing.node_name(host, port)} is not one of the shards "
+                                 f"{', '.join(self.ring.nodes)}.")
+            key_filter = self.ring.owns(HashRing.node_name(*shard[0]))
+        super().__init__(host, port, name, data_path, config, key_filter)
         self.social_network = social_network
-        self.request_handler = SocialNetworkRequestHandler(data_path, social_network, Query)
+        if self.search_request_handler is not None:
+            self.search_request_handler.social_network = social_network
+        self.request_handler = SocialNetworkRequestHandler(data_path, social_network, Query, self.index, self.cache,
+                                                           self.metrics, self.responses)
 
-    def start(self):
+    def handle_connection(self, conn, addr):
         """
-        Method to start the server, listen on the port and handle requests.
+        Method to handle a request received on a connection.
+        :param conn: the connection object.
+        :param addr: the address of the client.
+        :return: True if the connection must be kept open, False otherwise.
         """
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.bind((self.host, self.port))
-            s.listen()
-            logger.logger.info(f"{self.name}: Server listening on {self.host}:{self.port}")
+        request = self.read_request(conn, addr)
+        if request is None:
+            return False
+        self.tracer.start(request)
+        start = self.metrics.stage("read", request.received_at)
+        logger.logger.info("%s: Handling request for %s.", self.name, addr)
+        if self.handle_reserved(request, conn, addr):
+            return request.keep_alive
 
-            while True:
-                conn, addr = s.accept()
-                with conn:
-                    logger.logger.info(f"{self.name}: Connection from {addr} has been established.")
-                    logger.logger.info(f"{self.name}: Handling request for {addr}.")
+        # Check if the request is valid and can be handled
+        query = self.social_network_request_handler.handle_request(request, conn, addr)
+        self.metrics.stage("parse", start)
+        if query:
+            logger.logger.info("%s: Query for %s is %s query.", self.name, addr, query.social_network)
+            if self.not_modified(request, query, conn):
+                self.finish_request(request, "not_modified", conn, addr)
+            else:
+                self.request_handler.handle_query(query, conn, addr)
+                self.finish_request(request, self.social_network, conn, addr)
 
-                    # Check if the request is valid and can be handled
-                    query = self.social_network_request_handler.handle_request(conn, addr)
-                    if query:
-                        logger.logger.info(f"{self.name}: Query for {addr} is {query.social_network} query.")
-                        self.request_handler.handle_query(query, conn, addr)
+        else:
+            logger.logger.info("%s: Request for %s answered without a query.", self.name, addr)
+            self.finish_request(request, "none", conn, addr)
+        request.drain()
+        return request.keep_alive
 
-                    else:
-                        logger.logger.error(f"{self.name}: Query for {addr} is None.")
-                        logger.logger.info(f"{self.name}: Closing connection for {addr}.")
-                        conn.close()
+    def local_request_handler(self):
+        return self.request_handler
+
+    def serves(self, social_network):
+        return social_network == self.social_network
+
+    def handle_mutation(self, request, conn, addr):
+        """
+        Method to handle a mutation request, only for the people of the social network (and
+        the shard) of the server.
+        :param request: the mutation request.
+        :param conn: the connection object.
+        :param addr: the address of the client.
+        """
+        mutation = self.http_request_handler.parse_mutation(request, conn)
+        if mutation is None:
+            return
+        query, handle = mutation
+        if query.social_network != self.social_network:
+            conn.sendall(build_response(400, f"{self.name} only serves {self.social_network} changes."))
+        elif self.index.key_filter is not None and not self.index.key_filter(query.key):
+            conn.sendall(build_response(400, f"{query.names} {query.last_name} is not in this shard."))
+        else:
+            conn.sendall(build_response(self.request_handler.mutate(query, handle)))
+
+    def resolve_batch(self, batch):
+        """
+        Method to resolve a batch of queries with the local data. Only queries for the
+        social network of the server are resolved.
+        :param batch: the queries, or the results of the invalid lines.
+        :return: The results, in the same order as the queries.
+        """
+        results = []
+        for query in batch:
+            if isinstance(query, dict):
+                results.append(query)
+            elif query.social_network != self.social_network:
+                result = BatchRequestHandler.result(query, status=400)
+                result["error"] = f"{self.name} only serves {self.social_network} queries."
+                results.append(result)
+            else:
+                results.append(BatchRequestHandler.result(query, self.request_handler.lookup(query)))
+        return results
 
 class InstagramServer(SocialNetworkServer):
     """
@@ -139,9 +1092,9 @@ class InstagramServer(SocialNetworkServer):
     request handler for Instagram requests.
     """
 
-    def __init__(self, host, port, data_path):
-        super().__init__(host, port, "InstagramServer", data_path, "instagram")
-        self.social_network_request_handler = InstagramRequestHandler(data_path)
+    def __init__(self, host, port, data_path, config=None, shards=None):
+        super().__init__(host, port, "InstagramServer", data_path, "instagram", config, shards)
+        self.social_network_request_handler = InstagramRequestHandler(data_path, self.index, self.cache, self.metrics)
 
 class WhatsAppServer(SocialNetworkServer):
     """
@@ -149,6 +1102,6 @@ class WhatsAppServer(SocialNetworkServer):
     request handler for WhatsApp requests.
     """
 
-    def __init__(self, host, port, data_path):
-        super().__init__(host, port, "WhatsAppServer", data_path, "whatsapp")
-        self.social_network_request_handler = WhatsAppRequestHandler(data_path)
+    def __init__(self, host, port, data_path, config=None, shards=None):
+        super().__init__(host, port, "WhatsAppServer", data_path, "whatsapp", config, shards)
+        self.social_network_request_handler = WhatsAppRequestHandler(data_path, self.index, self.cache, self.metrics)
@@ -0,0 +1,140 @@
+"""
+Sharding module that spreads the people of the data file between several instances of a
+social network server with consistent hashing.
+"""
+import hashlib
+from bisect import bisect
+
+REPLICAS = 100
+
+
+def stable_hash(value):
+    """
+    Function to hash a string to 64 bits, the same in every process (unlike hash).
+    :param value: the string.
+    :return: The hash.
+    """
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "little")
+
+
+class HashRing:
+    """
+    HashRing class that maps keys to nodes with consistent hashing. Each node is placed at
+    replicas points of a ring of 64 bits hashes, and a key belongs to the node of the first
+    point after its hash. Adding or removing a node only moves the keys of the points next
+    to its own, about 1/n of the keys, and with enough replicas the keys are spread evenly.
+
+    Every process that builds a ring with the same node names maps the keys the same way,
+    so the front server and each shard agree on which shard serves a person.
+
+    Attributes:
+        replicas (int): The number of points of each node.
+        nodes (dict): The node of each name.
+        points (list): The sorted hashes of the points.
+        owners (list): The name of the node of each point.
+    """
+
+    def __init__(self, names=(), replicas=REPLICAS):
+        self.replicas = replicas
+        self.nodes = {}
+        self.points = []
+        self.owners = []
+        for name in names:
+            self.add(name)
+
+    @staticmethod
+    def node_name(host, port):
+        """
+        Method to get the name of the node of a server, the same in the front server and the shard.
+        :param host: the host of the server.
+        :param port: the port of the server.
+        :return: The name, host:port.
+        """
+        return f"{host}:{port}"
+
+    @staticmethod
+    def parse(value):
+        """
+        Method to parse a list of shards, e.g. the INSTAGRAM_SHARDS setting. The shards are
+        separated by commas, and the replicas of a shard by "+". The name of a shard in the
+        ring is the host:port of its first replica.
+        :param value: the host:port of each replica of each shard, e.g. "a:8081+b:8081,a:8083".
+        :return: list with the list of (host, port) tuples of the replicas of each shard.
+        """
+        shards = []
+        for shard in value.split(","):
+            replicas = []
+            for replica in shard.split("+"):
+                if replica.strip():
+                    host, _, port = replica.strip().rpartition(":")
+                    replicas.append((host, int(port)))
+            if replicas:
+                shards.append(replicas)
+        return shards
+
+    def add(self, name, node=None):
+        """
+        Method to add a node to the ring.
+        :param name: the name of the node, hashed to place it.
+        :param node: the node returned for its keys, the name if None.
+        """
+        self.nodes[name] = name if node is None else node
+        self.rebuild()
+
+    def remove(self, name):
+        """
+        Method to remove a node from the ring, its keys move to the following nodes.
+        :param name: the name of the node.
+        """
+        self.nodes.pop(name, None)
+        self.rebuild()
+
+    def rebuild(self):
+        """
+        Method to place the points of every node in the ring.
+        """
+        points = sorted((stable_hash(f"{name}#{replica}"), name)
+                        for name in self.nodes for replica in range(self.replicas))
+        self.points = [point for point, _ in points]
+        self.owners = [name for _, name in points]
+
+    @staticmethod
+    def key_string(key):
+        """
+        Method to get the string hashed for a normalized key.
+        :param key: the normalized full name, a tuple of names and last names.
+        :return: The string.
+        """
+        return "\0".join(key)
+
+    def get_name(self, key):
+        """
+        Method to get the name of the node of a key.
+        :param key: the normalized full name.
+        :return: The name of the node, None if the ring is empty.
+        """
+        if not self.points:
+            return None
+        i = bisect(self.points, stable_hash(self.key_string(key)))
+        return self.owners[i % len(self.owners)]
+
+    def get(self, key):
+        """
+        Method to get the node of a key.
+        :param key: the normalized full name.
+        :return: The node, None if the ring is empty.
+        """
+        name = self.get_name(key)
+        return None if name is None else self.nodes[name]
+
+    def owns(self, name):
+        """
+        Method to get a function that tells if a key belongs to a node, used by a shard to
+        load only its slice of the data.
+        :param name: the name of the node.
+        :return: function of a key that returns True if it belongs to the node.
+        """
+        return lambda key: self.get_name(key) == name
+
+    def __len__(self):
+        return len(self.nodes)
@@ -0,0 +1,68 @@
+"""
+Single-flight module that collapses identical concurrent lookups into one.
+"""
+import threading
+
+
+class Call:
+    """
+    Call class with the state of a lookup in flight, shared by the requests waiting for it.
+
+    Attributes:
+        done (Event): Set when the lookup finished.
+        result (object): The result of the lookup.
+        error (Exception): The exception raised by the lookup, None if it succeeded.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    SingleFlight class that runs at most one lookup per key at a time. A request for a key
+    that is already being looked up waits for that lookup and gets its result (or its
+    exception) instead of running the lookup again.
+
+    Attributes:
+        calls (dict): The lookups in flight, by key.
+        collapsed (int): Number of requests that waited for another lookup instead of running one.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.collapsed = 0
+        self.lock = threading.Lock()
+
+    def do(self, key, function, *args):
+        """
+        Method to run a lookup, or wait for the one in flight for the same key.
+        :param key: the key of the lookup.
+        :param function: the function that does the lookup.
+        :param args: the arguments of the function.
+        :return: The result of the lookup.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+            else:
+                self.collapsed += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = function(*args)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
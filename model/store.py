@@ -0,0 +1,322 @@
+"""
+Store module with a memory-compact storage for the data of the social networks.
+
+The parsed data is a dict of dicts of tuples of strings, which costs a few hundred bytes
+per person. The compact store keeps each distinct string once, packed in a single bytes
+blob, and each person as three integers in typed arrays, with an open addressing hash
+table of row numbers to find a person by their normalized full name.
+
+The store can also be written to an index file (see CompileIndex.py) and loaded back with
+mmap: the arrays are read straight from the mapped file, so loading does not parse
+anything and every process that maps the same file shares its pages.
+
+Index file layout, every integer a native-endian uint32 and every section aligned to 4 bytes:
+    header: magic, byte order mark, number of tables, number of strings, blob size
+    strings: the offsets of the strings, then the blob
+    tables, each one: name size, rows, slots, size, the name, then the names, last names,
+        handles and slots arrays
+"""
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from collections.abc import MutableMapping
+
+EMPTY = 0xFFFFFFFF
+MAGIC = b"CCIDX002"
+BYTE_ORDER_MARK = 0x01020304
+HEADER = struct.Struct("=8sIIII")
+TABLE_HEADER = struct.Struct("=IIII")
+MISSING = object()
+
+
+def key_hash(key):
+    """
+    Function to get a hash of a normalized full name that is stable between processes.
+    :param key: the normalized full name, a tuple with the names and the last names.
+    :return: The hash, a 32 bits unsigned integer.
+    """
+    return zlib.crc32("\x1f".join(key).encode())
+
+
+def padding(size):
+    """
+    Function to get the bytes needed to align a section of the index file to 4 bytes.
+    :param size: the size of the section.
+    :return: The padding as bytes.
+    """
+    return b"\0" * (-size % 4)
+
+
+class StringTable:
+    """
+    StringTable class that stores strings once each, packed in a bytes blob. Each string
+    is identified by its position in the table.
+
+    Attributes:
+        blob (bytearray): The UTF-8 encoded strings, one after the other.
+        offsets (array): The offset of each string in the blob, plus the end of the last one.
+            Both can also be memoryviews of a mapped index file.
+    """
+
+    def __init__(self, blob=None, offsets=None):
+        self.blob = blob if blob is not None else bytearray()
+        self.offsets = offsets if offsets is not None else array("I", [0])
+        self._ids = {}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def add(self, string):
+        """
+        Method to add a string to the table, if it is not already in it.
+        :param string: the string to add.
+        :return: The id of the string.
+        """
+        string_id = self._ids.get(string)
+        if string_id is None:
+            string_id = len(self.offsets) - 1
+            self._ids[string] = string_id
+            self.blob += string.encode()
+            self.offsets.append(len(self.blob))
+        return string_id
+
+    def get(self, string_id):
+        """
+        Method to get a string of the table.
+        :param string_id: the id of the string.
+        :return: The string.
+        """
+        return str(self.raw(string_id), "utf-8")
+
+    def raw(self, string_id):
+        """
+        Method to get the encoded bytes of a string of the table, without copying them.
+        :param string_id: the id of the string.
+        :return: The bytes, as a slice of the blob.
+        """
+        return memoryview(self.blob)[self.offsets[string_id]:self.offsets[string_id + 1]]
+
+    def freeze(self):
+        """
+        Method to drop the structures only needed to add strings.
+        """
+        self._ids = {}
+        self.blob = bytes(self.blob)
+
+
+class CompactTable(MutableMapping):
+    """
+    CompactTable class with the data of one social network. It behaves as a dict from
+    normalized full name to handle. The compact arrays are read-only: the people changed
+    after the table was built are kept in an overlay dict that is checked first.
+
+    Attributes:
+        strings (StringTable): The strings of the names, last names and handles.
+        names (array): The string id of the names of each row.
+        last_names (array): The string id of the last names of each row.
+        handles (array): The string id of the handle of each row.
+        slots (array): The hash table, with the row of each key or EMPTY.
+        size (int): The number of distinct keys.
+        overlay (dict): The handle of each person changed after the table was built, None
+            for the people deleted.
+    """
+
+    def __init__(self, strings, names, last_names, handles, slots, size=None):
+        self.strings = strings
+        self.names = names
+        self.last_names = last_names
+        self.handles = handles
+        self.slots = slots
+        self.size = size if size is not None else sum(1 for row in slots if row != EMPTY)
+        self.overlay = {}
+
+    @classmethod
+    def build(cls, strings, names, last_names, handles, hashes):
+        """
+        Method to build the hash table of the rows of a social network. When a key appears
+        more than once, the last row wins, as in a dict.
+        :param strings: the string table.
+        :param names: the string id of the names of each row.
+        :param last_names: the string id of the last names of each row.
+        :param handles: the string id of the handle of each row.
+        :param hashes: the key hash of each row, only needed to build the table.
+        :return: The table.
+        """
+        capacity = 8
+        while capacity < len(names) * 2:
+            capacity *= 2
+        slots = array("I", [EMPTY]) * capacity
+        mask = capacity - 1
+        for row in range(len(names)):
+            slot = hashes[row] & mask
+            while slots[slot] != EMPTY and (names[slots[slot]], last_names[slots[slot]]) != (names[row], last_names[row]):
+                slot = (slot + 1) & mask
+            slots[slot] = row
+        return cls(strings, names, last_names, handles, slots)
+
+    def find(self, key):
+        """
+        Method to find the row of a key.
+        :param key: the normalized full name.
+        :return: The row, None if the key is not in the table.
+        """
+        names, last_names = key[0].encode(), key[1].encode()
+        mask = len(self.slots) - 1
+        slot = zlib.crc32(names + b"\x1f" + last_names) & mask
+        while (row := self.slots[slot]) != EMPTY:
+            if self.strings.raw(self.names[row]) == names and self.strings.raw(self.last_names[row]) == last_names:
+                return row
+            slot = (slot + 1) & mask
+        return None
+
+    def get(self, key, default=None):
+        if self.overlay:
+            handle = self.overlay.get(key, MISSING)
+            if handle is not MISSING:
+                return default if handle is None else handle
+        row = self.find(key)
+        if row is None:
+            return default
+        return self.strings.get(self.handles[row])
+
+    def __getitem__(self, key):
+        handle = self.get(key, MISSING)
+        if handle is MISSING:
+            raise KeyError(key)
+        return handle
+
+    def __setitem__(self, key, handle):
+        if key not in self:
+            self.size += 1
+        self.overlay[key] = handle
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.overlay[key] = None
+        self.size -= 1
+
+    def __iter__(self):
+        for row in self.slots:
+            if row != EMPTY:
+                key = self.strings.get(self.names[row]), self.strings.get(self.last_names[row])
+                if key not in self.overlay:
+                    yield key
+        for key, handle in list(self.overlay.items()):
+            if handle is not None:
+                yield key
+
+    def __len__(self):
+        return self.size
+
+
+class CompactStore(MutableMapping):
+    """
+    CompactStore class with the compact data of every social network. It behaves as a
+    dict from social network to CompactTable (or dict, for the social networks added after
+    the store was built).
+
+    Attributes:
+        strings (StringTable): The strings shared by every social network.
+        tables (dict): The table of each social network.
+    """
+
+    def __init__(self, strings, tables):
+        self.strings = strings
+        self.tables = tables
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Method to build the store from the rows of the data.
+        :param rows: iterable of (social network, normalized full name, handle) tuples.
+        :return: The store.
+        """
+        strings = StringTable()
+        columns = {}
+        for social_network, key, handle in rows:
+            if social_network not in columns:
+                columns[social_network] = (array("I"), array("I"), array("I"), array("I"))
+            names, last_names, handles, hashes = columns[social_network]
+            names.append(strings.add(key[0]))
+            last_names.append(strings.add(key[1]))
+            handles.append(strings.add(handle))
+            hashes.append(key_hash(key))
+        strings.freeze()
+        tables = {social_network: CompactTable.build(strings, *column) for social_network, column in columns.items()}
+        return cls(strings, tables)
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Method to load a store from an index file, mapping it in memory.
+        :param path: the path to the index file.
+        :return: The store.
+        """
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        position = 0
+
+        def read(size):
+            nonlocal position
+            if position + size > len(view):
+                raise ValueError(f"Index file {path} is truncated.")
+            section = view[position:position + size]
+            position += size + (-size % 4)
+            return section
+
+        magic, byte_order_mark, table_count, string_count, blob_size = HEADER.unpack(read(HEADER.size))
+        if magic[:5] == MAGIC[:5] and magic != MAGIC:
+            raise ValueError(f"Index file {path} was compiled by another version, compile it again.")
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an index file.")
+        if byte_order_mark != BYTE_ORDER_MARK:
+            raise ValueError(f"Index file {path} was compiled on a machine with another byte order.")
+        offsets = read((string_count + 1) * 4).cast("I")
+        strings = StringTable(read(blob_size), offsets)
+        tables = {}
+        for _ in range(table_count):
+            name_size, rows, capacity, size = TABLE_HEADER.unpack(read(TABLE_HEADER.size))
+            social_network = str(read(name_size), "utf-8")
+            names, last_names, handles = (read(rows * 4).cast("I") for _ in range(3))
+            slots = read(capacity * 4).cast("I")
+            tables[social_network] = CompactTable(strings, names, last_names, handles, slots, size)
+        return cls(strings, tables)
+
+    def write(self, path):
+        """
+        Method to write the store to an index file. The file is written next to the
+        destination and then renamed, so processes watching it never see it half written.
+        Only a store built from rows, without changes, can be written.
+        :param path: the path to the index file.
+        """
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, BYTE_ORDER_MARK, len(self.tables), len(self.strings), len(self.strings.blob)))
+            f.write(array("I", self.strings.offsets).tobytes())
+            f.write(bytes(self.strings.blob) + padding(len(self.strings.blob)))
+            for social_network, table in self.tables.items():
+                name = social_network.encode()
+                f.write(TABLE_HEADER.pack(len(name), len(table.names), len(table.slots), table.size))
+                f.write(name + padding(len(name)))
+                for column in (table.names, table.last_names, table.handles, table.slots):
+                    f.write(array("I", column).tobytes())
+        os.replace(temporary_path, path)
+
+    def __getitem__(self, social_network):
+        return self.tables[social_network]
+
+    def __setitem__(self, social_network, table):
+        self.tables[social_network] = table
+
+    def __delitem__(self, social_network):
+        del self.tables[social_network]
+
+    def __iter__(self):
+        return iter(self.tables)
+
+    def __len__(self):
+        return len(self.tables)
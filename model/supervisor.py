@@ -0,0 +1,207 @@
+"""
+Supervisor module that starts the servers of the project as child processes, waits until
+they are ready, restarts them when they exit and restarts them one by one on request.
+"""
+import os
+import selectors
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from model.logger import logger
+
+RESTART_DELAY = 1.0
+
+
+class Service:
+    """
+    Service class with a server run by the supervisor.
+
+    Attributes:
+        name (str): The name of the server, used in the logs.
+        script (str): The entry script of the server.
+        env (dict): Extra environment variables of the server, e.g. its port.
+        process (Popen): The running process, None if it is not running.
+        started (float): The time the process was started.
+    """
+
+    def __init__(self, name, script, env=None):
+        self.name = name
+        self.script = script
+        self.env = env or {}
+        self.process = None
+        self.started = 0.0
+
+
+class Supervisor:
+    """
+    Supervisor class that runs every server of the project from a single command.
+
+    The servers are started in parallel, each one with the write end of a pipe in the
+    READY_FD environment variable, where the server writes once its index is loaded and its
+    port is open (see HttpServer.notify_ready). So the cold start takes as long as the
+    slowest server, and there is no need to poll the ports. A server that exits is started
+    again; on SIGHUP the servers are restarted one at a time, starting the new process and
+    waiting until it is ready before stopping the old one (both share the port with
+    SO_REUSEPORT); on SIGTERM or SIGINT every server is stopped. The servers run in their
+    own session, so a Ctrl+C in the terminal only reaches the supervisor.
+
+    Attributes:
+        services (list): The servers.
+        cwd (str): The working directory of the servers.
+        start_timeout (float): Seconds a server has to be ready.
+        drain_timeout (float): Seconds a server has to finish its requests when stopped.
+        stopping (Event): Set when the supervisor must stop.
+        restart_requested (bool): True when a rolling restart was requested.
+    """
+
+    def __init__(self, services, cwd=None, start_timeout=120.0, drain_timeout=10.0):
+        self.services = services
+        self.cwd = cwd
+        self.start_timeout = start_timeout
+        self.drain_timeout = drain_timeout
+        self.stopping = threading.Event()
+        self.restart_requested = False
+
+    def run(self):
+        """
+        Method to start the servers and supervise them until the supervisor is stopped.
+        :return: True if every server started, False otherwise.
+        """
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGHUP, self.request_restart)
+        start = time.monotonic()
+        pending = {service: self.spawn(service) for service in self.services}
+        failed = [service.name for service, ready in self.wait_ready(pending).items() if not ready]
+        if failed:
+            logger.logger.error("Supervisor: %s did not start, stopping.", ", ".join(failed))
+            self.shutdown()
+            return False
+        logger.logger.info("Supervisor: all servers ready in %.2fs.", time.monotonic() - start)
+        while not self.stopping.wait(0.2):
+            if self.restart_requested:
+                self.restart_requested = False
+                self.rolling_restart()
+            self.reap()
+        self.shutdown()
+        return True
+
+    def stop(self, signum=None, frame=None):
+        """
+        Method to ask the supervisor to stop, used as its signal handler.
+        """
+        self.stopping.set()
+
+    def request_restart(self, signum=None, frame=None):
+        """
+        Method to ask the supervisor for a rolling restart, used as its SIGHUP handler.
+        """
+        self.restart_requested = True
+
+    def spawn(self, service):
+        """
+        Method to start the process of a server.
+        :param service: the server.
+        :return: The read end of its readiness pipe.
+        """
+        read_fd, write_fd = os.pipe()
+        env = dict(os.environ, **service.env, READY_FD=str(write_fd))
+        try:
+            service.process = subprocess.Popen([sys.executable, service.script], cwd=self.cwd, env=env,
+                                               pass_fds=(write_fd,), start_new_session=True)
+        finally:
+            os.close(write_fd)
+        service.started = time.monotonic()
+        logger.logger.info("Supervisor: started %s (pid %s).", service.name, service.process.pid)
+        return read_fd
+
+    def wait_ready(self, pending):
+        """
+        Method to wait until some servers are ready, or exit, or start_timeout passes.
+        :param pending: the read end of the readiness pipe of each server.
+        :return: dict with True for each server that is ready.
+        """
+        ready = {service: False for service in pending}
+        deadline = time.monotonic() + self.start_timeout
+        with selectors.DefaultSelector() as selector:
+            for service, read_fd in pending.items():
+                selector.register(read_fd, selectors.EVENT_READ, service)
+            while selector.get_map() and not self.stopping.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                for key, _ in selector.select(min(remaining, 0.5)):
+                    service = key.data
+                    # The server writes a line when it is ready, and the pipe closes if it exits before
+                    ready[service] = os.read(key.fd, 64).startswith(b"ready")
+                    selector.unregister(key.fd)
+                    if ready[service]:
+                        logger.logger.info("Supervisor: %s ready in %.2fs.", service.name,
+                                           time.monotonic() - service.started)
+            for key in list(selector.get_map().values()):
+                selector.unregister(key.fd)
+        for read_fd in pending.values():
+            os.close(read_fd)
+        return ready
+
+    def reap(self):
+        """
+        Method to start again the servers that exited.
+        """
+        for service in self.services:
+            if service.process is None or service.process.poll() is None:
+                continue
+            logger.logger.error("Supervisor: %s (pid %s) exited with code %s, restarting it.", service.name,
+                                service.process.pid, service.process.returncode)
+            if time.monotonic() - service.started < RESTART_DELAY:
+                self.stopping.wait(RESTART_DELAY)
+            if self.stopping.is_set():
+                return
+            self.wait_ready({service: self.spawn(service)})
+
+    def rolling_restart(self):
+        """
+        Method to restart the servers one at a time. The new process of each server must be
+        ready before the old one is stopped, so the port keeps being served; if it does not
+        get ready, the old process is kept.
+        """
+        logger.logger.info("Supervisor: rolling restart.")
+        for service in self.services:
+            old = service.process
+            if not self.wait_ready({service: self.spawn(service)})[service]:
+                logger.logger.error("Supervisor: new %s did not get ready, keeping the old one.", service.name)
+                self.terminate(service.process)
+                service.process = old
+                continue
+            self.terminate(old)
+        logger.logger.info("Supervisor: rolling restart done.")
+
+    def terminate(self, process):
+        """
+        Method to stop a process, giving it drain_timeout seconds to finish its requests
+        before killing it.
+        :param process: the process.
+        """
+        if process is None or process.poll() is not None:
+            return
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(self.drain_timeout + 1)
+        except subprocess.TimeoutExpired:
+            logger.logger.warning("Supervisor: killing pid %s.", process.pid)
+            process.kill()
+            process.wait()
+
+    def shutdown(self):
+        """
+        Method to stop every server.
+        """
+        logger.logger.info("Supervisor: stopping the servers.")
+        for service in self.services:
+            if service.process is not None and service.process.poll() is None:
+                service.process.send_signal(signal.SIGTERM)
+        for service in self.services:
+            self.terminate(service.process)
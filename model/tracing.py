@@ -0,0 +1,319 @@
+"""
+Tracing module with the sampled traces of the requests, which record how long each stage of
+a request took in each server it went through, and the profiler of a running server.
+"""
+import contextvars
+import cProfile
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, deque
+
+from model.logger import logger
+
+REQUEST_ID_HEADER = "X-Request-Id"
+DEFAULT_SAMPLE_RATE = 0.01
+KEEP_TRACES = 100
+PROFILE_SECONDS = 10.0
+SAMPLE_INTERVAL = 0.005
+PROFILE_MODES = ("sample", "cprofile")
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Trace:
+    """
+    Trace class with the spans of a request traced in a server. The servers a request goes
+    through trace it with the same request id, so its spans can be joined.
+
+    Attributes:
+        request_id (str): The id of the request, shared by every server it went through.
+        method (str): The method of the request.
+        path (str): The path of the request.
+        started (float): The time.perf_counter when the request was received.
+        timestamp (float): The time.time when the trace started.
+        spans (list): The (stage, start, end) of each stage of the request, in time.perf_counter.
+    """
+    __slots__ = ("request_id", "method", "path", "started", "timestamp", "spans")
+
+    def __init__(self, request_id, method, path, started):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.started = started
+        self.timestamp = time.time()
+        self.spans = []
+
+    def to_dict(self, server, route, status):
+        """
+        Method to get the trace as a dict, with the times in milliseconds from the start of the request.
+        :param server: the name of the server.
+        :param route: the kind of request, e.g. the social network of its query.
+        :param status: the status of the response.
+        :return: The trace.
+        """
+        end = max((span[2] for span in self.spans), default=self.started)
+        return {
+            "request_id": self.request_id,
+            "server": server,
+            "pid": os.getpid(),
+            "timestamp": self.timestamp,
+            "method": self.method,
+            "path": self.path,
+            "route": route,
+            "status": status,
+            "duration_ms": (end - self.started) * 1000,
+            "spans": [{"stage": stage, "start_ms": (start - self.started) * 1000, "duration_ms": (end - start) * 1000}
+                      for stage, start, end in self.spans],
+        }
+
+
+class Tracer:
+    """
+    Tracer class that traces a sample of the requests of a server. The spans are the stages
+    recorded with Metrics.stage (read, parse, cache, index, upstream...), and the id of a
+    traced request is sent to the linked servers in the X-Request-Id header, so they trace
+    it too and the spans of each hop can be joined. Each finished trace is appended as a JSON
+    line to the trace file, and the last ones are kept in memory.
+
+    When it is off, starting a trace is a single check of active, so it can stay in the
+    request path. A request that comes with a request id is always traced while it is on,
+    since it was sampled by the server that sent it.
+
+    Attributes:
+        name (str): The name of the server.
+        directory (str): The directory of the trace files, one per process.
+        sample_rate (float): The fraction of the requests traced, 0 when it is off.
+        active (bool): True if it is on.
+        until (float): The time.monotonic when it turns off by itself, 0 for never.
+        traces (deque): The last traces, as dicts.
+    """
+
+    def __init__(self, name, directory=None, sample_rate=0.0):
+        self.name = name
+        self.directory = directory or tempfile.gettempdir()
+        self.sample_rate = 0.0
+        self.active = False
+        self.until = 0.0
+        self.traces = deque(maxlen=KEEP_TRACES)
+        self.lock = threading.Lock()
+        if sample_rate > 0:
+            self.enable(sample_rate)
+
+    @property
+    def path(self):
+        """
+        The file where the traces of this process are appended.
+        """
+        return os.path.join(self.directory, f"trace-{self.name}-{os.getpid()}.jsonl")
+
+    def enable(self, sample_rate=DEFAULT_SAMPLE_RATE, seconds=0.0):
+        """
+        Method to turn the tracing on, or off with a sample rate of 0.
+        :param sample_rate: the fraction of the requests traced.
+        :param seconds: the seconds until it turns off by itself, 0 for never.
+        """
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("The sample rate must be between 0 and 1.")
+        self.sample_rate = sample_rate
+        self.until = time.monotonic() + seconds if seconds > 0 and sample_rate > 0 else 0.0
+        self.active = sample_rate > 0
+        logger.logger.info("%s: Tracing %s.", self.name,
+                           f"{sample_rate:.2%} of the requests to {self.path}" if self.active else "off")
+
+    def toggle(self, sample_rate=DEFAULT_SAMPLE_RATE):
+        """
+        Method to turn the tracing on if it is off, and off if it is on.
+        :param sample_rate: the fraction of the requests traced when it is turned on.
+        """
+        self.enable(0.0 if self.active else sample_rate)
+
+    def start(self, request):
+        """
+        Method to start the trace of a request, if it is sampled or comes with a request id.
+        :param request: the request.
+        :return: The trace, None if the request is not traced.
+        """
+        if not self.active:
+            return None
+        if self.until and time.monotonic() > self.until:
+            self.enable(0.0)
+            return None
+        request_id = request.headers.get(REQUEST_ID_HEADER.lower())
+        if request_id is None and random.random() < self.sample_rate:
+            request_id = uuid.uuid4().hex
+        trace = None
+        if request_id is not None:
+            trace = Trace(request_id[:64], request.method, request.path, request.received_at or time.perf_counter())
+        current_trace.set(trace)
+        return trace
+
+    def span(self, stage, start, end):
+        """
+        Method to add a span to the trace of the current request, if it is traced.
+        :param stage: the name of the stage.
+        :param start: the time.perf_counter when the stage started.
+        :param end: the time.perf_counter when the stage ended.
+        """
+        trace = current_trace.get()
+        if trace is not None:
+            trace.spans.append((stage, start, end))
+
+    def finish(self, route, status):
+        """
+        Method to finish the trace of the current request, if it is traced, and write it.
+        :param route: the kind of request, e.g. the social network of its query.
+        :param status: the status of the response.
+        """
+        trace = current_trace.get()
+        if trace is None:
+            return
+        current_trace.set(None)
+        trace = trace.to_dict(self.name, route, status)
+        self.traces.append(trace)
+        try:
+            with self.lock, open(self.path, "a") as f:
+                f.write(json.dumps(trace) + "\n")
+        except OSError as e:
+            logger.logger.error("%s: Could not write trace to %s: %s", self.name, self.path, e)
+
+    def header(self):
+        """
+        Method to get the header that propagates the id of the current request to a linked server.
+        :return: The header line, empty if the request is not traced.
+        """
+        if not self.active:
+            return ""
+        trace = current_trace.get()
+        return f"{REQUEST_ID_HEADER}: {trace.request_id}\r\n" if trace is not None else ""
+
+    def state(self):
+        """
+        Method to get the state of the tracing and the last traces.
+        :return: dict with the sample rate, the seconds left, the trace file and the last traces.
+        """
+        return {
+            "sample_rate": self.sample_rate,
+            "seconds_left": max(0.0, self.until - time.monotonic()) if self.until else None,
+            "path": self.path,
+            "traces": list(self.traces),
+        }
+
+
+class Profiler:
+    """
+    Profiler class that profiles a running server for some seconds, in a background thread,
+    and writes the result to a file. There are two modes:
+
+    - sample: every SAMPLE_INTERVAL seconds it takes the stack of every thread, so it sees
+      the loops of the dispatcher as well as the requests, and writes how many times each
+      stack was seen in the collapsed stacks format (one "thread;frame;frame count" line per
+      stack), the input of flame graph tools. Its cost does not depend on the requests.
+    - cprofile: it runs cProfile, which sees every thread since Python 3.12, and writes its
+      stats (read them with python -m pstats). Every call is measured, so it slows the server down.
+
+    Attributes:
+        name (str): The name of the server.
+        directory (str): The directory of the profiles.
+        mode (str): The mode of the profile running, None if none is running.
+        last (dict): The mode, seconds and path of the last profile, None if there was none.
+    """
+
+    def __init__(self, name, directory=None):
+        self.name = name
+        self.directory = directory or tempfile.gettempdir()
+        self.mode = None
+        self.last = None
+        self.lock = threading.Lock()
+
+    def start(self, seconds=PROFILE_SECONDS, mode="sample"):
+        """
+        Method to start a profile.
+        :param seconds: the duration of the profile.
+        :param mode: sample or cprofile.
+        :return: The path of the file the profile will be written to.
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"The mode must be one of {', '.join(PROFILE_MODES)}.")
+        if not 0 < seconds <= 600:
+            raise ValueError("The seconds must be between 0 and 600.")
+        with self.lock:
+            if self.mode is not None:
+                raise RuntimeError(f"A {self.mode} profile is already running.")
+            self.mode = mode
+        extension = "folded" if mode == "sample" else "prof"
+        path = os.path.join(self.directory, f"profile-{self.name}-{os.getpid()}-{int(time.time())}.{extension}")
+        target = self.sample if mode == "sample" else self.profile
+        threading.Thread(target=self.run, args=(target, seconds, path), name=f"{self.name}-profiler",
+                         daemon=True).start()
+        logger.logger.info("%s: Profiling (%s) for %ss to %s.", self.name, mode, seconds, path)
+        return path
+
+    def run(self, target, seconds, path):
+        """
+        Method run by the thread of a profile.
+        :param target: the method that profiles and writes the profile.
+        :param seconds: the duration of the profile.
+        :param path: the path of the profile.
+        """
+        try:
+            target(seconds, path)
+            logger.logger.info("%s: Profile written to %s.", self.name, path)
+        except (OSError, ValueError) as e:
+            logger.logger.error("%s: Profile failed: %s", self.name, e)
+        finally:
+            self.last = {"mode": self.mode, "seconds": seconds, "path": path}
+            self.mode = None
+
+    @staticmethod
+    def profile(seconds, path):
+        """
+        Method to run cProfile and write its stats.
+        :param seconds: the duration of the profile.
+        :param path: the path of the stats.
+        """
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            time.sleep(seconds)
+        finally:
+            profile.disable()
+        profile.dump_stats(path)
+
+    @staticmethod
+    def sample(seconds, path):
+        """
+        Method to sample the stacks of the threads and write them as collapsed stacks.
+        :param seconds: the duration of the profile.
+        :param path: the path of the stacks.
+        """
+        stacks = Counter()
+        me = threading.get_ident()
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            names = {thread.ident: thread.name.rstrip("0123456789_-") for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, "thread"))
+                stacks[";".join(reversed(stack))] += 1
+            time.sleep(SAMPLE_INTERVAL)
+        with open(path, "w") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def state(self):
+        """
+        Method to get the state of the profiler.
+        :return: dict with the mode of the profile running and the last profile.
+        """
+        return {"running": self.mode, "last": self.last}
@@ -0,0 +1,298 @@
+"""
+Upstream module that sends the requests of the front server to the linked servers with
+deadlines, retries, circuit breakers and hedged requests, so a slow or failing linked
+server does not block the front server.
+"""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from model.http import HttpError
+from model.logger import logger
+from model.pool import ConnectionPool, RequestNotSentError
+from model.sharding import HashRing
+
+LATENCY_SAMPLES = 1000
+MIN_LATENCY_SAMPLES = 20
+
+
+class CircuitOpenError(ConnectionError):
+    """
+    Exception raised when a request is not sent because the circuit of the server is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    CircuitBreaker class that stops sending requests to a server after failures consecutive
+    failures. While the circuit is open the requests fail right away; after reset_timeout
+    seconds one request is let through (half open), and the circuit closes again if it succeeds.
+
+    Attributes:
+        failures (int): Consecutive failures that open the circuit, 0 to never open it.
+        reset_timeout (float): Seconds the circuit stays open before a request is let through.
+        state (str): "closed", "open" or "half_open".
+        consecutive_failures (int): The failures since the last success.
+        opened_at (float): The time the circuit was opened.
+    """
+
+    def __init__(self, failures=5, reset_timeout=5.0):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """
+        Method to check if a request can be sent. When the circuit is open and reset_timeout
+        passed, only the first caller is allowed, to probe the server.
+        :return: True if the request can be sent.
+        """
+        with self.lock:
+            match self.state:
+                case "closed":
+                    return True
+                case "open" if time.monotonic() - self.opened_at >= self.reset_timeout:
+                    self.state = "half_open"
+                    return True
+                case _:
+                    return False
+
+    def is_open(self):
+        """
+        Method to check if the circuit is open, without letting a probe through.
+        :return: True if the requests to the server fail right away.
+        """
+        return self.state == "open" and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def record_success(self):
+        with self.lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            if self.state == "half_open" or (self.failures and self.consecutive_failures >= self.failures):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+class LatencyWindow:
+    """
+    LatencyWindow class that keeps the latency of the last requests to a server, used to
+    decide when a request is slow enough to be hedged.
+
+    Attributes:
+        samples (deque): The last latencies, in seconds.
+    """
+
+    def __init__(self, size=LATENCY_SAMPLES):
+        self.samples = deque(maxlen=size)
+
+    def add(self, latency):
+        self.samples.append(latency)
+
+    def percentile(self, fraction):
+        """
+        Method to get a percentile of the latencies.
+        :param fraction: the percentile, between 0 and 1 (e.g. 0.95).
+        :return: The latency, None if there are not enough samples yet.
+        """
+        samples = sorted(self.samples)
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+class Upstream:
+    """
+    Upstream class with the connection pool, circuit breaker and latencies of a linked server.
+
+    Attributes:
+        server (tuple): The (name, host, port) of the linked server.
+        pool (ConnectionPool): The connections to the server.
+        breaker (CircuitBreaker): The circuit breaker of the server.
+        latencies (LatencyWindow): The latency of the last successful requests.
+    """
+
+    def __init__(self, server, config):
+        self.server = server
+        self.pool = ConnectionPool(server[1], server[2], config.pool_size, config.pool_timeout, config.pool_idle_timeout)
+        self.breaker = CircuitBreaker(config.upstream_breaker_failures, config.upstream_breaker_reset)
+        self.latencies = LatencyWindow()
+
+    def request(self, request, timeout, idempotent=True):
+        """
+        Method to send a request to the server, recording its outcome in the circuit breaker.
+        Responses with a 5xx status count as failures, but are returned.
+        :param request: the request as bytes.
+        :param timeout: seconds to wait for a connection and for each read of the response.
+        :param idempotent: False if the request must not be applied twice (see ConnectionPool.request).
+        :return: The response.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit of {self.server[0]} at {self.server[1]}:{self.server[2]} is open.")
+        start = time.perf_counter()
+        try:
+            response = self.pool.request(request, timeout, idempotent)
+        except (OSError, HttpError):
+            self.breaker.record_failure()
+            raise
+        if response.status >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+            self.latencies.add(time.perf_counter() - start)
+        return response
+
+
+class UpstreamClient:
+    """
+    UpstreamClient class that sends the requests to the linked servers. Each request has
+    upstream_deadline seconds, including its retries: failed attempts (errors and 5xx
+    responses) are retried up to upstream_retries times after a backoff with full jitter,
+    moving to the next replica of the shard if there is one. When hedging is enabled, an
+    attempt that takes longer than the hedge percentile of the latency of its server is
+    sent again to another replica (or on another connection to the same server), and the
+    first response wins. The requests that are not idempotent, like the mutations, are not
+    hedged, and are only retried if they were not sent, since a failed attempt may have been
+    applied.
+
+    Attributes:
+        config (Config): The settings of the front server.
+        metrics (Metrics): The metrics of the front server.
+        executor (ThreadPoolExecutor): The threads that send the hedged attempts.
+        upstreams (dict): The Upstream of each linked server.
+        replicas (dict): The replicas of the shard of each linked server, itself included.
+    """
+
+    def __init__(self, config, metrics, executor):
+        self.config = config
+        self.metrics = metrics
+        self.executor = executor
+        self.upstreams = {}
+        self.replicas = {}
+
+    def add(self, server, replicas):
+        """
+        Method to add a linked server.
+        :param server: the (name, host, port) of the server.
+        :param replicas: the list of the replicas of its shard, shared by the replicas.
+        """
+        self.upstreams[server] = Upstream(server, self.config)
+        self.replicas[server] = replicas
+
+    def remove(self, server):
+        """
+        Method to remove a linked server, closing its idle connections.
+        :param server: the (name, host, port) of the server.
+        """
+        self.replicas.pop(server, None)
+        upstream = self.upstreams.pop(server, None)
+        if upstream is not None:
+            upstream.pool.close()
+
+    def choose(self, replicas):
+        """
+        Method to choose the replica of a shard that receives a request: the first one whose
+        circuit is not open.
+        :param replicas: the replicas of the shard.
+        :return: The (name, host, port) of the replica.
+        """
+        return next((server for server in replicas if not self.upstreams[server].breaker.is_open()), replicas[0])
+
+    def request(self, server, request, idempotent=True):
+        """
+        Method to send a request to a linked server, with retries and hedging, within the deadline.
+        :param server: the (name, host, port) of the server.
+        :param request: the request as bytes.
+        :param idempotent: False if the request must not be applied twice: it is not hedged, and
+            only retried if it was not sent.
+        :return: The response, which may have a 5xx status if every attempt failed.
+        """
+        deadline = time.monotonic() + self.config.upstream_deadline
+        replicas = self.replicas[server]
+        position = replicas.index(server)
+        attempt = 0
+        while True:
+            upstream = self.upstreams[replicas[(position + attempt) % len(replicas)]]
+            error = response = None
+            try:
+                response = self.attempt(upstream, replicas, request, deadline, idempotent)
+                if response.status < 500:
+                    return response
+            except CircuitOpenError as e:
+                self.metrics.inc("upstream_rejected_total", (("server", upstream.server[0]),))
+                error = e
+            except (OSError, HttpError) as e:
+                error = e
+            attempt += 1
+            backoff = random.uniform(0, self.config.upstream_backoff * 2 ** (attempt - 1))
+            unsent = isinstance(error, (CircuitOpenError, RequestNotSentError))
+            if attempt > self.config.upstream_retries or time.monotonic() + backoff >= deadline \
+                    or not (idempotent or unsent):
+                if error is not None:
+                    raise error
+                return response
+            logger.logger.info("Attempt %s to %s failed (%s), retrying in %.3fs.", attempt, upstream.server[0],
+                               error or response.status, backoff)
+            self.metrics.inc("upstream_retries_total", (("server", upstream.server[0]),))
+            # An open circuit fails fast: move to the next replica without waiting
+            if not isinstance(error, CircuitOpenError):
+                time.sleep(backoff)
+
+    def attempt(self, upstream, replicas, request, deadline, idempotent=True):
+        """
+        Method to send one attempt of a request, hedging it if it is slow.
+        :param upstream: the linked server that receives the attempt.
+        :param replicas: the replicas of its shard, one of the others receives the hedged attempt.
+        :param request: the request as bytes.
+        :param deadline: the time (time.monotonic) the request must be answered by.
+        :param idempotent: False if the request must not be applied twice, so it is not hedged.
+        :return: The response.
+        """
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Deadline of the request to {upstream.server[0]} exceeded.")
+        delay = None
+        if self.config.upstream_hedge and idempotent:
+            delay = upstream.latencies.percentile(self.config.upstream_hedge_percentile)
+        if delay is None or delay >= remaining:
+            return upstream.request(request, remaining, idempotent)
+
+        first = self.executor.submit(upstream.request, request, remaining)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+        others = [server for server in replicas if server != upstream.server and not self.upstreams[server].breaker.is_open()]
+        hedge = self.upstreams[others[0]] if others else upstream
+        self.metrics.inc("upstream_hedged_total", (("server", upstream.server[0]),))
+        second = self.executor.submit(hedge.request, request, deadline - time.monotonic())
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=deadline - time.monotonic(), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                try:
+                    return future.result()
+                except (OSError, HttpError) as e:
+                    error = e
+        raise error or TimeoutError(f"Deadline of the request to {upstream.server[0]} exceeded.")
+
+    def states(self):
+        """
+        Method to get the state of the circuit of each linked server, for the metrics.
+        :return: dict with 0 (closed), 1 (half open) or 2 (open), by labels.
+        """
+        return {
+            (("server", server[0]), ("shard", HashRing.node_name(server[1], server[2]))):
+                ("closed", "half_open", "open").index(upstream.breaker.state)
+            for server, upstream in self.upstreams.items()
+        }
@@ -0,0 +1,153 @@
+"""
+Fixtures of the tests: a small data file and the three servers, started in threads on free
+ports of localhost.
+"""
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from model.config import Config
+from model.http import HttpConnection
+from model.server import HttpServer, InstagramServer, WhatsAppServer
+
+DATA = """José Ignacio,Pérez Muñoz,instagram,@jose
+José Ignacio,Pérez Muñoz,whatsapp,+569111
+Pedro Pablo,Perez Pereira,instagram,@pedro
+María,Sepúlveda Núñez,whatsapp,+569222
+Juana,Perez,instagram,@juana
+Juan,Perez,whatsapp,+569333
+"""
+
+
+def free_port():
+    """
+    Function to get a port of localhost that is not in use.
+    :return: The port.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def request(port, method, path, body=b"", headers=None, conn=None):
+    """
+    Function to send a request to a server and read its response.
+    :param port: the port of the server.
+    :param method: the method of the request.
+    :param path: the path of the request, percent-encoded.
+    :param body: the body of the request.
+    :param headers: the extra headers of the request.
+    :param conn: an open connection to send the request on, None to open a new one.
+    :return: The response.
+    """
+    close = conn is None
+    if conn is None:
+        conn = HttpConnection(socket.create_connection(("127.0.0.1", port), timeout=5))
+    head = "".join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+    conn.sendall(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n{head}Content-Length: {len(body)}\r\n\r\n".encode()
+                 + body)
+    try:
+        return conn.read_response()
+    finally:
+        if close:
+            conn.close()
+
+
+def batch(port, queries):
+    """
+    Function to send a batch request to a server.
+    :param port: the port of the server.
+    :param queries: the queries, as the objects of the lines of the body.
+    :return: The results, in the same order as the queries.
+    """
+    body = "".join(json.dumps(query) + "\n" for query in queries).encode()
+    response = request(port, "POST", "/batch", body)
+    assert response.status == 200
+    return [json.loads(line) for line in response.body.splitlines() if line.strip()]
+
+
+class Servers:
+    """
+    Servers class that starts servers in threads and stops them at the end of a test.
+
+    Attributes:
+        running (list): The servers started and their threads.
+    """
+
+    def __init__(self):
+        self.running = []
+
+    def start(self, server):
+        """
+        Method to start a server in a thread and wait until its port is open.
+        :param server: the server.
+        :return: The server.
+        """
+        thread = threading.Thread(target=server.start, name=f"test-{server.name}", daemon=True)
+        thread.start()
+        self.running.append((server, thread))
+        deadline = time.monotonic() + 5
+        while True:
+            try:
+                socket.create_connection((server.host, server.port), timeout=1).close()
+                return server
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.02)
+
+    def stop(self, only=None):
+        """
+        Method to stop the started servers.
+        :param only: the server to stop, None to stop every server.
+        """
+        for server, thread in list(self.running):
+            if only is not None and server is not only:
+                continue
+            self.running.remove((server, thread))
+            if server.dispatcher is not None:
+                server.dispatcher.stop()
+            # Closing the listener does not wake a blocking accept in another thread
+            try:
+                socket.create_connection((server.host, server.port), timeout=1).close()
+            except OSError:
+                pass
+            thread.join(5)
+            server.index.stop()
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text(DATA, encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def servers():
+    started = Servers()
+    yield started
+    started.stop()
+
+
+@pytest.fixture
+def topology(data_path, servers):
+    """
+    Fixture with a function that starts the front server linked to an Instagram and a WhatsApp
+    server, all with the same settings.
+    """
+    def start(**settings):
+        settings.setdefault("data_reload_interval", 0.1)
+        settings.setdefault("server_keepalive_timeout", 2.0)
+        config = Config(**settings)
+        instagram = servers.start(InstagramServer("127.0.0.1", free_port(), data_path, config))
+        whatsapp = servers.start(WhatsAppServer("127.0.0.1", free_port(), data_path, config))
+        front = HttpServer("127.0.0.1", free_port(), "HttpServer", data_path, config)
+        front.link_server("InstagramServer", "127.0.0.1", instagram.port)
+        front.link_server("WhatsAppServer", "127.0.0.1", whatsapp.port)
+        servers.start(front)
+        return front, instagram, whatsapp
+    return start
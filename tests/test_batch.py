@@ -0,0 +1,22 @@
+from tests.conftest import batch
+
+JOSE = {"names": ["José", "Ignacio"], "last_names": ["Pérez", "Muñoz"]}
+
+
+def test_batch_all_merges_linked_networks(topology):
+    front, _, _ = topology()
+    results = batch(front.port, [{"network": "all", **JOSE}, {"network": "instagram", **JOSE},
+                                 {"network": "all", "names": ["Nadie"], "last_names": ["Nunca"]}])
+    assert results[0]["status"] == 200
+    assert results[0]["handles"] == {"instagram": "@jose", "whatsapp": "+569111"}
+    assert results[1]["handle"] == "@jose"
+    assert results[2]["status"] == 404
+
+
+def test_batch_all_marks_failed_networks(topology, servers):
+    front, _, whatsapp = topology(upstream_retries=0)
+    servers.stop(whatsapp)
+    results = batch(front.port, [{"network": "all", **JOSE}])
+    assert results[0]["status"] == 200
+    assert results[0]["handles"] == {"instagram": "@jose"}
+    assert results[0]["partial_results"] == ["whatsapp"]
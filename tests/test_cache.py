@@ -0,0 +1,60 @@
+import time
+
+from model.cache import ResponseCache, SharedCache
+
+JOSE = ("instagram", ("jose ignacio", "perez munoz"))
+PEDRO = ("instagram", ("pedro pablo", "perez pereira"))
+ZOE = ("instagram", ("zoe", "xu lin"))
+
+
+def test_evicts_the_least_recently_used_entry():
+    cache = ResponseCache(capacity=2)
+    cache.put(JOSE, "@jose")
+    cache.put(PEDRO, "@pedro")
+    assert cache.get(JOSE) == "@jose"
+    cache.put(ZOE, None, negative=True)
+    assert cache.get(PEDRO, "missing") == "missing"
+    assert cache.get(JOSE) == "@jose"
+    assert cache.get(ZOE, "missing") is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_their_ttl():
+    cache = ResponseCache(capacity=4, ttl=10, negative_ttl=0.1)
+    cache.put(JOSE, "@jose")
+    cache.put(ZOE, None, negative=True)
+    time.sleep(0.2)
+    assert cache.get(JOSE) == "@jose"
+    assert cache.get(ZOE, "missing") == "missing"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"]) == (1, 1, 1)
+
+
+def test_invalidate_drops_an_entry():
+    cache = ResponseCache(capacity=4)
+    cache.put(JOSE, "@jose")
+    cache.invalidate(JOSE)
+    assert cache.get(JOSE) is None
+    assert len(cache) == 0
+
+
+def test_shared_cache_is_seen_by_other_processes(tmp_path):
+    path = str(tmp_path / "cache")
+    shared, other = SharedCache(path, slots=64), SharedCache(path, slots=64)
+    for cache in (shared, other):
+        cache.set_version((1, 100))
+    ResponseCache(capacity=4, shared=shared).put(JOSE, "@jose")
+    assert ResponseCache(capacity=4, shared=other).get(JOSE) == "@jose"
+
+    ResponseCache(capacity=4, shared=shared).invalidate(JOSE)
+    assert other.get(JOSE) is None
+
+
+def test_shared_entries_of_another_version_are_misses(tmp_path):
+    path = str(tmp_path / "cache")
+    shared, other = SharedCache(path, slots=64), SharedCache(path, slots=64)
+    shared.set_version((1, 100))
+    shared.put(JOSE, "@jose")
+    other.set_version((2, 100))
+    assert other.get(JOSE) is None
+    assert shared.get(JOSE) == ("@jose", False, 0)
@@ -0,0 +1,83 @@
+from model.changelog import ChangeLog
+from model.index import DataIndex
+from model.query import normalize_key
+from model.request_handler import RequestHandler
+
+JOSE = normalize_key(["José", "Ignacio"], ["Pérez", "Muñoz"])
+ZOE = normalize_key(["Zoé"], ["Xu", "Lin"])
+
+
+def make_index(data_path, compact_size=0):
+    changes = ChangeLog(f"{data_path}.log")
+    return DataIndex(data_path, RequestHandler.load_data, 0.1, changes, RequestHandler.compact_data, compact_size)
+
+
+def test_read_new_returns_the_changes_appended_since_the_last_read(tmp_path):
+    log = ChangeLog(str(tmp_path / "data.csv.log"))
+    assert log.read_new() == ([], False)
+    log.append(log.make_change("instagram", ["Zoé"], ["Xu", "Lin"], "@zoe"))
+    changes, replaced = log.read_new()
+    assert (changes, replaced) == ([log.make_change("instagram", ["Zoé"], ["Xu", "Lin"], "@zoe")], False)
+    assert log.read_new() == ([], False)
+
+    log.append(log.make_change("instagram", ["Zoé"], ["Xu", "Lin"], None))
+    assert log.read_new()[0][0]["handle"] is None
+
+
+def test_read_new_leaves_incomplete_lines_for_the_next_read(tmp_path):
+    log = ChangeLog(str(tmp_path / "data.csv.log"))
+    line = b'{"network": "instagram", "names": ["Zo\xc3\xa9"], "last_names": ["Xu", "Lin"], "handle": "@zoe"}'
+    with open(log.path, "wb") as f:
+        f.write(line[:20])
+    assert log.read_new() == ([], False)
+    with open(log.path, "ab") as f:
+        f.write(line[20:] + b"\n")
+    assert [change["handle"] for change in log.read_new()[0]] == ["@zoe"]
+
+
+def test_updates_are_applied_by_every_index(data_path):
+    index, other = make_index(data_path), make_index(data_path)
+    assert other.lookup("instagram", ZOE) is None
+    index.update("instagram", ["Zoé"], ["Xu", "Lin"], "@zoe")
+    index.update("instagram", ["José", "Ignacio"], ["Pérez", "Muñoz"], None)
+    assert index.lookup("instagram", ZOE) == "@zoe"
+    assert index.entry_version(ZOE) != other.entry_version(ZOE)
+
+    other.poll()
+    assert other.lookup("instagram", ZOE) == "@zoe"
+    assert other.lookup("instagram", JOSE) is None
+    assert other.lookup("whatsapp", JOSE) == "+569111"
+    assert index.entry_version(ZOE) == other.entry_version(ZOE)
+
+    # A process started later reads the changes of the log when it loads the data file
+    assert make_index(data_path).lookup("instagram", ZOE) == "@zoe"
+
+
+def test_compaction_merges_the_log_into_the_data_file(data_path):
+    index, other = make_index(data_path, compact_size=1), make_index(data_path)
+    other.get_data()
+    index.update("instagram", ["Zoé"], ["Xu", "Lin"], "@zoe")
+    index.update("instagram", ["Zoé"], ["Xu", "Lin"], "@zoe.xu")
+    index.update("instagram", ["José", "Ignacio"], ["Pérez", "Muñoz"], None)
+    other.poll()
+    index.compact()
+
+    assert index.changes.size() == 0
+    data = RequestHandler.load_data(data_path)
+    assert data["instagram"][ZOE] == "@zoe.xu"
+    assert JOSE not in data["instagram"]
+    assert data["whatsapp"][JOSE] == "+569111"
+
+    # The other process notices the log was replaced and reloads the data file
+    other.poll()
+    assert other.version == other.stat()
+    assert other.lookup("instagram", ZOE) == "@zoe.xu"
+    assert other.lookup("instagram", JOSE) is None
+
+
+def test_compaction_waits_for_the_log_to_grow(data_path):
+    index = make_index(data_path, compact_size=10 ** 6)
+    index.update("instagram", ["Zoé"], ["Xu", "Lin"], "@zoe")
+    index.compact()
+    assert index.changes.size() > 0
+    assert ZOE not in RequestHandler.load_data(data_path)["instagram"]
@@ -0,0 +1,51 @@
+from tests.conftest import request
+
+PEDRO = "/Pedro/Pablo/Perez/Pereira"
+
+
+def test_linked_network_keeps_its_etag_on_cache_hits(topology):
+    front, _, _ = topology()
+    first = request(front.port, "GET", "/instagram" + PEDRO)
+    etag = first.headers["etag"]
+    hit = request(front.port, "GET", "/instagram" + PEDRO)
+    assert (hit.status, hit.body, hit.headers.get("etag")) == (200, b"@pedro", etag)
+    assert request(front.port, "GET", "/instagram" + PEDRO, headers={"If-None-Match": etag}).status == 304
+    assert request(front.port, "GET", "/instagram" + PEDRO, headers={"If-None-Match": '"other"'}).status == 200
+
+
+def test_all_keeps_its_etag_on_cache_hits(topology):
+    front, _, _ = topology()
+    path = "/all/Jos%C3%A9/Ignacio/P%C3%A9rez/Mu%C3%B1oz"
+    etag = request(front.port, "GET", path).headers["etag"]
+    assert request(front.port, "GET", path).headers.get("etag") == etag
+    response = request(front.port, "GET", path, headers={"If-None-Match": etag})
+    assert (response.status, response.headers["etag"]) == (304, etag)
+
+
+def test_etag_changes_with_the_person(topology):
+    front, instagram, _ = topology(data_mutations=True)
+    etag = request(front.port, "GET", "/instagram" + PEDRO).headers["etag"]
+    assert request(front.port, "PUT", "/instagram" + PEDRO, b"@pedro2").status == 200
+    response = request(front.port, "GET", "/instagram" + PEDRO, headers={"If-None-Match": etag})
+    assert (response.status, response.body) == (200, b"@pedro2")
+    assert response.headers["etag"] != etag
+    response = request(instagram.port, "GET", "/instagram" + PEDRO, headers={"If-None-Match": etag})
+    assert response.status == 200
+
+
+def test_not_found_has_no_etag(topology):
+    front, _, _ = topology()
+    response = request(front.port, "GET", "/instagram/Nadie/Nunca")
+    assert response.status == 404
+    assert "etag" not in response.headers
+    assert response.headers["cache-control"] == "no-cache"
+
+
+def test_any_etag_only_matches_existing_people(topology):
+    front, instagram, _ = topology()
+    star = {"If-None-Match": "*"}
+    for port in (front.port, instagram.port):
+        assert request(port, "GET", "/instagram" + PEDRO, headers=star).status == 304
+        assert request(port, "GET", "/instagram/Nadie/Nunca", headers=star).status == 404
+    assert request(front.port, "GET", "/all" + PEDRO, headers=star).status == 304
+    assert request(front.port, "GET", "/all/Nadie/Nunca", headers=star).status == 404
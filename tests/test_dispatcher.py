@@ -0,0 +1,74 @@
+import socket
+import time
+
+from model.config import Config
+from model.http import HttpConnection
+from model.server import InstagramServer
+from tests.conftest import free_port, request
+
+
+def test_selectors_closes_idle_keepalive_connections(data_path, servers):
+    config = Config(server_mode="selectors", server_max_connections=4, server_keepalive_timeout=0.5)
+    server = servers.start(InstagramServer("127.0.0.1", free_port(), data_path, config))
+    # The connection of servers.start may still be counted for a moment
+    time.sleep(0.1)
+    idle = []
+    for _ in range(4):
+        conn = HttpConnection(socket.create_connection(("127.0.0.1", server.port), timeout=5))
+        assert request(server.port, "GET", "/instagram/Pedro/Pablo/Perez/Pereira", conn=conn).status == 200
+        idle.append(conn)
+
+    time.sleep(1.0)
+    for conn in idle:
+        # Closed by the server: the read ends without data
+        assert conn.sock.recv(1) == b""
+        conn.close()
+    response = request(server.port, "GET", "/instagram/Pedro/Pablo/Perez/Pereira")
+    assert response.status == 200
+    assert response.body == b"@pedro"
+    assert server.dispatcher.open_connections <= 1
+
+
+def test_selectors_stop_closes_idle_connections(data_path, servers):
+    config = Config(server_mode="selectors")
+    server = servers.start(InstagramServer("127.0.0.1", free_port(), data_path, config))
+    conn = HttpConnection(socket.create_connection(("127.0.0.1", server.port), timeout=5))
+    assert request(server.port, "GET", "/instagram/Pedro/Pablo/Perez/Pereira", conn=conn).status == 200
+    servers.stop(server)
+    assert conn.sock.recv(1) == b""
+    conn.close()
+    assert server.dispatcher.open_connections == 0
+
+
+def test_threads_idle_connections_do_not_hold_the_workers(data_path, servers):
+    config = Config(server_workers=1, server_keepalive_timeout=0.5)
+    server = servers.start(InstagramServer("127.0.0.1", free_port(), data_path, config))
+    idle = HttpConnection(socket.create_connection(("127.0.0.1", server.port), timeout=5))
+    assert request(server.port, "GET", "/instagram/Pedro/Pablo/Perez/Pereira", conn=idle).status == 200
+
+    # The only worker is free while the connection waits for its next request
+    assert request(server.port, "GET", "/instagram/Pedro/Pablo/Perez/Pereira").status == 200
+    assert request(server.port, "GET", "/instagram/Pedro/Pablo/Perez/Pereira", conn=idle).status == 200
+
+    time.sleep(1.0)
+    assert idle.sock.recv(1) == b""
+    idle.close()
+    assert server.dispatcher.open_connections == 0
+
+
+def test_threads_answers_503_when_every_worker_is_busy(data_path, servers):
+    config = Config(server_workers=1, server_queue_size=1, server_queue_timeout=0.1)
+    server = servers.start(InstagramServer("127.0.0.1", free_port(), data_path, config))
+    time.sleep(0.1)
+    # The worker waits for the rest of the head of the first one, the second one is queued
+    busy = [socket.create_connection(("127.0.0.1", server.port), timeout=5) for _ in range(2)]
+    busy[0].sendall(b"GET /instagram/Pedro/Pablo/Perez/Pereira HTTP/1.1\r\n")
+    time.sleep(0.1)
+
+    response = request(server.port, "GET", "/instagram/Pedro/Pablo/Perez/Pereira")
+    assert response.status == 503
+
+    busy[0].sendall(b"Connection: close\r\n\r\n")
+    assert HttpConnection(busy[0]).read_response().status == 200
+    for sock in busy:
+        sock.close()
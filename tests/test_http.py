@@ -0,0 +1,111 @@
+import socket
+
+import pytest
+
+from model.config import Config
+from model.http import HttpConnection, HttpError, build_response, etag_matches
+from model.server import InstagramServer
+from tests.conftest import free_port
+
+
+def connection(data, **limits):
+    """
+    Function to get a connection that reads the given bytes, sent by the other end of a socket pair.
+    """
+    client, server = socket.socketpair()
+    client.sendall(data)
+    client.shutdown(socket.SHUT_WR)
+    return HttpConnection(server, **limits)
+
+
+def test_request_head_and_body():
+    conn = connection(b"PUT /instagram/Ana/Diaz HTTP/1.1\r\nHost: x\r\nContent-Length: 4\r\nX-Name: A\r\n\r\n@ana")
+    request = conn.read_request()
+    assert (request.method, request.path, request.version) == ("PUT", "/instagram/Ana/Diaz", "HTTP/1.1")
+    assert request.headers["x-name"] == "A"
+    assert request.body == b"@ana"
+    assert request.keep_alive
+    assert conn.read_request() is None
+
+
+def test_chunked_body():
+    conn = connection(b"POST /batch HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n3\r\nabc\r\n2\r\nde\r\n0\r\n\r\n")
+    assert conn.read_request().body == b"abcde"
+
+
+def test_pipelined_requests():
+    conn = connection(b"GET /a HTTP/1.1\r\n\r\nPOST /b HTTP/1.1\r\nContent-Length: 2\r\n\r\nhiGET /c HTTP/1.0\r\n\r\n")
+    first = conn.read_request()
+    assert first.path == "/a"
+    assert conn.pending()
+    second = conn.read_request()
+    assert (second.path, second.body) == ("/b", b"hi")
+    third = conn.read_request()
+    assert third.path == "/c"
+    assert not third.keep_alive
+
+
+def test_unread_body_is_skipped_by_drain():
+    conn = connection(b"POST /a HTTP/1.1\r\nContent-Length: 5\r\n\r\nhelloGET /b HTTP/1.1\r\n\r\n")
+    conn.read_request().drain()
+    assert conn.read_request().path == "/b"
+
+
+@pytest.mark.parametrize("data, limits, status", [
+    (b"NONSENSE\r\n\r\n", {}, 400),
+    (b"GET / HTTP/1.1\r\nX: " + b"a" * 200 + b"\r\n\r\n", {"max_header_size": 100}, 431),
+    (b"GET / HTTP/1.1\r\n" + b"X: a\r\n" * 5 + b"\r\n", {"max_headers": 3}, 431),
+    (b"GET / HTTP/1.1\r\nContent-Length: nope\r\n\r\n", {}, 400),
+])
+def test_invalid_heads(data, limits, status):
+    conn = connection(data, **limits)
+    with pytest.raises(HttpError) as error:
+        conn.read_request().body
+    assert error.value.status == status
+
+
+@pytest.mark.parametrize("data, status", [
+    (b"PUT / HTTP/1.1\r\nContent-Length: 20\r\n\r\n" + b"a" * 20, 413),
+    (b"PUT / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\nzz\r\nabc\r\n0\r\n\r\n", 400),
+    (b"PUT / HTTP/1.1\r\nContent-Length: 20\r\n\r\nshort", 400),
+])
+def test_invalid_bodies(data, status):
+    request = connection(data, max_body_size=10).read_request()
+    with pytest.raises(HttpError) as error:
+        request.body
+    assert error.value.status == status
+
+
+def test_response_round_trip():
+    conn = connection(build_response(200, "@ana", {"ETag": '"x"'}) + build_response(304, headers={"ETag": '"x"'}))
+    response = conn.read_response()
+    assert (response.status, response.body, response.headers["etag"]) == (200, b"@ana", '"x"')
+    assert conn.read_response().status == 304
+
+
+def test_etag_matches():
+    assert etag_matches('"a", W/"b"', '"b"')
+    assert not etag_matches('"a"', '"b"')
+    assert etag_matches("*", '"b"')
+
+
+def test_server_answers_pipelined_requests_in_order(data_path, servers):
+    server = servers.start(InstagramServer("127.0.0.1", free_port(), data_path, Config()))
+    conn = HttpConnection(socket.create_connection(("127.0.0.1", server.port), timeout=5))
+    conn.sendall(b"GET /instagram/Pedro/Pablo/Perez/Pereira HTTP/1.1\r\n\r\n"
+                 b"GET /instagram/Nadie/Nunca HTTP/1.1\r\n\r\n"
+                 b"GET /instagram/Jos%C3%A9/Ignacio/P%C3%A9rez/Mu%C3%B1oz HTTP/1.1\r\nConnection: close\r\n\r\n")
+    assert [(r.status, r.body) for r in (conn.read_response() for _ in range(3))] == [
+        (200, b"@pedro"), (404, b""), (200, b"@jose")]
+    assert conn.sock.recv(1) == b""
+    conn.close()
+
+
+def test_server_closes_the_connection_after_a_malformed_request(data_path, servers):
+    server = servers.start(InstagramServer("127.0.0.1", free_port(), data_path, Config()))
+    conn = HttpConnection(socket.create_connection(("127.0.0.1", server.port), timeout=5))
+    conn.sendall(b"NONSENSE\r\n\r\nGET /instagram/Pedro/Pablo/Perez/Pereira HTTP/1.1\r\n\r\n")
+    response = conn.read_response()
+    assert (response.status, response.headers["connection"]) == (400, "close")
+    assert conn.sock.recv(1) == b""
+    conn.close()
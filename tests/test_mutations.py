@@ -0,0 +1,56 @@
+import time
+
+from model.config import Config
+from model.server import InstagramServer
+from tests.conftest import free_port, request
+
+ZOE = "/Zo%C3%A9/Xu/Lin"
+
+
+def wait_for(check, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def test_mutations_are_disabled_by_default(topology):
+    front, _, _ = topology()
+    assert request(front.port, "PUT", "/instagram" + ZOE, b"@zoe").status == 405
+    assert request(front.port, "GET", "/instagram" + ZOE).status == 404
+
+
+def test_put_and_delete_invalidate_cached_results(topology):
+    front, instagram, _ = topology(data_mutations=True)
+    assert request(front.port, "GET", "/instagram" + ZOE).status == 404
+    assert request(front.port, "GET", "/all" + ZOE).status == 404
+
+    assert request(front.port, "PUT", "/instagram" + ZOE, b"@zoe").status == 201
+    assert request(front.port, "PUT", "/instagram" + ZOE, b"@zoe.xu").status == 200
+    response = request(front.port, "GET", "/instagram" + ZOE)
+    assert (response.status, response.body) == (200, b"@zoe.xu")
+    assert request(front.port, "GET", "/all" + ZOE).body == b"instagram,@zoe.xu\r\n"
+    assert request(instagram.port, "GET", "/instagram" + ZOE).body == b"@zoe.xu"
+
+    assert request(front.port, "DELETE", "/instagram" + ZOE).status == 200
+    assert request(front.port, "DELETE", "/instagram" + ZOE).status == 404
+    assert request(front.port, "GET", "/instagram" + ZOE).status == 404
+    assert request(instagram.port, "GET", "/instagram" + ZOE).status == 404
+
+
+def test_put_is_applied_by_the_other_processes(topology, data_path, servers):
+    front, _, _ = topology(data_mutations=True)
+    config = Config(data_mutations=True, data_reload_interval=0.1)
+    other = servers.start(InstagramServer("127.0.0.1", free_port(), data_path, config))
+    assert request(other.port, "GET", "/instagram" + ZOE).status == 404
+
+    assert request(front.port, "PUT", "/instagram" + ZOE, b"@zoe").status == 201
+    wait_for(lambda: request(other.port, "GET", "/instagram" + ZOE).status == 200)
+    assert request(other.port, "GET", "/instagram" + ZOE).body == b"@zoe"
+
+
+def test_mutations_of_unknown_social_networks_are_rejected(topology):
+    front, instagram, _ = topology(data_mutations=True)
+    assert request(front.port, "PUT", "/foo" + ZOE, b"@zoe").status == 404
+    assert request(instagram.port, "PUT", "/foo" + ZOE, b"@zoe").status == 400
+    assert request(front.port, "GET", "/all/Jos%C3%A9/Ignacio/P%C3%A9rez/Mu%C3%B1oz").status == 200
@@ -0,0 +1,28 @@
+from urllib.parse import urlsplit
+
+from model.config import Config
+from model.server import HttpServer
+from tests.conftest import free_port, request
+
+JOSE = "/Jos%C3%A9/Ignacio/P%C3%A9rez/Mu%C3%B1oz"
+
+
+def test_front_without_linked_servers_answers_with_its_data(data_path, servers):
+    front = servers.start(HttpServer("127.0.0.1", free_port(), "HttpServer", data_path, Config()))
+    for path, body in (("/instagram" + JOSE, b"@jose"), ("/whatsapp" + JOSE, b"+569111"),
+                       ("/all" + JOSE, b"instagram,@jose\r\nwhatsapp,+569111\r\n")):
+        response = request(front.port, "GET", path)
+        assert (response.status, response.body) == (200, body)
+    assert request(front.port, "GET", "/whatsapp/Nadie/Nunca").status == 404
+
+
+def test_whatsapp_queries_are_redirected_to_its_server(topology):
+    front, _, whatsapp = topology()
+    response = request(front.port, "GET", "/whatsapp/Mar%C3%ADa/Sep%C3%BAlveda/N%C3%BA%C3%B1ez?x=1")
+    assert response.status == 302
+    location = urlsplit(response.headers["location"])
+    assert location.port == whatsapp.port
+    assert location.path == "/whatsapp/Mar%C3%ADa/Sep%C3%BAlveda/N%C3%BA%C3%B1ez"
+    assert location.query == ""
+    response = request(whatsapp.port, "GET", location.path)
+    assert (response.status, response.body) == (200, b"+569222")
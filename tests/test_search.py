@@ -0,0 +1,75 @@
+import threading
+
+from model.search import SearchIndex, edit_distance
+
+DATA = {
+    "instagram": {("juana", "perez"): "@juana", ("jose ignacio", "perez munoz"): "@jose",
+                  ("pedro pablo", "perez pereira"): "@pedro"},
+    "whatsapp": {("juan", "perez"): "+569333", ("jose ignacio", "perez munoz"): "+569111",
+                 ("maria", "sepulveda nunez"): "+569222"},
+}
+
+
+def search(text, limit=10, social_network=None, data=DATA):
+    results, _ = SearchIndex.build(data).search(data, text, limit, social_network)
+    return [(score, key) for score, key, _ in results]
+
+
+def test_edit_distance():
+    assert edit_distance("perez", "peres", 2) == 1
+    assert edit_distance("perez", "pereira", 1) == 2
+    assert edit_distance("ana", "anastasia", 2) == 3
+
+
+def test_exact_matches_rank_before_prefixes_and_typos():
+    assert search("juan perez") == [(0, ("juan", "perez")), (1, ("juana", "perez"))]
+    assert search("jose perez")[0] == (0, ("jose ignacio", "perez munoz"))
+    assert search("sepulbeda") == [(2, ("maria", "sepulveda nunez"))]
+    assert search("xyz") == []
+
+
+def test_results_have_the_handles_of_each_social_network():
+    results, truncated = SearchIndex.build(DATA).search(DATA, "jose", 5)
+    assert results == [(0, ("jose ignacio", "perez munoz"), {"instagram": "@jose", "whatsapp": "+569111"})]
+    assert not truncated
+
+
+def test_limit_only_counts_people_of_the_social_network():
+    assert search("juan", 1, "instagram") == [(1, ("juana", "perez"))]
+    assert search("juan", 1, "whatsapp") == [(0, ("juan", "perez"))]
+
+
+def test_deleted_people_are_skipped():
+    data = {network: dict(table) for network, table in DATA.items()}
+    index = SearchIndex.build(data)
+    del data["whatsapp"][("juan", "perez")]
+    results, _ = index.search(data, "juan", 1)
+    assert [key for _, key, _ in results] == [("juana", "perez")]
+
+
+def test_searches_run_while_people_are_added():
+    data = {"instagram": {("juana", "perez"): "@juana"}}
+    index = SearchIndex.build(data)
+    errors = []
+
+    def add():
+        for i in range(500):
+            key = (f"juan{i}", f"perez{i % 7}")
+            data["instagram"][key] = f"@{i}"
+            index.add(key)
+
+    def run():
+        try:
+            for _ in range(20):
+                index.search(data, "juan perez", 5)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=add)] + [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    results, _ = index.search(data, "juan499", 1)
+    assert results[0][1] == ("juan499", "perez2")
@@ -0,0 +1,57 @@
+import pytest
+
+from model.request_handler import RequestHandler
+from model.sharding import HashRing
+from model.store import CompactStore
+
+SHARDS = ["127.0.0.1:8081", "127.0.0.1:8083", "127.0.0.1:8085"]
+
+
+def ring():
+    shards = HashRing()
+    for shard in SHARDS:
+        shards.add(shard)
+    return shards
+
+
+def people(count):
+    return [(f"nombre{i}", f"apellido{i} perez") for i in range(count)]
+
+
+def test_ring_spreads_people_between_shards():
+    shards = ring()
+    owners = [shards.get(key) for key in people(3000)]
+    for shard in SHARDS:
+        assert 700 < owners.count(shard) < 1300
+
+
+def test_removing_a_shard_only_moves_its_people():
+    keys = people(3000)
+    before = ring()
+    after = ring()
+    after.remove(SHARDS[1])
+    moved = [key for key in keys if before.get(key) != after.get(key)]
+    assert moved
+    assert all(before.get(key) == SHARDS[1] for key in moved)
+
+
+def test_owns_filters_the_people_of_a_shard():
+    shards = ring()
+    owns = shards.owns(SHARDS[0])
+    assert all(owns(key) == (shards.get(key) == SHARDS[0]) for key in people(500))
+
+
+@pytest.mark.parametrize("extension", [".csv", ".idx"])
+def test_shard_loads_only_its_people(tmp_path, extension):
+    rows = [("instagram", key, f"@{key[0]}") for key in people(300)] + [("whatsapp", ("ana", "diaz"), "+56")]
+    path = tmp_path / f"data{extension}"
+    if extension == ".csv":
+        path.write_text("".join(f"{key[0]},{key[1]},{network},{handle}\n" for network, key, handle in rows))
+    else:
+        CompactStore.from_rows(rows).write(str(path))
+    owns = ring().owns(SHARDS[0])
+    data = RequestHandler.load_data(str(path), key_filter=owns, network_filter=lambda network: network == "instagram")
+    assert list(data) == ["instagram"]
+    expected = {key for network, key, _ in rows if network == "instagram" and owns(key)}
+    assert set(data["instagram"]) == expected
+    assert data["instagram"].get(next(iter(expected))) is not None
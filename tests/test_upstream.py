@@ -0,0 +1,66 @@
+import socket
+import threading
+
+from model.config import Config
+from model.server import HttpServer
+from tests.conftest import free_port, request
+
+
+class DroppingServer:
+    """
+    Server that reads each request and closes the connection without answering, as a linked
+    server that fails after applying a change.
+    """
+
+    def __init__(self):
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self.listener.getsockname()[1]
+        self.requests = []
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            with conn:
+                self.requests.append(conn.recv(65536).split(b" ", 1)[0])
+
+    def close(self):
+        self.listener.close()
+
+
+def front_linked_to(port, data_path, servers):
+    config = Config(data_mutations=True, upstream_retries=2, upstream_backoff=0.001, upstream_hedge=True)
+    front = HttpServer("127.0.0.1", free_port(), "HttpServer", data_path, config)
+    front.link_server("InstagramServer", "127.0.0.1", port)
+    return servers.start(front)
+
+
+def test_mutations_are_not_retried(data_path, servers):
+    backend = DroppingServer()
+    try:
+        front = front_linked_to(backend.port, data_path, servers)
+        assert request(front.port, "PUT", "/instagram/Zoe/Xu", b"@zoe").status == 503
+        assert request(front.port, "DELETE", "/instagram/Zoe/Xu").status == 503
+        assert backend.requests == [b"PUT", b"DELETE"]
+    finally:
+        backend.close()
+
+
+def test_queries_are_retried(data_path, servers):
+    backend = DroppingServer()
+    try:
+        front = front_linked_to(backend.port, data_path, servers)
+        assert request(front.port, "GET", "/instagram/Zoe/Xu").status == 503
+        assert backend.requests == [b"GET"] * 3
+    finally:
+        backend.close()
+
+
+def test_mutations_are_retried_when_not_sent(data_path, servers):
+    # Nothing listens on the port of the linked server, so the change is never sent
+    front = front_linked_to(free_port(), data_path, servers)
+    assert request(front.port, "PUT", "/instagram/Zoe/Xu", b"@zoe").status == 503
+    assert front.metrics.counters[("upstream_retries_total", (("server", "InstagramServer"),))] == 2